@@ -8,136 +8,480 @@ Date: 02/05/2017
 Description: Script containing functions useful for parsing PDB files (i.e. 3D structures of proteins).
 """
 
-def PDBparser(pdbFile, list_dom):
-    """
-    Parse un fichier pdb au format ATOM en un dictionnaire utilisable par Python.
-    :param pdbFile: Fichier pdb (format ATOM) contenant les coordonnees des atomes d'une proteine.
-    :param list_dom: Liste des domaines a traiter.
-    :return: Un dictionnaire utilisable par Python.
-    """
-
-    with open(pdbFile) as f:
-        molecule = {}  # dictionnaire le plus externe
-        chainList = []
+from collections.abc import Mapping
 
-        cptAlt = False
+import numpy as np
 
-        for line in f:
-            if line[:4:] == 'ATOM':  # si la ligne commence par 'ATOM'
-                if cptAlt == False:
-                    alt = line[16]
-                    cptAlt = True
+from Structure import Structure
+from indexPDB import loadIndex
+from readerPDB import compression, countModels, followBlocks, openInput, streamBlocks
+from selectionPDB import DEFAULT_SELECTION, IONS
+from trajectory import Trajectory
+from trajectoryCache import loadCache, writeCache
 
-                if line[16] == alt:
-                    chaine = line[72:76].strip()
 
-                    if chaine in list_dom:
+def PDBparser(pdbFile, list_dom, dtype=np.float64, massWeighted=False, selection=None):
+    """
+    Parse un fichier pdb au format ATOM en une Structure utilisable par Python.
+    :param pdbFile: Fichier pdb (format ATOM) contenant les coordonnees des atomes d'une proteine.
+    :param list_dom: Liste des domaines a traiter.
+    :param dtype: Type des coordonnees (np.float64 par defaut, np.float32 pour economiser la memoire).
+    :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+    :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+    :return: Une Structure (utilisable comme le dictionnaire molecule[chain][res][atom]).
+    """
+    cache = loadCache(pdbFile, list_dom, selection)   # cache binaire a jour (voir PDBconvert): pas de parsing du texte
+    if cache is not None and len(cache) == 1:
+        return next(cache.frames([0], dtype, massWeighted))[1]
 
-                        if chaine not in chainList:
-                            chainList.append(chaine)
-                            molecule[chaine] = {}
-                            resList = []
+    with openInput(pdbFile) as f:   # fichier eventuellement compresse (gzip, bzip2, xz)
+        molecule = PDBparserConf(f, list_dom, dtype, massWeighted, selection)
 
-                        curres = line[22:26].strip()
+    return molecule
 
-                        if curres not in resList:
-                            resList.append(curres)
-                            molecule[chaine][curres] = {}
-                            atomList = []
-                            molecule[chaine][curres]['resname'] = line[17:20].strip()
 
-                        atom = line[12:16].strip()
-                        if atom not in atomList:
-                            atomList.append(atom)
-                            molecule[chaine][curres][atom] = {}
+def _occupancy(line):
+    """
+    :return: L'occupation d'un enregistrement ATOM (colonnes 55-60), 1.0 si elle est absente.
+    """
+    try:
+        return float(line[54:60])
+    except ValueError:
+        return 1.0
 
-                        molecule[chaine]['reslist'] = resList
-                        molecule[chaine][curres]['atomlist'] = atomList
 
-                        molecule[chaine][curres][atom]['x'] = float(line[30:38])
-                        molecule[chaine][curres][atom]['y'] = float(line[38:46])
-                        molecule[chaine][curres][atom]['z'] = float(line[46:54])
-                        molecule[chaine][curres][atom]['id'] = line[6:11].strip()
+def PDBparserConf(list, list_dom, dtype=np.float64, massWeighted=False, selection=None):
+    """
+    Parse une liste contenant les donnees du fichier pdb correspondant a une conformation d'une proteine.
+    Un atome lu plusieurs fois (meme domaine, residu et nom) garde les coordonnees de sa derniere ligne, sauf s'il
+    s'agit d'une autre position alternative: elle est alors ignoree ou gardee selon selection.altloc.
+    :param list: Liste (ou iterable) contenant les lignes du fichier pdb pour une conformation de proteine.
+    :param list_dom: Liste des domaines a traiter.
+    :param dtype: Type des coordonnees.
+    :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+    :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+    :return: Une Structure (utilisable comme le dictionnaire molecule[chain][res][atom]).
+    """
+    return _parseLines(list, list_dom, dtype, massWeighted, selection)[0]
 
-    return molecule
 
+def _parseLines(list, list_dom, dtype, massWeighted, selection):
+    """
+    Corps de PDBparserConf.
+    :return: La Structure, le rang (dans list) de la ligne donnant les coordonnees de chaque atome, et False si le
+    choix d'une position alternative a dependu de l'occupation (il peut alors changer d'une conformation a l'autre).
+    """
+    selection = selection or DEFAULT_SELECTION
+    policy = selection.altloc
+    field = selection.field
+    readHetero = selection.hetero is not None
+    keepAll = policy == "all"
+
+    list_dom = set(list_dom)
+    chainIndex = {}   # domaine -> rang d'apparition
+    resIndex = {}     # (domaine, residu) -> rang d'apparition
+    atomIndex = {}    # (domaine, residu, atome[, position alternative]) -> indice de l'atome dans les listes ci-dessous
+
+    coords = []
+    chains = []
+    residues = []
+    names = []
+    resnames = []
+    serials = []
+    elements = []
+    altlocs = []      # position alternative de chaque atome ('' si aucune)
+    occupancies = []  # occupation de chaque atome (politique 'occupancy' seulement)
+    hetero = []       # True pour les atomes HETATM
+    sources = []      # rang de la ligne donnant les coordonnees de chaque atome
+    stable = True
+    keys = []         # (rang du domaine, rang du residu) de chaque atome, pour regrouper les atomes
+
+    for rank, line in enumerate(list):
+        if line[:4] == 'ATOM':  # si la ligne commence par 'ATOM'
+            isHetero = False
+        elif readHetero and line[:6] == 'HETATM':
+            if not selection.keepHetero(line[17:20].strip()):
+                continue
+            isHetero = True
+        else:
+            continue
+
+        if field == "segid":
+            chaine = line[72:76].strip()
+        elif field == "chain":
+            chaine = line[21:22].strip()
+        else:
+            chaine = line[72:76].strip() or line[21:22].strip()
+        if chaine not in list_dom:
+            continue
+
+        curres = line[22:26].strip()
+        atom = line[12:16].strip()
+        alt = line[16].strip()
+        xyz = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+
+        key = (chaine, curres, atom, alt) if keepAll else (chaine, curres, atom)
+        if key in atomIndex:  # atome deja vu dans ce residu
+            i = atomIndex[key]
+            if alt and altlocs[i] and alt != altlocs[i]:   # autre position alternative du meme atome
+                if policy == "occupancy":
+                    stable = False
+                    occupancy = _occupancy(line)
+                    if occupancy <= occupancies[i]:
+                        continue
+                    occupancies[i] = occupancy
+                elif alt != policy:   # 'first', ou une autre position que celle demandee (la premiere lue est gardee)
+                    continue
+            elif policy == "occupancy":
+                occupancies[i] = _occupancy(line)
+            coords[i] = xyz   # on remplace ses coordonnees
+            serials[i] = line[6:11].strip()
+            altlocs[i] = alt
+            sources[i] = rank
+            continue
+
+        if chaine not in chainIndex:
+            chainIndex[chaine] = len(chainIndex)
+        if (chaine, curres) not in resIndex:
+            resIndex[(chaine, curres)] = len(resIndex)
+
+        resname = line[17:20].strip()
+        atomIndex[key] = len(coords)
+        coords.append(xyz)
+        chains.append(chaine)
+        residues.append(curres)
+        names.append(atom)
+        resnames.append(resname)
+        serials.append(line[6:11].strip())
+        element = line[76:78].strip()
+        if not element:
+            element = IONS[resname] if isHetero and resname in IONS else atom.lstrip('0123456789')[:1]
+        elements.append(element)
+        altlocs.append(alt)
+        if policy == "occupancy":
+            occupancies.append(_occupancy(line))
+        hetero.append(isHetero)
+        sources.append(rank)
+        keys.append((chainIndex[chaine], resIndex[(chaine, curres)]))
+
+    # les positions alternatives ne sont gardees dans la topologie que si elles sont toutes lues: avec les autres
+    # politiques, la position choisie peut changer d'une conformation a l'autre sans changer la topologie
+    structure, order = _buildStructure(coords, chains, residues, names, resnames, serials, elements, keys, dtype,
+                                       massWeighted, altlocs if keepAll else None, hetero if readHetero else None)
+    sources = np.array(sources, dtype=np.intp)
+    return structure, sources if order is None else sources[order], stable
+
+
+def _buildStructure(coords, chains, residues, names, resnames, serials, elements, keys, dtype, massWeighted,
+                    altlocs=None, hetero=None):
+    """
+    Construit une Structure en regroupant les atomes par domaine puis par residu
+    (dans l'ordre de premiere apparition), comme le faisaient les dictionnaires.
+    :return: La Structure et l'ordre des atomes (indices dans les listes), ou None s'ils sont deja regroupes.
+    """
+    order = None
+    coords = np.array(coords, dtype=dtype).reshape(-1, 3)
+    keys = np.array(keys, dtype=np.intp).reshape(-1, 2)
+    if len(keys) > 1 and np.any(np.diff(keys[:, 0] * len(keys) + keys[:, 1]) < 0):
+        order = np.lexsort((keys[:, 1], keys[:, 0]))   # tri stable: domaine puis residu
+        coords = coords[order]
+        chains, residues, names, resnames, serials, elements = [np.asarray(a)[order] for a in (chains, residues, names, resnames, serials, elements)]
+        altlocs, hetero = [None if a is None else np.asarray(a)[order] for a in (altlocs, hetero)]
+
+    return (Structure(coords, chains, residues, names, resnames, serials, dtype, elements, massWeighted, altlocs, hetero),
+            order)
+
+
+# octets (colonnes 1 a 6) des enregistrements ATOM et HETATM
+_ATOM = np.frombuffer(b"ATOM", dtype=np.uint8)
+_HETATM = np.frombuffer(b"HETATM", dtype=np.uint8)
+# colonnes comparees d'une conformation a l'autre: enregistrement (1-6) de toutes les lignes, et topologie des lignes
+# ATOM/HETATM (colonnes 7-30: numero, atome, position alternative, residu, chaine; 73-78: segment, element)
+_RECORD_COLUMNS = np.arange(0, 6)
+_ATOM_COLUMNS = np.r_[6:30, 72:78]
+_COORD_COLUMNS = np.arange(30, 54)
+_LINE_END = 78   # marge de lecture apres le debut de la derniere ligne
+# caracteres coupant les lignes pour str.splitlines, en plus de \n et \r
+_LINE_BREAKS = np.array([0x0b, 0x0c, 0x1c, 0x1d, 0x1e, 0x85], dtype=np.uint8)
+# poids des chiffres d'une coordonnee %8.3f (colonnes 0-3 et 5-7 du champ), en milliemes
+_DIGIT_WEIGHTS = 10 ** np.arange(6, -1, -1, dtype=np.int64)
+
+
+def _decodeCoords(chars):
+    """
+    Convertit en une seule operation les colonnes 31-54 (x, y, z au format %8.3f) de plusieurs lignes ATOM.
+    Le resultat est identique a celui de float() (entier en milliemes divise par 1000, arrondi correct).
+    :param chars: Tableau (n, 24) des octets de ces colonnes.
+    :return: Le tableau (n, 3) des coordonnees et le masque (n, 3) des champs qui ne sont pas au format %8.3f
+    (leur valeur est a relire avec float()).
+    """
+    c = chars.reshape(-1, 3, 8)
+    digit = (c >= 48) & (c <= 57)
+    space = c == 32
+    minus = c == 45
+    started = np.logical_or.accumulate(~space[..., :4], axis=-1)   # a partir du premier caractere non blanc
+    first = started.copy()
+    first[..., 1:] &= ~started[..., :-1]
+    ok = ((c[..., 4] == 46) & digit[..., 5:].all(axis=-1)
+          & (digit[..., :4] | (space[..., :4] & ~started) | (minus[..., :4] & first)).all(axis=-1))
+
+    values = np.where(digit, c - 48, 0).astype(np.int64)
+    thousandths = np.concatenate((values[..., :4], values[..., 5:]), axis=-1) @ _DIGIT_WEIGHTS
+    magnitude = thousandths / 1000.0
+    return np.where(minus.any(axis=-1), -magnitude, magnitude), ~ok
+
+
+class FrameDecoder(object):
+    """
+    Parse les blocs MODEL successifs d'une dynamique. Le premier bloc est parse ligne par ligne (PDBparserConf);
+    tant que les blocs suivants ont la meme disposition (memes fins de ligne, memes enregistrements et memes colonnes
+    de topologie), sa topologie est reutilisee et seules les coordonnees sont converties, pour tous les atomes a la
+    fois, a partir des octets du bloc. Les lignes mal formees sont relues une par une.
+    """
 
-def PDBparserConf(list, list_dom):
+    def __init__(self, list_dom, dtype=np.float64, massWeighted=False, selection=None):
+        """
+        :param list_dom: Liste des domaines a traiter.
+        :param dtype: Type des coordonnees.
+        :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+        :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+        """
+        self.list_dom = list_dom
+        self.dtype = dtype
+        self.massWeighted = massWeighted
+        self.selection = selection
+        self._topology = None   # Structure du bloc de reference
+        self._layout = None     # disposition du bloc de reference (voir _setLayout)
+
+    def decode(self, block):
+        """
+        :param block: Bloc d'une conformation: octets (voir indexPDB.ModelIndex.rawBlocks) ou liste de lignes.
+        :return: La Structure de la conformation, identique a celle de PDBparserConf.
+        """
+        if not isinstance(block, bytes):
+            block = "".join(block).encode('latin-1')
+        buf = np.frombuffer(block, dtype=np.uint8)
+        ends = np.flatnonzero(buf == 10)
+        if self._layout is not None:
+            conf = self._reuse(block, buf, ends)
+            if conf is not None:
+                return conf
+
+        lines = block.decode('latin-1').splitlines(True)
+        conf, sources, stable = _parseLines(lines, self.list_dom, self.dtype, self.massWeighted, self.selection)
+        self._layout = None
+        if stable:
+            self._setLayout(conf, buf, ends, len(lines), sources)
+        return conf
+
+    def _setLayout(self, conf, buf, ends, nbLines, sources):
+        """
+        Garde la topologie du bloc et les indices (dans le bloc) des colonnes a comparer et des coordonnees de ses atomes.
+        """
+        starts = np.concatenate(([0], ends + 1))
+        if starts[-1] == len(buf):   # bloc termine par une fin de ligne
+            starts = starts[:-1]
+        carriage = np.count_nonzero(buf == 13)
+        if (len(starts) != nbLines or np.isin(buf, _LINE_BREAKS).any()
+                or carriage != np.count_nonzero(buf[ends[ends > 0] - 1] == 13)):   # \r seul: coupure de splitlines
+            return
+        lineEnds = np.append(ends, len(buf))[:len(starts)]
+        padded = np.concatenate((buf, np.zeros(_LINE_END, dtype=np.uint8)))
+        records = starts[:, None] + _RECORD_COLUMNS
+        recordBytes = padded[records]
+        isAtom = (recordBytes[:, :4] == _ATOM).all(axis=1) | (recordBytes == _HETATM).all(axis=1)
+        atomColumns = starts[isAtom][:, None] + _ATOM_COLUMNS
+        self._layout = {'size': len(buf), 'ends': ends.copy(), 'records': records, 'recordBytes': recordBytes,
+                        'atomColumns': atomColumns, 'atomBytes': padded[atomColumns],
+                        'coords': starts[sources][:, None] + _COORD_COLUMNS,
+                        'lines': np.stack((starts[sources], lineEnds[sources]), axis=1),
+                        'short': (lineEnds[sources] - starts[sources] < 54)}
+        self._topology = conf
+
+    def _reuse(self, block, buf, ends):
+        """
+        :return: La conformation avec la topologie du bloc de reference, ou None si la disposition du bloc est differente.
+        """
+        layout = self._layout
+        if len(buf) != layout['size'] or not np.array_equal(ends, layout['ends']):
+            return None
+        padded = np.concatenate((buf, np.zeros(_LINE_END, dtype=np.uint8)))
+        if not (np.array_equal(padded[layout['records']], layout['recordBytes'])
+                and np.array_equal(padded[layout['atomColumns']], layout['atomBytes'])):
+            return None
+
+        coords, bad = _decodeCoords(padded[layout['coords']])
+        bad[layout['short']] = True
+        for i in np.flatnonzero(bad.any(axis=1)).tolist():   # lignes mal formees: conversion de PDBparserConf
+            start, end = layout['lines'][i].tolist()
+            line = block[start:end].decode('latin-1')
+            coords[i] = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+        return self._topology.withCoords(coords.astype(self.dtype, copy=False))
+
+
+def PDBparserMulti(pdbFile, list_dom, dtype=np.float64, start=0, stop=None, step=1, massWeighted=False,
+                   selection=None, reference=None):
     """
-    Parse une liste contenant les donnees du fichier pdb correspondant a une conformation d'une proteine.
-    :param list: Liste contenant les donnees du fichier pdb pour une conformation de proteine.
+    Parse un fichier pdb au format ATOM contenant plusieurs proteines en un dictionnaire. 
+    Les conformations d'une dynamique ayant toutes la meme topologie, elle n'est gardee qu'une fois: seules leurs
+    coordonnees sont stockees, dans un seul tableau (voir trajectory.Trajectory).
+    :param pdbFile: Fichier pbd (format ATOM) contenant plusieurs proteines.
     :param list_dom: Liste des domaines a traiter.
-    :return: Un dictionnaire utilisable par Python.
+    :param dtype: Type des coordonnees.
+    :param start, stop, step: Selection des conformations (comme un slice sur leur rang dans le fichier).
+    :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+    :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+    :param reference: Structure de reference (PDBparser), dont la topologie est reutilisee si elle est identique.
+    :return: Une Trajectory (utilisable comme le dictionnaire {modele: Structure}), ou un dictionnaire
+    {modele: Structure} si les conformations n'ont pas toutes la meme topologie.
     """
-    molecule = {}  # dictionnaire le plus externe
-    chainList = []
-
-    cptAlt = False
+    capacity = countFrames(pdbFile, list_dom, start, stop, step, selection) or 16
+    frames = None  # Trajectory (ou dictionnaire) contenant toutes les conformations
+    for model, conf in PDBiterMulti(pdbFile, list_dom, dtype, start, stop, step, massWeighted=massWeighted,
+                                    selection=selection):
+        if frames is None:
+            frames = Trajectory.start(conf, reference, capacity)
+        elif isinstance(frames, Trajectory) and not frames.accepts(conf):   # topologie differente: dictionnaire
+            frames = dict(frames.frames())
+        if isinstance(frames, Trajectory):
+            frames.append(model, conf)
+        else:
+            frames[model] = conf
+
+    if frames is None:
+        return {}
+    if isinstance(frames, Trajectory):
+        frames.compact()
+    return frames
 
-    for line in list:
-        if line[:4:] == 'ATOM':  # si la ligne commence par 'ATOM'
-            if cptAlt == False:
-                alt = line[16]
-                cptAlt = True
 
-            if line[16] == alt:
-                chaine = line[72:76].strip()
+def countFrames(pdbFile, list_dom, start=0, stop=None, step=1, selection=None):
+    """
+    :return: Le nombre de conformations selectionnees par start:stop:step s'il est connu sans lire les conformations
+    (cache binaire ou index des MODEL), sinon None (fichier compresse sans cache).
+    """
+    source = loadCache(pdbFile, list_dom, selection)
+    if source is None and compression(pdbFile) is None:
+        source = loadIndex(pdbFile)
+    return None if source is None else len(source.select(start, stop, step))
 
-                if chaine in list_dom:
 
-                    if chaine not in chainList:
-                        chainList.append(chaine)
-                        molecule[chaine] = {}
-                        resList = []
+def PDBiterMulti(pdbFile, list_dom, dtype=np.float64, start=0, stop=None, step=1, useCache=True, massWeighted=False,
+                 selection=None):
+    """
+    Lit un fichier pdb contenant plusieurs conformations et les renvoie une par une, dans l'ordre des MODEL,
+    sans garder en memoire les conformations deja traitees.
+    :param pdbFile: Fichier pbd (format ATOM) contenant plusieurs proteines.
+    :param list_dom: Liste des domaines a traiter (les autres domaines ne sont pas parses).
+    :param dtype: Type des coordonnees.
+    :param start: Rang (a partir de 0) de la premiere conformation a lire.
+    :param stop: Rang de la conformation a laquelle s'arreter (exclue), None pour lire jusqu'a la fin.
+    :param step: Pas entre deux conformations lues.
+    :param useCache: Si True, les conformations sont lues dans le cache binaire du fichier lorsqu'il est a jour.
+    :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+    :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+    :return: Generateur de couples (modele, Structure).
+    """
+    cache = loadCache(pdbFile, list_dom, selection) if useCache else None
+    if cache is not None:
+        for model, conf in cache.frames(cache.select(start, stop, step), dtype, massWeighted):
+            yield model, conf
+        return
 
-                    curres = line[22:26].strip()
+    decoder = FrameDecoder(list_dom, dtype, massWeighted, selection)   # topologie du premier bloc reutilisee
+    for model, block in PDBblocksMulti(pdbFile, start, stop, step, raw=True):
+        yield model, decoder.decode(block)
 
-                    if curres not in resList:
-                        resList.append(curres)
-                        molecule[chaine][curres] = {}
-                        atomList = []
-                        molecule[chaine][curres]['resname'] = line[17:20].strip()
 
-                    atom = line[12:16].strip()
-                    if atom not in atomList:
-                        atomList.append(atom)
-                        molecule[chaine][curres][atom] = {}
+def PDBfollowMulti(pdbFile, list_dom, dtype=np.float64, start=0, stop=None, step=1, massWeighted=False, selection=None,
+                   poll=1.0, timeout=None):
+    """
+    Lit les conformations d'un fichier pdb en cours d'ecriture par une simulation, une par une des que leur bloc
+    MODEL ... ENDMDL est complet (voir readerPDB.followBlocks), jusqu'a l'enregistrement END, au delai timeout sans
+    nouvelle conformation, ou a Ctrl-C.
+    :param pdbFile: Fichier pbd (format ATOM) non compresse.
+    :param list_dom, dtype, start, stop, step, massWeighted, selection: Voir PDBiterMulti.
+    :param poll: Intervalle (en s) entre deux lectures de la fin du fichier.
+    :param timeout: Duree (en s) sans nouvelle conformation apres laquelle la lecture s'arrete, None pour attendre END.
+    :return: Generateur de couples (modele, Structure).
+    """
+    decoder = FrameDecoder(list_dom, dtype, massWeighted, selection)
+    for model, block in followBlocks(pdbFile, start, stop, step, poll, timeout):
+        yield model, decoder.decode(block)
 
-                    molecule[chaine]['reslist'] = resList
-                    molecule[chaine][curres]['atomlist'] = atomList
 
-                    molecule[chaine][curres][atom]['x'] = float(line[30:38])
-                    molecule[chaine][curres][atom]['y'] = float(line[38:46])
-                    molecule[chaine][curres][atom]['z'] = float(line[46:54])
-                    molecule[chaine][curres][atom]['id'] = line[6:11].strip()
+def PDBblocksMulti(pdbFile, start=0, stop=None, step=1, raw=False):
+    """
+    Decoupe un fichier pdb contenant plusieurs conformations en blocs de lignes (un par MODEL), sans les parser.
+    Les blocs sont lus par acces direct grace a l'index des MODEL (voir indexPDB), construit au premier appel,
+    ou, pour un fichier compresse, en le decompressant a la volee (voir readerPDB.streamBlocks).
+    :param pdbFile: Fichier pbd (format ATOM) contenant plusieurs proteines.
+    :param start, stop, step: Selection des conformations (voir PDBiterMulti).
+    :param raw: Si True, les blocs d'un fichier non compresse sont renvoyes en octets, sans les decouper en lignes.
+    :return: Generateur de couples (modele, liste des lignes (ou octets) de la conformation).
+    """
+    if compression(pdbFile) is not None:
+        for model, conf in streamBlocks(pdbFile, start, stop, step):
+            yield model, conf
+        return
 
-    return molecule
+    index = loadIndex(pdbFile)
+    ranks = index.select(start, stop, step)
+    for model, conf in (index.rawBlocks(ranks) if raw else index.blocks(ranks)):
+        yield model, conf
 
 
-def PDBparserMulti(pdbFile, list_dom):
+def PDBparserFrame(pdbFile, rank, list_dom, dtype=np.float64, massWeighted=False, selection=None):
     """
-    Parse un fichier pdb au format ATOM contenant plusieurs proteines en un dictionnaire. 
+    Parse une seule conformation d'un fichier pdb contenant plusieurs conformations, sans lire les precedentes.
     :param pdbFile: Fichier pbd (format ATOM) contenant plusieurs proteines.
+    :param rank: Rang (a partir de 0) de la conformation dans le fichier.
     :param list_dom: Liste des domaines a traiter.
-    :return: Un dictionnaire utilisable par Python.
+    :param dtype: Type des coordonnees.
+    :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+    :param selection: Regles de selection des atomes (AtomSelection, par defaut DEFAULT_SELECTION).
+    :return: Le couple (modele, Structure).
     """
-    with open(pdbFile) as f:
+    cache = loadCache(pdbFile, list_dom, selection)
+    if cache is not None:
+        return next(cache.frames([range(len(cache))[rank]], dtype, massWeighted))
 
-        frames = {}  # dictionnaire contenant toutes les conformations
-        conf = []  # donnees du pdb correspondant a la conformation
-        model = ""
+    if compression(pdbFile) is not None:   # pas d'acces direct: decompression jusqu'a la conformation demandee
+        stop = rank + 1 if rank != -1 else None
+        model, conf = next(streamBlocks(pdbFile, rank, stop))
+    else:
+        model, conf = loadIndex(pdbFile).block(rank)
+    return model, PDBparserConf(conf, list_dom, dtype, massWeighted, selection)
 
-        for line in f:
-            if "MODEL" in line:
-                if model != "":
-                    frames[model] = PDBparserConf(conf, list_dom)
 
-                conf = []
-                model = line[10:14].strip()
-
-            else:
-                conf.append(line)
+def PDBconvert(pdbFile, list_dom, dtype=np.float64, massWeighted=False, selection=None):
+    """
+    Parse toute la dynamique une fois et l'enregistre dans un cache binaire (voir trajectoryCache),
+    utilise ensuite automatiquement par PDBparser, PDBparserMulti et PDBiterMulti tant qu'il est plus recent que le fichier pdb.
+    :param pdbFile: Fichier pdb (une ou plusieurs conformations).
+    :param list_dom: Liste des domaines a garder dans le cache.
+    :param dtype: Type des coordonnees stockees.
+    :param massWeighted: Ponderation des centres de masse des residus precalcules dans le cache.
+    :param selection: Regles de selection des atomes (AtomSelection), enregistrees avec le cache.
+    :return: Le repertoire du cache.
+    """
+    nbFrames = countModels(pdbFile) if compression(pdbFile) is not None else len(loadIndex(pdbFile))
+    frames = PDBiterMulti(pdbFile, list_dom, dtype, useCache=False, massWeighted=massWeighted, selection=selection)
+    return writeCache(pdbFile, frames, nbFrames, list_dom, dtype, massWeighted, selection=selection)
 
-        frames[model] = PDBparserConf(conf, list_dom)  # on parse la derniere conformation
 
-    return frames
+def iterFrames(frames, sortModels=False):
+    """
+    Parcourt des conformations fournies soit sous forme de dictionnaire {modele: Structure}
+    (PDBparserMulti), soit sous forme d'iterable de couples (modele, Structure) (PDBiterMulti).
+    :param frames: Dictionnaire ou iterable de conformations.
+    :param sortModels: Si True et si frames est un dictionnaire, parcourt les modeles par numero croissant.
+    :return: Generateur de couples (modele, Structure).
+    """
+    if isinstance(frames, Mapping):
+        models = sorted(frames.keys(), key=int) if sortModels else frames.keys()
+        for model in models:
+            yield model, frames[model]
+    else:
+        for model, conf in frames:
+            yield model, conf
@@ -5,12 +5,18 @@
 Authors: Maud De Tollenaere & Severine Liegeois
 Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
 Date: 02/05/2017
-Description: Script containing functions for computing the RMSD between two superimposed proteins.
+Description: Script containing functions for computing the RMSD between two proteins, either already
+superimposed or after an optimal (Kabsch) superposition, and the per-residue fluctuations (RMSF)
+and mean positions over a dynamics.
 """
 
-import matplotlib.pyplot as plt
+import numpy as np
 from math import sqrt
 
+from Structure import centersOfMass
+from parallel import Accumulator, analyseFrames
+from plotting import pyplot, figurePath, saveFigure
+
 def distanceCarree(p1, p2):
     """
     Calcule le carre de la distance entre 2 points dans l'espace.
@@ -23,9 +29,13 @@ def distanceCarree(p1, p2):
 def centerOfMass(dico):
     """
     Calcule le centre de masse d'une molecule.
-    :param dico: Dictionnaire contenant les coordonnees des atomes de la molecule.
+    :param dico: Dictionnaire (ou vue d'une Structure) contenant les coordonnees des atomes de la molecule.
     :return: Dictionnaire contenant les coordonnees du centre de masse de la molecule.
     """
+    if hasattr(dico, 'center'):  # vue sur un residu d'une Structure: lu dans la table des centres de masse
+        cm = dico.center
+        return {'x': float(cm[0]), 'y': float(cm[1]), 'z': float(cm[2])}
+
     x = 0
     y = 0
     z = 0
@@ -42,7 +52,6 @@ def centerOfMass(dico):
 
     return CM_res
 
-
 #-------------------------------------------
 def RMSD_prot(dico1, dico2, mode):
     """
@@ -103,49 +112,387 @@ def RMSD_domain(dico1, dico2, mode):
 
 
 # -------------------------------------------------------------
-def computeRMSD(ref, frames, list_dom_prot, rmsd_mode, output):
+def superpose(mobile, target):
+    """
+    Superpose de facon optimale (algorithme de Kabsch) chaque conformation d'un lot sur une cible.
+    :param mobile: Tableau (n_frames, n_points, 3) des points a deplacer.
+    :param target: Tableau (n_points, 3) des points de la cible.
+    :return: Tableau (n_frames, n_points, 3) des points apres translation et rotation.
+    """
+    centerT = target.mean(axis=0)
+    P = mobile - mobile.mean(axis=1, keepdims=True)
+    Q = target - centerT
+    H = np.einsum('fni,nj->fij', P, Q)          # matrices de covariance 3x3, une par conformation
+    U, S, Vt = np.linalg.svd(H)
+    d = np.sign(np.linalg.det(np.matmul(U, Vt)))  # -1 si la rotation optimale est une reflexion
+    U[:, :, 2] *= d[:, np.newaxis]
+    return np.matmul(P, np.matmul(U, Vt)) + centerT
+
+
+def rmsdPoints(struct, mode, keys=None):
+    """
+    Extrait les points utilises pour le RMSD: carbones alpha ('CA') ou centres de masse des residus ('CM').
+    :param struct: Structure.
+    :param mode: 'CA' ou 'CM'.
+    :param keys: Liste des couples (domaine, residu) a extraire; par defaut tous les residus de struct (ayant un CA en mode 'CA').
+    :return: La liste des couples (domaine, residu) et le tableau (n_points, 3) des points.
+    """
+    if keys is None:
+        keys = list(zip(struct.resChain.tolist(), struct.resList.tolist()))
+        if mode == 'CA':
+            hasCA = np.zeros(struct.nResidues, dtype=bool)
+            hasCA[struct.atomRes[(struct.atomNames == 'CA') & ~struct.hetero]] = True   # pas les ions calcium
+            keys = [key for key, ok in zip(keys, hasCA.tolist()) if ok]
+
+    if mode not in ('CA', 'CM'):
+        raise ValueError("Unknown RMSD mode: %s" % mode)
+    return keys, framePoints(struct, mode, rmsdIndices(struct, mode, keys))
+
+
+def batchRMSD(refPoints, points, domains, fit=None):
+    """
+    Calcule en une seule operation le RMSD global et celui de chaque domaine pour un lot de conformations.
+    :param refPoints: Tableau (n_points, 3) des points de la structure de reference.
+    :param points: Tableau (n_frames, n_points, 3) des points correspondants dans chaque conformation.
+    :param domains: Dictionnaire {domaine: slice des points du domaine}.
+    :param fit: None (structures deja superposees), 'global' (superposition optimale sur toute la structure)
+    ou 'domain' (superposition globale pour le RMSD global, puis de chaque domaine pour le RMSD du domaine).
+    :return: Le tableau (n_frames,) des RMSD globaux et le dictionnaire {domaine: tableau (n_frames,) des RMSD}.
+    """
+    if fit not in (None, 'global', 'domain'):
+        raise ValueError("Unknown superposition mode: %s" % fit)
+
+    moved = superpose(points, refPoints) if fit is not None else points
+    d2 = ((moved - refPoints) ** 2).sum(axis=2)
+    # sommes dans l'ordre des points (accumulate), comme RMSD_prot: memes valeurs au bit pres sans superposition
+    rmsd_global = np.sqrt(np.add.accumulate(d2, axis=1)[:, -1] / d2.shape[1])
+
+    rmsd_dom = dict()
+    for dom, sel in domains.items():
+        if fit == 'domain':
+            d2_dom = ((superpose(points[:, sel], refPoints[sel]) - refPoints[sel]) ** 2).sum(axis=2)
+        else:
+            d2_dom = d2[:, sel]
+        rmsd_dom[dom] = np.sqrt(np.add.accumulate(d2_dom, axis=1)[:, -1] / d2_dom.shape[1])
+
+    return rmsd_global, rmsd_dom
+
+
+# -------------------------------------------------------------
+def computeRMSD(ref, frames, list_dom_prot, rmsd_mode, output, fit=None, plotDir=None, plotFormat="png"):
     """
     Calcule le RMSD entre la structure de reference et chacune des conformations de la dynamique.
     :param ref: Dictionnaire correspondant a la structure de reference.
-    :param frames: Dictionnaire correspondant aux differentes conformations.
+    :param frames: Dictionnaire correspondant aux differentes conformations, ou iterable de couples (modele, Structure)
+    (par exemple PDBiterMulti) parcouru une seule fois, ou ParallelFrames pour un calcul en parallele.
     :param list_dom_prot: Liste des domaines proteiques.
     :param rmsd_mode: Mode de calcul du RMSD.
     :param output: Fichier de sortie contenant pour chaque conformation, le RMSD global et celui des domaines.
-    :return: Graphes RMSD en fonction de conformations.
+    :param fit: Superposition optimale avant le calcul: None (aucune), 'global' ou 'domain' (voir batchRMSD).
+    :param plotDir: Repertoire optionnel ou sont ecrits les graphes RMSD en fonction des conformations (voir plotRMSD).
+    :param plotFormat: Format des graphes ('png' ou 'svg').
+    :return: La liste des modeles, la liste des RMSD globaux et le dictionnaire {domaine: liste des RMSD}.
     """
-    f = open(output, "w")
+    rmsd = analyseFrames(frames, [RMSDAccumulator(ref, list_dom_prot, rmsd_mode, output, fit)])[0]
+    if plotDir is not None:
+        plotRMSD(*rmsd, list_dom_prot, rmsd_mode, plotDir, plotFormat)
+    return rmsd
+
+
+class RMSDAccumulator(Accumulator):
+    """
+    RMSD global et de chaque domaine entre la structure de reference et chaque conformation (voir analyseFrames).
+    Les conformations sont traitees par lots de batchSize avec batchRMSD.
+    """
+
+    stage = "rmsd"
 
-    x_plot = []
-    y_global = []
-    y_dom = dict()  # cle = nom du domaine, valeur = liste des RMSD du domaine
+    def __init__(self, ref, list_dom_prot, rmsd_mode, output, fit=None, batchSize=256):
+        """
+        :param ref: Structure de reference.
+        :param list_dom_prot: Liste des domaines proteiques.
+        :param rmsd_mode: Mode de calcul du RMSD.
+        :param output: Fichier de sortie contenant pour chaque conformation, le RMSD global et celui des domaines.
+        :param fit: Superposition optimale avant le calcul (voir batchRMSD).
+        :param batchSize: Nombre de conformations par lot.
+        """
+        self.list_dom_prot = list_dom_prot
+        self.rmsd_mode = rmsd_mode
+        self.output = output
+        self.fit = fit
+        self.batchSize = batchSize
 
-    for model in sorted(map(int, frames.keys())):   # pour chaque conformation on calcule le RMSD global et le RMSD de chaque domaine
+        self.keys, self.refPoints = rmsdPoints(ref, rmsd_mode)
+        chains = [chain for chain, res in self.keys]
+        self.domains = dict()
+        for dom in list_dom_prot:   # les points sont ranges par domaine, dans l'ordre de la reference
+            self.domains[dom] = slice(chains.index(dom), len(chains) - chains[::-1].index(dom))
+        self.reset()
 
-        rmsd_global = RMSD_prot(ref, frames[str(model)], rmsd_mode)
+    def reset(self):
+        self.models = []
+        self.y_global = []
+        self.y_dom = dict()
+        for dom in self.list_dom_prot:
+            self.y_dom[dom] = []
+        self._batch = []
+        self._topology = None
+        self._written = 0   # conformations deja ecrites par checkpoint
 
-        x_plot.append(model)
-        y_global.append(rmsd_global)
-        f.write("Model " + str(model) + "\t" + str(rmsd_global) + "\n")
+    def cacheKey(self):
+        return ('rmsd', self.rmsd_mode, self.fit, list(self.list_dom_prot), self.keys, self.refPoints.tobytes())
 
-        for dom in list_dom_prot:
-            if dom not in y_dom.keys():
-                y_dom[dom] = []
+    def update(self, model, conf, memo, fout=None):
+        self.models.append(int(model))
+        if self._topology is None or not conf.sameTopology(self._topology):
+            self._topology = conf   # correspondance des points reference/conformation, recalculee si la topologie change
+            self._indices = rmsdIndices(conf, self.rmsd_mode, self.keys)
+        self._batch.append(framePoints(conf, self.rmsd_mode, self._indices))
+        if len(self._batch) == self.batchSize:
+            self._flush()
 
-            rmsd_dom = RMSD_domain(ref[dom], frames[str(model)][dom], rmsd_mode)
+    def _flush(self):
+        """
+        Calcule les RMSD du lot de conformations en attente.
+        """
+        if self._batch:
+            _appendRMSD(self._batch, self.refPoints, self.domains, self.fit, self.y_global, self.y_dom)
+            self._batch = []
 
-            y_dom[dom].append(rmsd_dom)
+    def partial(self):
+        """
+        :return: La liste des modeles, la liste des RMSD globaux et le dictionnaire {domaine: liste des RMSD}.
+        """
+        self._flush()
+        return self.models, self.y_global, self.y_dom
 
-            f.write("\t" + str(dom) + "\t" + str(rmsd_dom) + "\n")
-    f.close()
+    def merge(self, partial):
+        models, y_global, y_dom = partial
+        self.models.extend(models)
+        self.y_global.extend(y_global)
+        for dom in self.list_dom_prot:
+            self.y_dom[dom].extend(y_dom[dom])
 
-    # Graphes:
+    def finish(self):
+        """
+        Ecrit les RMSD par numero de modele croissant (les graphes sont traces a part, par plotRMSD).
+        :return: La liste des modeles, la liste des RMSD globaux et le dictionnaire {domaine: liste des RMSD}.
+        """
+        order = sorted(range(len(self.models)), key=self.models.__getitem__)
+        x_plot = [self.models[i] for i in order]
+        y_global = [self.y_global[i] for i in order]
+        y_dom = dict()
+        for dom in self.list_dom_prot:
+            y_dom[dom] = [self.y_dom[dom][i] for i in order]
+
+        f = open(self.output, "w")
+        self._write(f, x_plot, y_global, y_dom, range(len(x_plot)))
+        f.close()
+
+        return x_plot, y_global, y_dom
+
+    def checkpoint(self):
+        """
+        Ajoute au fichier de sortie les RMSD des conformations fusionnees depuis le point de controle precedent,
+        dans l'ordre de lecture (finish recrit ensuite le fichier par numero de modele croissant).
+        """
+        f = open(self.output, "w" if self._written == 0 else "a")
+        self._write(f, self.models, self.y_global, self.y_dom, range(self._written, len(self.models)))
+        f.close()
+        self._written = len(self.models)
+
+    def _write(self, f, models, y_global, y_dom, ranks):
+        """
+        Ecrit le RMSD global et celui des domaines des conformations de rangs ranks.
+        """
+        for i in ranks:
+            f.write("Model " + str(models[i]) + "\t" + str(y_global[i]) + "\n")
+            for dom in self.list_dom_prot:
+                f.write("\t" + str(dom) + "\t" + str(y_dom[dom][i]) + "\n")
+
+
+
+def computeRMSF(ref, frames, list_dom, rmsd_mode, output, fit=None):
+    """
+    Calcule la fluctuation (RMSF) et la position moyenne de chaque residu sur la dynamique, en une seule passe.
+    :param ref: Structure de reference (residus retenus et cible des superpositions).
+    :param frames: Conformations (voir computeRMSD).
+    :param list_dom: Liste des domaines analyses.
+    :param rmsd_mode: Points de chaque residu: carbone alpha ('CA') ou centre de masse ('CM').
+    :param output: Fichier de sortie contenant, pour chaque domaine, le RMSF et la position moyenne des residus.
+    :param fit: Superposition optimale sur la reference avant le calcul: None (aucune), 'global' ou 'domain'.
+    :return: Dictionnaire {domaine: {residu: RMSF}}.
+    """
+    return analyseFrames(frames, [RMSFAccumulator(ref, list_dom, rmsd_mode, output, fit)])[0]
+
+
+class RMSFAccumulator(Accumulator):
+    """
+    RMSF et position moyenne de chaque residu (voir analyseFrames), en memoire constante: seuls le nombre de
+    conformations, la moyenne et la somme des carres des ecarts a la moyenne (algorithme de Welford) sont gardes.
+    Les conformations sont traitees par lots de batchSize, dont les statistiques sont combinees a celles deja
+    accumulees (formule de Chan, egalement utilisee pour fusionner les resultats partiels). Les resultats dependent
+    donc, aux arrondis pres, du decoupage des conformations en morceaux (processus, points de sauvegarde).
+    """
+
+    stage = "rmsf"
+
+    def __init__(self, ref, list_dom, rmsd_mode, output, fit=None, batchSize=256):
+        """
+        :param ref: Structure de reference.
+        :param list_dom: Liste des domaines analyses.
+        :param rmsd_mode: Points de chaque residu ('CA' ou 'CM', voir rmsdPoints).
+        :param output: Fichier de sortie.
+        :param fit: Superposition optimale sur la reference avant le calcul: None, 'global' ou 'domain'
+        (chaque domaine superpose separement).
+        :param batchSize: Nombre de conformations par lot.
+        """
+        if fit not in (None, 'global', 'domain'):
+            raise ValueError("Unknown superposition mode: %s" % fit)
+        self.list_dom = list_dom
+        self.rmsd_mode = rmsd_mode
+        self.output = output
+        self.fit = fit
+        self.batchSize = batchSize
+
+        keys, points = rmsdPoints(ref, rmsd_mode)
+        keep = [i for i, (chain, res) in enumerate(keys) if chain in list_dom]
+        self.keys = [keys[i] for i in keep]
+        self.refPoints = points[keep]
+        chains = [chain for chain, res in self.keys]
+        self.domains = dict()
+        for dom in list_dom:   # les points sont ranges par domaine, dans l'ordre de la reference
+            if dom in chains:
+                self.domains[dom] = slice(chains.index(dom), len(chains) - chains[::-1].index(dom))
+        self.reset()
+
+    def reset(self):
+        self.nb_frames = 0
+        self.mean = np.zeros(self.refPoints.shape)
+        self.m2 = np.zeros(len(self.keys))   # somme des carres des ecarts a la moyenne, par residu
+        self._batch = []
+        self._topology = None
+
+    def cacheKey(self):
+        return ('rmsf', self.rmsd_mode, self.fit, self.keys, self.refPoints.tobytes())
+
+    def update(self, model, conf, memo, fout=None):
+        if self._topology is None or not conf.sameTopology(self._topology):
+            self._topology = conf
+            self._indices = rmsdIndices(conf, self.rmsd_mode, self.keys)
+        self._batch.append(framePoints(conf, self.rmsd_mode, self._indices))
+        if len(self._batch) == self.batchSize:
+            self._flush()
+
+    def _flush(self):
+        """
+        Ajoute les statistiques du lot de conformations en attente.
+        """
+        if self._batch:
+            points = np.stack(self._batch).astype(float, copy=False)
+            self._batch = []
+            if self.fit == 'global':
+                points = superpose(points, self.refPoints)
+            elif self.fit == 'domain':
+                points = points.copy()
+                for sel in self.domains.values():
+                    points[:, sel] = superpose(points[:, sel], self.refPoints[sel])
+            mean = points.mean(axis=0)
+            m2 = ((points - mean) ** 2).sum(axis=(0, 2))
+            self._combine(len(points), mean, m2)
+
+    def _combine(self, nb, mean, m2):
+        """
+        Combine aux statistiques accumulees celles (nombre, moyenne, somme des carres des ecarts) d'autres conformations.
+        """
+        if nb == 0:
+            return
+        total = self.nb_frames + nb
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (nb / total)
+        self.m2 = self.m2 + m2 + (delta ** 2).sum(axis=1) * (self.nb_frames * nb / total)
+        self.nb_frames = total
+
+    def partial(self):
+        """
+        :return: Le nombre de conformations, la moyenne et la somme des carres des ecarts de chaque residu.
+        """
+        self._flush()
+        return self.nb_frames, self.mean, self.m2
+
+    def merge(self, partial):
+        self._combine(*partial)
+
+    def finish(self):
+        """
+        Ecrit, pour chaque domaine, le RMSF et la position moyenne de chaque residu.
+        :return: Dictionnaire {domaine: {residu: RMSF}}.
+        """
+        self._flush()
+        rmsf = np.sqrt(self.m2 / max(self.nb_frames, 1))
+        f = open(self.output, "w")
+        res_rmsf = dict()
+        for dom, sel in self.domains.items():
+            res_rmsf[dom] = dict()
+            f.write("Domain " + dom + "\n\tResidue\tRMSF\tX\tY\tZ\n")
+            for i in range(sel.start, sel.stop):
+                res = self.keys[i][1]
+                res_rmsf[dom][res] = float(rmsf[i])
+                # precision fixe: les statistiques combinees par morceaux ne different que par l'arrondi
+                f.write("\t%s\t%.6f\t%.3f\t%.3f\t%.3f\n" % ((res, res_rmsf[dom][res]) + tuple(self.mean[i].tolist())))
+        f.close()
+        return res_rmsf
+
+
+def rmsdIndices(conf, mode, keys):
+    """
+    :return: Les indices, dans conf, des atomes CA (mode 'CA') ou des residus (mode 'CM') correspondant aux couples (domaine, residu) de keys.
+    """
+    residues = [conf.resIndex(chain, res) for chain, res in keys]
+    if mode == 'CA':
+        return np.array([conf.atomIndex(i, 'CA') for i in residues], dtype=np.intp)
+    return np.array(residues, dtype=np.intp)
+
+
+def framePoints(conf, mode, indices):
+    """
+    :return: Le tableau (n_points, 3) des points de conf utilises pour le RMSD (voir rmsdIndices).
+    """
+    if mode == 'CA':
+        return conf.coords[indices]
+    return conf.centers()[indices]
+
+
+def _appendRMSD(batch, refPoints, domains, fit, y_global, y_dom):
+    """
+    Calcule les RMSD d'un lot de conformations et les ajoute aux listes de resultats.
+    """
+    rmsd_global, rmsd_dom = batchRMSD(refPoints, np.stack(batch), domains, fit)
+    y_global.extend(rmsd_global.tolist())
+    for dom in rmsd_dom:
+        y_dom[dom].extend(rmsd_dom[dom].tolist())
+
+
+def plotRMSD(x_plot, y_global, y_dom, list_dom_prot, rmsd_mode, plotDir=".", plotFormat="png", show=False):
+    """
+    Trace le RMSD global (rmsd.png) puis celui de chaque domaine (rmsd_domains.png) en fonction des conformations.
+    :param plotDir: Repertoire des fichiers des graphes.
+    :param plotFormat: Format des graphes ('png' ou 'svg').
+    :param show: Si True, les graphes sont affiches dans des fenetres au lieu d'etre ecrits.
+    :return: La liste des fichiers ecrits.
+    """
+    plt = pyplot(show)
+    written = []
+
+    fig = plt.figure()
     plt.plot(x_plot, y_global)
     plt.xlabel('Frame')
     plt.ylabel('RMSD (in Angstrom)')
     plt.title('Global RMSD of the protein (computed on %s)'%(rmsd_mode))
-    plt.show()
+    written.append(saveFigure(fig, figurePath(plotDir, "rmsd", plotFormat), show))
 
     # tracer les courbes des domaines sur le meme graphe:
+    fig = plt.figure()
     colors = ['b', 'r', 'g', 'y', 'c', 'm', 'k']
     for i in range(len(list_dom_prot)):
         plt.plot(x_plot, y_dom[list_dom_prot[i]], colors[i], label=list_dom_prot[i])
@@ -155,4 +502,6 @@ def computeRMSD(ref, frames, list_dom_prot, rmsd_mode, output):
     plt.ylabel('RMSD (in Angstrom)')
     plt.title('RMSD for each domain (computed on %s)'%(rmsd_mode))
     plt.legend(loc=4)
-    plt.show()
\ No newline at end of file
+    written.append(saveFigure(fig, figurePath(plotDir, "rmsd_domains", plotFormat), show))
+
+    return [path for path in written if path is not None]
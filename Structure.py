@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Compact array-backed representation of a parsed PDB structure (one frame).
+The coordinates are stored in a single (n_atoms, 3) NumPy array and the topology
+(domain, residue, atom name, residue name, serial) in parallel arrays. Thin mapping
+views reproduce the former nested dictionaries (molecule[chain][res][atom]['x']).
+"""
+
+import copy
+from collections.abc import Mapping
+
+import numpy as np
+
+# masses atomiques (g/mol) des elements rencontres dans les complexes proteine/ARN
+ATOMIC_MASSES = {'H': 1.008, 'C': 12.011, 'N': 14.007, 'O': 15.999, 'P': 30.974, 'S': 32.06,
+                 'SE': 78.971, 'MG': 24.305, 'NA': 22.990, 'K': 39.098, 'CL': 35.45, 'CA': 40.078,
+                 'MN': 54.938, 'FE': 55.845, 'ZN': 65.38, 'CU': 63.546, 'CO': 58.933, 'NI': 58.693}
+DEFAULT_MASS = ATOMIC_MASSES['C']   # element inconnu
+
+
+def centersOfMass(coords, offsets, weights=None):
+    """
+    Calcule en une seule operation les centres de masse de residus consecutifs, pour une ou plusieurs conformations.
+    Les atomes de chaque residu sont sommes dans l'ordre (resultats identiques au bit pres a une boucle Python).
+    :param coords: Tableau (..., n_atoms, 3) des coordonnees des atomes.
+    :param offsets: Offsets des residus dans coords (le residu i correspond aux atomes offsets[i]:offsets[i+1]).
+    :param weights: Masse de chaque atome (tableau (n_atoms,)), ou None pour le centre geometrique.
+    :return: Tableau (..., n_res, 3) des centres de masse.
+    """
+    offsets = np.asarray(offsets)
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    sums = np.zeros(coords.shape[:-2] + (len(counts), 3))
+    total = counts.astype(np.float64) if weights is None else np.zeros(len(counts))
+
+    # k-ieme atome de tous les residus qui en ont au moins k+1
+    for k in range(counts.max() if len(counts) else 0):
+        present = counts > k
+        atoms = starts[present] + k
+        if weights is None:
+            sums[..., present, :] += coords[..., atoms, :]
+        else:
+            sums[..., present, :] += coords[..., atoms, :] * weights[atoms][:, np.newaxis]
+            total[present] += weights[atoms]
+
+    return sums / total[:, np.newaxis]
+
+
+class Structure(Mapping):
+    """
+    Structure (ou conformation) stockee sous forme de tableaux NumPy.
+    Les atomes sont regroupes par domaine puis par residu : les atomes du residu i
+    sont coords[resOffsets[i]:resOffsets[i+1]].
+    Se comporte comme le dictionnaire {domaine: {residu: {atome: {'x','y','z','id'}}}}
+    renvoye auparavant par PDBparser.
+    """
+
+    def __init__(self, coords, chainIds, resIds, atomNames, resNames, serials, dtype=np.float64,
+                 elements=None, massWeighted=False, altLocs=None, hetero=None):
+        """
+        :param coords: Coordonnees des atomes, tableau (n_atoms, 3).
+        :param chainIds: Identifiant du domaine de chaque atome.
+        :param resIds: Numero de residu de chaque atome (chaine de caracteres).
+        :param atomNames: Nom de chaque atome.
+        :param resNames: Nom du residu de chaque atome.
+        :param serials: Numero (serial) de chaque atome dans le fichier pdb.
+        :param dtype: Type des coordonnees (np.float64 ou np.float32).
+        :param elements: Element chimique de chaque atome (par defaut, premiere lettre du nom de l'atome).
+        :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+        :param altLocs: Indicateur de position alternative de chaque atome (par defaut aucun, voir ParserPDB.AtomSelection).
+        :param hetero: True pour les atomes lus dans un enregistrement HETATM (par defaut aucun).
+        """
+        self.coords = np.ascontiguousarray(coords, dtype=dtype).reshape(-1, 3)
+        self.chainIds = np.asarray(chainIds, dtype=str)
+        self.resIds = np.asarray(resIds, dtype=str)
+        self.atomNames = np.asarray(atomNames, dtype=str)
+        self.resNames = np.asarray(resNames, dtype=str)
+        self.serials = np.asarray(serials, dtype=str)
+        if elements is None:
+            elements = [name.lstrip('0123456789')[:1] for name in self.atomNames.tolist()]
+        self.elements = np.asarray(elements, dtype=str)
+        nAtoms = len(self.coords)
+        self.altLocs = np.full(nAtoms, "", dtype='<U1') if altLocs is None else np.asarray(altLocs, dtype='<U1')
+        self.hetero = np.zeros(nAtoms, dtype=bool) if hetero is None else np.asarray(hetero, dtype=bool)
+        self.massWeighted = massWeighted
+        self._centers = None    # table des centres de masse des residus, calculee a la demande
+
+        if nAtoms == 0:
+            self.resOffsets = np.zeros(1, dtype=np.intp)
+        else:
+            # un nouveau residu commence quand le domaine ou le numero de residu change
+            newRes = np.ones(nAtoms, dtype=bool)
+            newRes[1:] = (self.chainIds[1:] != self.chainIds[:-1]) | (self.resIds[1:] != self.resIds[:-1])
+            self.resOffsets = np.append(np.flatnonzero(newRes), nAtoms).astype(np.intp)
+
+        starts = self.resOffsets[:-1]
+        self.resChain = self.chainIds[starts]   # domaine de chaque residu
+        self.resList = self.resIds[starts]      # numero de chaque residu
+        self.atomRes = np.repeat(np.arange(len(starts)), np.diff(self.resOffsets))  # residu de chaque atome
+        self.resBfactors = np.zeros(len(starts))
+
+        # offsets des domaines, en indices de residus: chainOffsets[dom] = (premier, dernier + 1)
+        self.chainOffsets = {}
+        for i, chain in enumerate(self.resChain.tolist()):
+            if chain in self.chainOffsets:
+                self.chainOffsets[chain] = (self.chainOffsets[chain][0], i + 1)
+            else:
+                self.chainOffsets[chain] = (i, i + 1)
+
+        self._shared = {}       # selections de la topologie (voir selection), partagees par les copies de withCoords
+        self._resIndex = {}   # (domaine, residu) -> indice du residu
+        for i, key in enumerate(zip(self.resChain.tolist(), self.resList.tolist())):
+            self._resIndex[key] = i
+
+    def withCoords(self, coords, centers=None):
+        """
+        Cree une Structure de meme topologie (tableaux partages, non copies) avec d'autres coordonnees.
+        :param coords: Tableau (n_atoms, 3) des nouvelles coordonnees (par exemple une conformation d'une dynamique).
+        :param centers: Table des centres de masse des residus deja calculee pour ces coordonnees (optionnel).
+        :return: Une nouvelle Structure.
+        """
+        if coords.shape != self.coords.shape:
+            raise ValueError("Coordinates of shape %s do not match the topology (%d atoms)" % (coords.shape, self.nAtoms))
+        new = copy.copy(self)
+        new.coords = coords
+        new.resBfactors = np.zeros(self.nResidues)
+        new._centers = centers
+        return new
+
+    def masses(self):
+        """
+        :return: Le tableau (n_atoms,) des masses atomiques, d'apres l'element de chaque atome.
+        """
+        return np.array([ATOMIC_MASSES.get(el.upper(), DEFAULT_MASS) for el in self.elements.tolist()])
+
+    def centers(self):
+        """
+        Table des centres de masse de tous les residus, calculee une seule fois par conformation et partagee
+        par tous les calculs en mode 'CM' (RMSD, distances, interface, contacts).
+        :return: Tableau (n_residues, 3), dans l'ordre des residus.
+        """
+        if self._centers is None:
+            self._centers = centersOfMass(self.coords, self.resOffsets, self.masses() if self.massWeighted else None)
+        return self._centers
+
+    def chainCenters(self, chain):
+        """
+        :return: Le tableau des centres de masse des residus du domaine 'chain'.
+        """
+        first, last = self.chainOffsets[chain]
+        return self.centers()[first:last]
+
+    def selection(self, key, build):
+        """
+        Selection (tableau d'indices, liste...) calculee une seule fois pour la topologie et reutilisee par toutes les
+        conformations qui la partagent (voir withCoords et trajectory.Trajectory).
+        :param key: Cle de la selection (par exemple ('CA', domaines)).
+        :param build: Fonction sans argument calculant la selection si elle n'est pas encore connue.
+        :return: La selection.
+        """
+        if key not in self._shared:
+            self._shared[key] = build()
+        return self._shared[key]
+
+    def sameTopology(self, other):
+        """
+        :return: True si les 2 structures ont les memes atomes (domaines, residus, noms, positions alternatives), dans le meme ordre.
+        """
+        if self._shared is other._shared:   # topologie partagee (withCoords): pas de comparaison des tableaux
+            return True
+        return (self.nAtoms == other.nAtoms and np.array_equal(self.chainIds, other.chainIds)
+                and np.array_equal(self.resIds, other.resIds) and np.array_equal(self.atomNames, other.atomNames)
+                and np.array_equal(self.resNames, other.resNames) and np.array_equal(self.altLocs, other.altLocs)
+                and np.array_equal(self.hetero, other.hetero))
+
+    @property
+    def nAtoms(self):
+        return len(self.coords)
+
+    @property
+    def nResidues(self):
+        return len(self.resOffsets) - 1
+
+    def resIndex(self, chain, res):
+        """
+        :return: L'indice du residu 'res' du domaine 'chain'.
+        """
+        return self._resIndex[(chain, res)]
+
+    def atomIndex(self, i, name):
+        """
+        :return: L'indice de l'atome 'name' du residu d'indice i.
+        """
+        atomIndex = self.selection('atomIndex', lambda: dict(zip(zip(self.atomRes.tolist(), self.atomNames.tolist()),
+                                                                 range(self.nAtoms))))
+        return atomIndex[(i, name)]
+
+    def chainAtoms(self, chain):
+        """
+        :return: Le slice des atomes du domaine 'chain' dans coords.
+        """
+        first, last = self.chainOffsets[chain]
+        return slice(self.resOffsets[first], self.resOffsets[last])
+
+    def chainResOffsets(self, chain):
+        """
+        :return: Les offsets des residus du domaine 'chain', relatifs au premier atome du domaine
+        (tableau de longueur nombre de residus + 1).
+        """
+        def build():
+            first, last = self.chainOffsets[chain]
+            offsets = self.resOffsets[first:last + 1] - self.resOffsets[first]
+            offsets.flags.writeable = False
+            return offsets
+        return self.selection(('resOffsets', chain), build)
+
+    def chainResList(self, chain):
+        """
+        :return: La liste des residus du domaine 'chain' (la cle 'reslist' de molecule[chain]), a ne pas modifier.
+        """
+        first, last = self.chainOffsets[chain]
+        return self.selection(('reslist', chain), lambda: self.resList[first:last].tolist())
+
+    def resAtoms(self, i):
+        """
+        :return: Le slice des atomes du residu d'indice i dans coords.
+        """
+        return slice(self.resOffsets[i], self.resOffsets[i + 1])
+
+    # Interface dictionnaire (vue sur les domaines)
+    def __getitem__(self, chain):
+        if chain not in self.chainOffsets:
+            raise KeyError(chain)
+        return ChainView(self, chain)
+
+    def __iter__(self):
+        return iter(self.chainOffsets)
+
+    def __len__(self):
+        return len(self.chainOffsets)
+
+    def __contains__(self, chain):
+        return chain in self.chainOffsets
+
+
+class ChainView(Mapping):
+    """
+    Vue d'un domaine: {'reslist': [...], residu: ResidueView}.
+    """
+
+    def __init__(self, structure, chain):
+        self.structure = structure
+        self.chain = chain
+        self.first, self.last = structure.chainOffsets[chain]
+
+    @property
+    def coords(self):
+        return self.structure.coords[self.structure.chainAtoms(self.chain)]
+
+    def __getitem__(self, key):
+        if key == 'reslist':
+            return self.structure.resList[self.first:self.last].tolist()
+        try:
+            return ResidueView(self.structure, self.structure.resIndex(self.chain, key))
+        except KeyError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield 'reslist'
+        for res in self.structure.resList[self.first:self.last].tolist():
+            yield res
+
+    def __len__(self):
+        return self.last - self.first + 1
+
+
+class ResidueView(Mapping):
+    """
+    Vue d'un residu: {'resname': ..., 'atomlist': [...], 'bfactor': ..., atome: AtomView}.
+    Seule la cle 'bfactor' est modifiable.
+    """
+
+    def __init__(self, structure, index):
+        self.structure = structure
+        self.index = index
+        self.atoms = structure.resAtoms(index)
+
+    @property
+    def coords(self):
+        return self.structure.coords[self.atoms]
+
+    @property
+    def center(self):
+        return self.structure.centers()[self.index]
+
+    def __getitem__(self, key):
+        if key == 'resname':
+            return str(self.structure.resNames[self.atoms.start])
+        if key == 'atomlist':
+            return self.structure.atomNames[self.atoms].tolist()
+        if key == 'bfactor':
+            return float(self.structure.resBfactors[self.index])
+        try:
+            return AtomView(self.structure, self.structure.atomIndex(self.index, key))
+        except KeyError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key != 'bfactor':
+            raise KeyError("Only the 'bfactor' of a residue can be modified: %s" % key)
+        self.structure.resBfactors[self.index] = value
+
+    def __iter__(self):
+        yield 'resname'
+        for name in self.structure.atomNames[self.atoms].tolist():
+            yield name
+        yield 'atomlist'
+        yield 'bfactor'
+
+    def __len__(self):
+        return self.atoms.stop - self.atoms.start + 3
+
+
+class AtomView(Mapping):
+    """
+    Vue d'un atome: {'x': ..., 'y': ..., 'z': ..., 'id': ...}.
+    """
+    _axes = {'x': 0, 'y': 1, 'z': 2}
+
+    def __init__(self, structure, index):
+        self.structure = structure
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return str(self.structure.serials[self.index])
+        return float(self.structure.coords[self.index, self._axes[key]])
+
+    def __iter__(self):
+        return iter(('x', 'y', 'z', 'id'))
+
+    def __len__(self):
+        return 4
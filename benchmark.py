@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Benchmark of the parsing and analysis hot paths on a synthetic trajectory (see syntheticPDB.py).
+Each stage runs in a fresh process and reports its time, its throughput (frames/s, atoms/s) and the
+peak resident memory of the process. The results are saved as JSON and can be compared with a
+previous run: a stage slower (or bigger) than the baseline by more than the tolerance is a regression.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+from ParserPDB import PDBparser, PDBparserMulti
+from RMSD import RMSD_prot, computeRMSD
+from computeInterface import contactTime, distDico, resDistMatrix, resInterface
+from indexPDB import INDEX_SUFFIX, loadIndex
+from neighbourSearch import residuePairs
+from parallel import ParallelFrames
+from profiling import peakRSS
+from syntheticPDB import RNA_DOMAIN, syntheticDomains, writeSynthetic
+
+RESULT_FORMAT = 1
+
+STAGES = ("buildIndex", "PDBparserMulti", "RMSD_prot", "computeRMSD", "distDico", "distMatrix", "resInterface",
+          "contactTime")
+
+# mesures comparees a la reference (une hausse au-dela de la tolerance est une regression)
+COMPARED = ("seconds", "peak_rss_mb")
+
+
+def _frames(params):
+    """
+    :return: Les conformations a analyser: dictionnaire deja parse, ou ParallelFrames si plusieurs processus sont demandes.
+    """
+    if params['workers'] > 1:
+        return ParallelFrames(params['conf'], params['parsing'], params['workers'])
+    return params['frames']
+
+
+def _pairs(ref, domains, rna, threshold, mode):
+    """
+    :return: Les paires de residus suivies par contactTime: pour chaque domaine, la premiere paire en contact avec l'ARN
+    dans la structure de reference (format des paires de main.py).
+    """
+    pairs = {}
+    for dom in domains:
+        r1, r2, d = residuePairs(ref, dom, rna, threshold, mode)
+        if len(r1):
+            pairs[ref[dom]['reslist'][r1[0]]] = {'dom1': dom, 'res2': ref[rna]['reslist'][r2[0]], 'dom2': rna}
+    return pairs
+
+
+def _stageIndex(params):
+    indexFile = params['conf'] + INDEX_SUFFIX
+    if os.path.exists(indexFile):
+        os.remove(indexFile)
+    return len(loadIndex(params['conf']))
+
+
+def _stageParse(params):
+    PDBparser(params['ref_file'], params['parsing'])
+    return len(PDBparserMulti(params['conf'], params['parsing']))
+
+
+def _stageRMSDprot(params):
+    ref = params['ref']
+    for model, conf in params['frames'].items():
+        RMSD_prot(ref, conf, params['rmsd_mode'])
+    return len(params['frames'])
+
+
+def _stageComputeRMSD(params):
+    computeRMSD(params['ref'], _frames(params), params['domains'], params['rmsd_mode'], params['output'] + ".rmsd")
+    return params['nframes']
+
+
+def _stageDistDico(params):
+    # double boucle Python sur les residus: mesuree sur la seule structure de reference
+    ref = params['ref']
+    dom, rna = params['domains'][0], params['rna']
+    for res1 in ref[dom]['reslist']:
+        for res2 in ref[rna]['reslist']:
+            distDico(ref[dom][res1], ref[rna][res2], params['mode'])
+    return 1
+
+
+def _stageDistMatrix(params):
+    # calcul des matrices seul: le rendu des heatmaps depend de matplotlib, pas de ce programme
+    for conf in params['frames'].values():
+        for dom in params['domains']:
+            resDistMatrix(conf, dom, params['rna'], params['mode'])
+    return len(params['frames'])
+
+
+def _stageInterface(params):
+    resInterface(_frames(params), params['domains'], params['rna'], params['threshold'], params['mode'],
+                 params['output'] + ".freq")
+    return params['nframes']
+
+
+def _stageContactTime(params):
+    pairs = _pairs(params['ref'], params['domains'], params['rna'], params['threshold'], params['mode'])
+    contactTime(pairs, _frames(params), params['threshold'], 10, params['mode'], params['output'] + ".cont")
+    return params['nframes']
+
+
+_RUNNERS = {"buildIndex": _stageIndex, "PDBparserMulti": _stageParse, "RMSD_prot": _stageRMSDprot,
+            "computeRMSD": _stageComputeRMSD, "distDico": _stageDistDico, "distMatrix": _stageDistMatrix,
+            "resInterface": _stageInterface, "contactTime": _stageContactTime}
+
+# etapes qui travaillent sur les conformations deja parsees (parsing fait avant la mesure), et celles qui
+# relisent le fichier dans chaque processus quand plusieurs processus sont demandes
+_NEEDS_FRAMES = ("RMSD_prot", "distMatrix")
+_PARALLEL = ("computeRMSD", "resInterface", "contactTime")
+
+
+def runStage(stage, params, repeat=3):
+    """
+    Mesure une etape dans le processus courant (voir _stageProcess pour une mesure isolee).
+    :param stage: Nom de l'etape (voir STAGES).
+    :param params: Parametres du benchmark (fichiers, domaines, seuil, mode, nombre de processus).
+    :param repeat: Nombre d'executions mesurees.
+    :return: Dictionnaire {'runs': durees (s), 'frames': nombre de conformations traitees, 'atoms', 'peak_rss_mb'}.
+    """
+    params = dict(params)
+    params['ref'] = PDBparser(params['ref_file'], params['parsing'])
+    if stage in _NEEDS_FRAMES or (stage in _PARALLEL and params['workers'] == 1):
+        params['frames'] = PDBparserMulti(params['conf'], params['parsing'])
+
+    runs = []
+    for i in range(repeat):
+        begin = time.perf_counter()
+        nb = _RUNNERS[stage](params)
+        runs.append(time.perf_counter() - begin)
+    return {'runs': runs, 'frames': nb, 'atoms': params['ref'].nAtoms, 'peak_rss_mb': peakRSS()}
+
+
+def _stageProcess(stage, params, repeat, conn):
+    """
+    Point d'entree du processus qui mesure une etape: renvoie le resultat (ou l'erreur) par le tube conn.
+    """
+    try:
+        conn.send(('ok', runStage(stage, params, repeat)))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def measureStage(stage, params, repeat=3):
+    """
+    Mesure une etape dans un nouveau processus, pour que le pic de memoire ne depende que de cette etape.
+    :return: Voir runStage, complete par la meilleure duree et les debits.
+    """
+    context = multiprocessing.get_context("spawn")
+    parentConn, childConn = context.Pipe(duplex=False)
+    proc = context.Process(target=_stageProcess, args=(stage, params, repeat, childConn))
+    proc.start()
+    childConn.close()
+    try:
+        status, result = parentConn.recv()
+    except EOFError:
+        status, result = 'error', "process exited with code %s" % proc.exitcode
+    proc.join()
+    if status != 'ok':
+        raise RuntimeError("Stage %s failed:\n%s" % (stage, result))
+
+    best = min(result['runs'])
+    result['seconds'] = best
+    result['frames_per_s'] = result['frames'] / best if best > 0 else None
+    result['atoms_per_s'] = result['frames'] * result['atoms'] / best if best > 0 else None
+    return result
+
+
+def environment():
+    """
+    :return: Description de la machine et des versions utilisees (pour interpreter les comparaisons).
+    """
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def runBenchmark(config, stages=STAGES, workdir=None, verbose=True):
+    """
+    Genere la dynamique synthetique decrite par config puis mesure chaque etape.
+    :param config: Dictionnaire {'atoms', 'domains', 'rna_fraction', 'frames', 'noise', 'seed', 'threshold', 'rmsd_mode',
+    'dist_mode', 'workers', 'repeat', 'gzip'}.
+    :param stages: Etapes a mesurer (voir STAGES).
+    :param workdir: Repertoire des fichiers generes (par defaut un repertoire temporaire, supprime a la fin).
+    :param verbose: Si True, affiche chaque etape mesuree.
+    :return: Le resultat (dictionnaire enregistrable en JSON).
+    """
+    unknown = [stage for stage in stages if stage not in _RUNNERS]
+    if unknown:
+        raise ValueError("Unknown stage(s): %s (available: %s)" % (", ".join(unknown), ", ".join(STAGES)))
+
+    temporary = workdir is None
+    if temporary:
+        workdir = tempfile.mkdtemp(prefix="mdtsl_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        domains = syntheticDomains(config['atoms'], config['domains'], config['rna_fraction'])
+        if not any(dom[0] == RNA_DOMAIN for dom in domains):
+            raise ValueError("The benchmark needs an RNA domain: rna_fraction must be positive")
+        suffix = ".pdb.gz" if config['gzip'] else ".pdb"
+        refFile = os.path.join(workdir, "ref" + suffix)
+        confFile = os.path.join(workdir, "conf" + suffix)
+
+        begin = time.perf_counter()
+        ref = writeSynthetic(refFile, confFile, domains, config['frames'], config['noise'], seed=config['seed'])
+        generation = time.perf_counter() - begin
+        if not config['gzip']:
+            loadIndex(confFile)   # index des MODEL construit une fois, hors mesure (sauf pour l'etape buildIndex)
+
+        protein = [dom[0] for dom in domains if dom[0] != RNA_DOMAIN]
+        params = {'ref_file': refFile, 'conf': confFile, 'domains': protein, 'rna': RNA_DOMAIN,
+                  'parsing': protein + [RNA_DOMAIN], 'threshold': config['threshold'], 'rmsd_mode': config['rmsd_mode'],
+                  'mode': config['dist_mode'],
+                  'workers': config['workers'], 'nframes': config['frames'], 'output': os.path.join(workdir, "out")}
+
+        result = {'format': RESULT_FORMAT, 'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'config': dict(config),
+                  'environment': environment(),
+                  'system': {'atoms': ref.nAtoms, 'residues': ref.nResidues, 'domains': [dom[0] for dom in domains],
+                             'generation_s': generation},
+                  'stages': {}}
+        for stage in stages:
+            if stage == "buildIndex" and config['gzip']:
+                continue   # pas d'index pour un fichier compresse (lecture sequentielle)
+            result['stages'][stage] = measureStage(stage, params, config['repeat'])
+            if verbose:
+                print(formatStage(stage, result['stages'][stage]))
+                sys.stdout.flush()
+        return result
+    finally:
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def formatStage(stage, measure):
+    """
+    :return: La ligne du tableau des resultats d'une etape.
+    """
+    rate = lambda value, fmt: fmt % value if value is not None else "-"
+    return "%-16s %10.4f s %12s frames/s %14s atoms/s %10s MB" % (
+        stage, measure['seconds'], rate(measure['frames_per_s'], "%.1f"), rate(measure['atoms_per_s'], "%.3g"),
+        rate(measure['peak_rss_mb'], "%.1f"))
+
+
+def compareResults(result, baseline, tolerance=0.10):
+    """
+    Compare un resultat a une reference obtenue avec la meme configuration.
+    :param result: Resultat (voir runBenchmark).
+    :param baseline: Resultat de reference.
+    :param tolerance: Hausse relative toleree (0.10: 10 %) de la duree et du pic de memoire de chaque etape.
+    :return: Liste des regressions, dictionnaires {'stage', 'metric', 'baseline', 'value', 'ratio'}.
+    """
+    if tolerance < 0:
+        raise ValueError("The tolerance must be positive: %s" % tolerance)
+    keys = set(result['config']) | set(baseline['config'])
+    differ = sorted(key for key in keys if key != 'repeat' and result['config'].get(key) != baseline['config'].get(key))
+    if differ:
+        raise ValueError("The baseline was run with another configuration (%s): no comparison" % ", ".join(differ))
+
+    regressions = []
+    for stage, measure in result['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        for metric in COMPARED:
+            old, new = baseline['stages'][stage].get(metric), measure.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append({'stage': stage, 'metric': metric, 'baseline': old, 'value': new,
+                                    'ratio': new / old})
+    return regressions
+
+
+def buildParser():
+    """
+    :return: L'analyseur des arguments de la ligne de commande.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the parsing and analysis stages on a synthetic protein/RNA trajectory.",
+        epilog="Stages: %s. The exit status is 1 when a regression is found with --compare." % ", ".join(STAGES))
+    parser.add_argument("--atoms", type=int, default=5000, help="approximate number of atoms (default 5000)")
+    parser.add_argument("--domains", type=int, default=4, help="number of protein domains (default 4)")
+    parser.add_argument("--rna-fraction", type=float, default=0.25, help="fraction of the atoms in the RNA (default 0.25)")
+    parser.add_argument("--frames", type=int, default=50, help="number of conformations (default 50)")
+    parser.add_argument("--noise", type=float, default=0.5, help="atomic displacement in Angstrom (default 0.5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic system (default 0)")
+    parser.add_argument("--threshold", type=float, default=9.0, help="contact threshold in Angstrom (default 9.0)")
+    parser.add_argument("--rmsd-mode", choices=("CM", "CA"), default="CM", help="RMSD mode (default CM)")
+    parser.add_argument("--dist-mode", choices=("CM", "atom"), default="CM", help="distance mode (default CM)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="processes for computeRMSD, resInterface and contactTime (default 1)")
+    parser.add_argument("--gzip", action="store_true", help="benchmark gzip-compressed input files")
+    parser.add_argument("--repeat", type=int, default=3, help="measured runs per stage, the best is kept (default 3)")
+    parser.add_argument("--stages", help="comma-separated stages to run (default all)")
+    parser.add_argument("--workdir", help="directory for the generated files (kept; default a temporary directory)")
+    parser.add_argument("-o", "--output", help="JSON file of the results")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative slowdown or memory growth flagged as a regression (default 0.10)")
+    return parser
+
+
+def main():
+    parser = buildParser()
+    args = parser.parse_args()
+    if args.repeat < 1 or args.workers < 1 or args.frames < 1:
+        parser.error("--repeat, --workers and --frames must be positive integers")
+    stages = STAGES if args.stages is None else [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    config = {'atoms': args.atoms, 'domains': args.domains, 'rna_fraction': args.rna_fraction, 'frames': args.frames,
+              'noise': args.noise, 'seed': args.seed, 'threshold': args.threshold,
+              'rmsd_mode': args.rmsd_mode, 'dist_mode': args.dist_mode,
+              'workers': args.workers, 'repeat': args.repeat, 'gzip': args.gzip}
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    try:
+        result = runBenchmark(config, stages, args.workdir)
+    except (ValueError, RuntimeError) as e:
+        parser.exit(2, "Error: %s\n" % e)
+    print("%d atoms, %d residues, %d frames" % (result['system']['atoms'], result['system']['residues'], args.frames))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        try:
+            regressions = compareResults(result, baseline, args.tolerance)
+        except ValueError as e:
+            parser.exit(2, "Error: %s\n" % e)
+        for reg in regressions:
+            print("REGRESSION %-16s %-12s %.4g -> %.4g (x%.2f)" % (reg['stage'], reg['metric'], reg['baseline'],
+                                                                  reg['value'], reg['ratio']))
+        if regressions:
+            sys.exit(1)
+        print("No regression (tolerance %.0f %%)" % (100 * args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
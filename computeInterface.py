@@ -10,9 +10,13 @@ between residues of proteins.
 """
 
 from RMSD import *
+from ParserPDB import iterFrames
+from neighbourSearch import CELL_BYTES, pairCodes, residuePairs, splitRows, tileRows
+from parallel import Accumulator, analyseFrames
+from plotting import pyplot, figurePath, saveFigure
+from writerPDB import FrameFormatter, PDBWriter
 
 import numpy as np
-import matplotlib.pyplot as plt
 import math
 
 
@@ -29,6 +33,9 @@ def distDico(res1, res2, mode):
         CM_res2 = centerOfMass(res2)
         minval = math.sqrt(distanceCarree(CM_res1, CM_res2))
 
+    elif mode == "atom" and hasattr(res1, 'coords') and hasattr(res2, 'coords'):  # vues sur une Structure
+        minval = math.sqrt(squaredDistances(res1.coords, res2.coords).min())
+
     elif mode == "atom":  # distance entre les atomes les plus proches des 2 residus
         minval = 1000000
         for atom1 in res1['atomlist']:
@@ -40,136 +47,285 @@ def distDico(res1, res2, mode):
     return minval
 
 
-def distMatrix(dico, dom1, dom2, mode):
+def squaredDistances(coords1, coords2):
+    """
+    Calcule les carres des distances entre tous les atomes de deux ensembles.
+    :param coords1: Tableau (n1, 3) des coordonnees du premier ensemble.
+    :param coords2: Tableau (n2, 3) des coordonnees du second ensemble.
+    :return: Tableau (n1, n2) des carres des distances.
+    """
+    diff = coords1[:, np.newaxis, :] - coords2[np.newaxis, :, :]
+    return (diff ** 2).sum(axis=2)
+
+
+def resDistMatrix(dico, dom1, dom2, mode, budget=None):
+    """
+    Calcule la matrice des distances entre les residus de 2 domaines, par blocs de residus dont les tableaux
+    temporaires tiennent dans budget (resultat identique a un calcul en une seule operation).
+    :param dico: Structure correspondant au complexe proteine-ARN.
+    :param dom1: Nom du premier domaine (lignes de la matrice).
+    :param dom2: Nom du second domaine (colonnes de la matrice).
+    :param mode: 'CM' pour la distance entre centres de masse, 'atom' pour la distance entre les 2 atomes les plus proches.
+    :param budget: Memoire maximale (en octets) des tableaux temporaires, neighbourSearch.MEMORY_BUDGET par defaut.
+    :return: Tableau (nombre de residus de dom1, nombre de residus de dom2) des distances en Angstrom.
+    """
+    if mode == "CM":
+        centers1 = dico.chainCenters(dom1)
+        centers2 = dico.chainCenters(dom2)
+        d2 = np.empty((len(centers1), len(centers2)), dtype=centers1.dtype)
+        rows = tileRows(len(centers2), CELL_BYTES, budget)
+        for start in range(0, len(centers1), rows):
+            d2[start:start + rows] = squaredDistances(centers1[start:start + rows], centers2)
+
+    elif mode == "atom":
+        d2 = _minAtomDistances(dico.coords[dico.chainAtoms(dom1)], dico.chainResOffsets(dom1),
+                               dico.coords[dico.chainAtoms(dom2)], dico.chainResOffsets(dom2), budget)
+
+    else:
+        raise ValueError("Unknown distance mode: %s" % mode)
+
+    return np.sqrt(d2)
+
+
+def _minAtomDistances(coords1, offsets1, coords2, offsets2, budget=None):
+    """
+    Carres des distances minimales entre les atomes de chaque couple de residus: minimum par blocs (residu x residu)
+    de la matrice des distances atome-atome, calculee par tuiles de residus entiers pour borner la memoire.
+    :param coords1, coords2: Coordonnees des atomes des 2 domaines.
+    :param offsets1, offsets2: Indices du premier atome de chaque residu, suivis du nombre d'atomes.
+    :return: Tableau (nombre de residus 1, nombre de residus 2).
+    """
+    sizes1 = np.diff(offsets1)
+    sizes2 = np.diff(offsets2)
+    d2 = np.empty((len(sizes1), len(sizes2)), dtype=coords1.dtype)
+    if d2.size == 0:
+        return d2
+
+    # colonnes: residus de dom2 par groupes d'environ la racine du nombre de cases permises (au moins un residu),
+    # lignes: autant de residus de dom1 que le budget le permet pour ces colonnes
+    cells = tileRows(1, CELL_BYTES, budget)
+    colGroups = splitRows(sizes2, max(int(np.sqrt(cells)), cells // max(len(coords1), 1)))
+    for c0, c1 in colGroups:
+        cols = coords2[offsets2[c0]:offsets2[c1]]
+        colOffsets = offsets2[c0:c1] - offsets2[c0]
+        for r0, r1 in splitRows(sizes1, tileRows(len(cols), CELL_BYTES, budget)):
+            tile = squaredDistances(coords1[offsets1[r0]:offsets1[r1]], cols)
+            tile = np.minimum.reduceat(tile, offsets1[r0:r1] - offsets1[r0], axis=0)
+            d2[r0:r1, c0:c1] = np.minimum.reduceat(tile, colOffsets, axis=1)
+    return d2
+
+
+def distMatrix(dico, dom1, dom2, mode, plotDir=".", plotFormat="png", show=False, budget=None):
     """
-    Calcule la matrice des distances entre 2 domaines proteiques ou entre 1 domaine et l'ARN.
-    :param dico: Dictionnaire correspondant au complexe proteine-ARN.
+    Calcule la matrice des distances entre 2 domaines proteiques ou entre 1 domaine et l'ARN, et la represente sous forme de heatmap.
+    :param dico: Structure correspondant au complexe proteine-ARN.
     :param dom1: Nom du premier domaine a utiliser.
     :param dom2: Nom du second domaine a utiliser.
     :param mode: Mode de calcul de la distance entre les domaines: par rapport au centre de masse ('CM') ou entre les 2 atomes les plus proches ('atom').
+    :param plotDir: Repertoire ou est ecrite la heatmap (distmat_<dom1>_<dom2>.png).
+    :param plotFormat: Format de la heatmap ('png' ou 'svg').
+    :param show: Si True, la heatmap est affichee dans une fenetre au lieu d'etre ecrite.
+    :param budget: Memoire maximale (en octets) du calcul des distances (voir resDistMatrix).
+    :return: La matrice des distances (tableau NumPy).
+    """
+    data = resDistMatrix(dico, dom1, dom2, mode, budget)
+    plotDistMatrix(data, dico[dom1]['reslist'], dico[dom2]['reslist'], dom1, dom2,
+                   figurePath(plotDir, "distmat_%s_%s" % (dom1, dom2), plotFormat), show)
+    return data
+
+
+def plotDistMatrix(data, list1, list2, dom1, dom2, output, show=False):
+    """
+    Represente une matrice de distances entre residus sous forme de heatmap (une image: rapide meme pour de grandes matrices).
+    :param data: Matrice des distances (tableau NumPy).
+    :param list1: Liste des residus du premier domaine (lignes).
+    :param list2: Liste des residus du second domaine (colonnes).
+    :param dom1: Nom du premier domaine.
+    :param dom2: Nom du second domaine.
+    :param output: Fichier de la heatmap (PNG ou SVG selon l'extension).
+    :param show: Si True, la heatmap est affichee dans une fenetre au lieu d'etre ecrite.
+    :return: Le fichier ecrit, ou None.
     """
-    list1 = dico[dom1]['reslist']  # liste des residus du premier domaine
-    list2 = dico[dom2]['reslist']  # liste des residus du second domaine
-    nb_row = len(list1)  # nombre de lignes de la matrice = nombre de residus dans le premier domaine
-    nb_col = len(list2)  # nombre de colonnes de la matrice = nombre de residus dans le second domaine
-    distmat = []
-    dic1 = dico[dom1]    # pour simplifier l'ecriture par la suite
-    dic2 = dico[dom2]
-
-    for i in range(nb_row):      # pour chaque residu  i du premier domaine ...
-        listi = []               # chaque ligne de la matrice est une liste
-        for j in range(nb_col):
-            dij = distDico(dic1[list1[i]], dic2[list2[j]],
-                           mode)  # ... on calcule sa distance avec le j-eme residu du second domaine
-            listi.append(dij)     # et on ajoute cette distance a la liste representant la i-eme ligne de la matrice
-        distmat.append(listi)     # la ligne est ajoutee a la matrice : distmat est une liste de liste
-
-    # Representer la matrice sous forme de heatmap
-    data = np.array(distmat).reshape(nb_row, nb_col)        # la matrice est transformee en array
-    plt.pcolor(data, cmap="RdBu_r")                         # choix du systeme de coloration
-    plt.xticks(np.arange(nb_col) + 0.5, list2, fontsize=5)  # positionnement des etiquettes sur l'abscisse
-    plt.yticks(np.arange(nb_row) + 0.5, list1, fontsize=5)  # idem sur l'ordonnee
+    plt = pyplot(show)
+    nb_row, nb_col = data.shape
+    fig = plt.figure()
+    # une cellule par couple de residus, la premiere ligne en bas comme avec pcolor
+    plt.imshow(data, cmap="RdBu_r", origin="lower", aspect="auto", interpolation="nearest")
+    plt.xticks(np.arange(nb_col), list2, fontsize=5)  # positionnement des etiquettes sur l'abscisse
+    plt.yticks(np.arange(nb_row), list1, fontsize=5)  # idem sur l'ordonnee
     plt.xlabel(dom2)     # le domaine 2 est represente par les colonnes (abscisse) de la matrice
     plt.ylabel(dom1)
     cb = plt.colorbar()  # ajout d'une echelle des couleurs
     cb.set_label('Distance between residues of %s and %s\nin Angstrom'%(dom1,dom2)) # titre de la legende
-    plt.show()
+    return saveFigure(fig, output, show)
 
 
 # ------------------------------------------------------------------------------------------
 def resInterface(dico, prot_domains, rna_dom, threshold, mode, output, **writing_param):
     """
     Calcule les frequences d'appartenance a l'interface proteine/ARN pour chacun des residus de la proteine, et les retourne dans un fichier texte de sortie.
-    :param dico: Dictionnaire representant le complexe proteine/ARN.
+    :param dico: Dictionnaire representant le complexe proteine/ARN, iterable de couples (modele, Structure) parcouru une seule fois,
+    ou ParallelFrames.
     :param prot_domains: Liste contenant les noms des domaines proteiques a considerer.
     :param rna_dom: Nom du domaine correspondant a l'ARN.
     :param threshold: Seuil en Angstrom, correspond a la distance ARN-residu en-dessous de laquelle le residu appartient a l'interface.
     :param mode: Mode de calcul de la distance entre les domaines.
     :param output: Fichier texte contenant les frequences non nulles d'appartenance a l'interface des residus.
     :param writing_param: Parametre optionnel: si present, le dictionnaire d'entree est modifie en ajoutant pour chaque residu le B-factor (0.00 si le residu n'appartient pas a l'interface, 1.00 sinon).
+    writePDB est le fichier pdb de sortie (compresse si son extension est .gz), writeModels les numeros des modeles a y ecrire (par defaut tous).
     :return: Dictionnaire correspondant aux residus dont la frequence d'appartenance a l'interface est non nulle.
     """
-    inInterface = dict()
-    for dom in prot_domains:              # pour chaque domaine proteique ...
-        inInterface[dom] = dict()         # ... on cree un dictionnaire de dictionnaire
-        inInterface[dom]['reslist'] = []  # contiendra la liste des residus du domaine
-        for model in dico.keys():
-            for res1 in dico[model][dom]['reslist']:  # pour chaque residu
-                if res1 not in inInterface[dom]['reslist']:  # si le residu n'a pas encore ete traite pour ce domaine
-                    inInterface[dom][res1] = 0               # on initialise a 0 le nombre de fois qu'il se trouve dans l'interface
-                    inInterface[dom]['reslist'].append(res1) # on ajoute le residu dans la liste
-
-                min = 60                  # initialisation de la distance minimale residu-ARN
-
-                for res2 in dico[model][rna_dom]['reslist']:
-                    d = distDico(dico[model][dom][res1], dico[model][rna_dom][res2],
-                                 mode)    # on calcule la distance entre le residu et tous les nucleotides de l'ARN
-                    dico[model][rna_dom][res2]['bfactor'] = 0.00
-                    if d < min:           # si la distance entre le residu et le nucleotide est plus petite que la valeur minimale
-                        min = d           # min sera donc la distance entre le residu et le nucleotide le plus proche
-
-                if min <= threshold:
-                    inInterface[dom][res1] = inInterface[dom][res1] + 1
-                    dico[model][dom][res1]['bfactor'] = 1.00
-                else:
-                    dico[model][dom][res1]['bfactor'] = 0.00
-
     # Optionnel: remet le dictionnaire modifie au format pdb, pour une visualisation dans PyMol
-    if 'writePDB' in writing_param:
-        writePDBframes(dico, writing_param['writePDB'], prot_domains, rna_dom)
-
-    # Retourne les frequences (si non nulles) dans un fichier texte:
-    f = open(output, "w")
-    res_interface = dict()
-    for dom in inInterface.keys():
-        res_interface[dom] = dict()
-        f.write("Domain " + dom + "\n\tResidue\tFrequence\n")
-        for res in inInterface[dom]['reslist']:
-            freq = inInterface[dom][res] / len(dico.keys())
-            if freq != 0:
-                f.write("\t" + res + "\t" + str(freq) + "\n")
-                res_interface[dom][res] = freq
-    f.close()
+    return analyseFrames(dico, [InterfaceAccumulator(prot_domains, rna_dom, threshold, mode, output,
+                                                     writing_param.get('writeModels'))],
+                         writing_param.get('writePDB'))[0]
 
-    return res_interface
 
+class InterfaceAccumulator(Accumulator):
+    """
+    Nombre de conformations ou chaque residu de la proteine appartient a l'interface avec l'ARN (voir analyseFrames).
+    Les B-factors des residus de chaque conformation sont mis a jour (1.00 dans l'interface, 0.00 sinon), et la conformation
+    est ecrite dans le fichier pdb de sortie s'il y en a un.
+    """
 
-def writePDBframes(dico, output, list_dom_prot, rna_dom):
+    stage = "interface"
+
+    def __init__(self, prot_domains, rna_dom, threshold, mode, output, writeModels=None, budget=None):
+        """
+        :param prot_domains: Liste contenant les noms des domaines proteiques a considerer.
+        :param rna_dom: Nom du domaine correspondant a l'ARN.
+        :param threshold: Seuil en Angstrom definissant l'interface.
+        :param mode: Mode de calcul de la distance entre les domaines.
+        :param output: Fichier texte contenant les frequences non nulles d'appartenance a l'interface des residus.
+        :param writeModels: Numeros des modeles ecrits dans le fichier pdb de sortie (par defaut tous).
+        :param budget: Memoire maximale (en octets) de la recherche des voisins (voir neighbourSearch.neighbourPairs).
+        """
+        self.prot_domains = prot_domains
+        self.rna_dom = rna_dom
+        self.threshold = threshold
+        self.mode = mode
+        self.output = output
+        self.writeModels = None if writeModels is None else set(str(model) for model in writeModels)
+        self.budget = budget
+        self.reset()
+
+    def reset(self):
+        self.inInterface = dict()
+        for dom in self.prot_domains:              # pour chaque domaine proteique ...
+            self.inInterface[dom] = dict()         # ... on cree un dictionnaire de dictionnaire
+            self.inInterface[dom]['reslist'] = []  # contiendra la liste des residus du domaine
+        self.nb_frames = 0
+        self.formatter = FrameFormatter(list(self.prot_domains) + [self.rna_dom])   # gabarit des lignes ATOM
+        self._topology = None   # topologie des conformations comptees dans _hits, pas encore reportees dans inInterface
+        self._hits = None
+
+    def cacheKey(self):
+        return ('interface', list(self.prot_domains), self.rna_dom, self.threshold, self.mode)
+
+    def update(self, model, conf, memo, fout=None):
+        if self._topology is None or not conf.sameTopology(self._topology):
+            self._flush()
+            self._topology = conf
+            self._hits = dict((dom, np.zeros(len(conf.chainResList(dom)), dtype=np.int64)) for dom in self.prot_domains)
+        self.nb_frames += 1
+        first, last = conf.chainOffsets[self.rna_dom]
+        conf.resBfactors[first:last] = 0.00   # les nucleotides de l'ARN ont un B-factor nul
+
+        for dom in self.prot_domains:
+            # residus du domaine ayant au moins un nucleotide de l'ARN a moins de 'threshold' Angstrom
+            hits = np.zeros(len(self._hits[dom]), dtype=bool)
+            hits[residuePairs(conf, dom, self.rna_dom, self.threshold, self.mode, memo, self.budget)[0]] = True
+
+            first, last = conf.chainOffsets[dom]
+            conf.resBfactors[first:last] = hits   # 1.00 si le residu appartient a l'interface, 0.00 sinon
+            self._hits[dom] += hits
+
+        if fout is not None and (self.writeModels is None or str(model) in self.writeModels):
+            writePDBframe(fout, model, conf, self.prot_domains, self.rna_dom, self.formatter)
+
+    def _flush(self):
+        """
+        Reporte dans inInterface les comptages des conformations de meme topologie accumules depuis le dernier appel.
+        """
+        if self._topology is None:
+            return
+        for dom in self.prot_domains:
+            counts = self.inInterface[dom]
+            for res1, nb in zip(self._topology.chainResList(dom), self._hits[dom].tolist()):
+                if res1 not in counts:                 # si le residu n'a pas encore ete traite pour ce domaine
+                    counts[res1] = 0                   # on initialise a 0 le nombre de fois qu'il se trouve dans l'interface
+                    counts['reslist'].append(res1)     # on ajoute le residu dans la liste
+                counts[res1] += nb
+        self._topology = None
+        self._hits = None
+
+    def partial(self):
+        """
+        :return: Le dictionnaire {domaine: {'reslist': [...], residu: nombre de conformations}} et le nombre de conformations.
+        """
+        self._flush()
+        return self.inInterface, self.nb_frames
+
+    def merge(self, partial):
+        self._flush()
+        inInterface, nb = partial
+        self.nb_frames += nb
+        for dom in self.prot_domains:          # fusion des comptages, dans l'ordre des conformations
+            for res1 in inInterface[dom]['reslist']:
+                if res1 not in self.inInterface[dom]:
+                    self.inInterface[dom][res1] = 0
+                    self.inInterface[dom]['reslist'].append(res1)
+                self.inInterface[dom][res1] += inInterface[dom][res1]
+
+    def finish(self):
+        """
+        Retourne les frequences (si non nulles) dans le fichier texte de sortie.
+        :return: Dictionnaire correspondant aux residus dont la frequence d'appartenance a l'interface est non nulle.
+        """
+        self._flush()
+        f = open(self.output, "w")
+        res_interface = dict()
+        for dom in self.inInterface.keys():
+            res_interface[dom] = dict()
+            f.write("Domain " + dom + "\n\tResidue\tFrequence\n")
+            for res in self.inInterface[dom]['reslist']:
+                freq = self.inInterface[dom][res] / self.nb_frames
+                if freq != 0:
+                    f.write("\t" + res + "\t" + str(freq) + "\n")
+                    res_interface[dom][res] = freq
+        f.close()
+
+        return res_interface
+
+
+def writePDBframes(dico, output, list_dom_prot, rna_dom, models=None):
     """
     Utilise un dictionnaire contenant plusieurs conformations pour ecrire un fichier pdb visualisable sous PyMol.
-    :param dico: Dictionnaire contenant les differentes conformations.
-    :param output: Nom du fichier de sortie.
+    :param dico: Dictionnaire (ou iterable de couples (modele, Structure)) contenant les differentes conformations.
+    :param output: Nom du fichier de sortie (compresse avec gzip si son extension est .gz).
     :param list_dom_prot: Liste des domaines proteiques.
     :param rna_dom: Domaine correspondant a l'ARN.
+    :param models: Numeros des modeles a ecrire (par defaut tous).
     :return: Un fichier pdb au format ATOM.
     """
+    with PDBWriter(output, list(list_dom_prot) + [rna_dom], models) as writer:
+        for model, conf in iterFrames(dico):
+            writer.write(model, conf)
 
-    fout = open(output, "w")
 
-    for model in dico.keys():
-        fout.write("MODEL\t" + str(model) + "\n")
-
-        for dom in list_dom_prot:
-            for res in dico[model][dom]['reslist']:
-                for atom in dico[model][dom][res]['atomlist']:
-                    fout.write(
-                        "{:6s}{:5s} {:4s}{:1s}{:3s} {:1s}{:4s}{:1s}   {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}       {:^4s}\n".format(
-                            "ATOM", dico[model][dom][res][atom]['id'], atom, '', dico[model][dom][res]['resname'],
-                            '', res, '', dico[model][dom][res][atom]['x'], dico[model][dom][res][atom]['y'],
-                            dico[model][dom][res][atom]['z'],
-                            1.00, dico[model][dom][res]['bfactor'], dom))
-
-        for dom2 in rna_dom:
-            for nucl in dico[model][dom2]['reslist']:
-                for atom in dico[model][dom2][nucl]['atomlist']:
-                    fout.write(
-                        "{:6s}{:5s} {:4s}{:1s}{:3s} {:1s}{:4s}{:1s}   {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}       {:^4s}\n".format(
-                            "ATOM", dico[model][dom2][nucl][atom]['id'], atom, '', dico[model][dom2][nucl]['resname'],
-                            '', nucl, '', dico[model][dom2][nucl][atom]['x'], dico[model][dom2][nucl][atom]['y'],
-                            dico[model][dom2][nucl][atom]['z'],
-                            1.00, 0.00, dom2))
-        fout.write("ENDMDL\n")
-    fout.close()
+def writePDBframe(fout, model, conf, list_dom_prot, rna_dom, formatter=None):
+    """
+    Ecrit une conformation (bloc MODEL ... ENDMDL) dans un fichier pdb deja ouvert.
+    :param fout: Fichier de sortie ouvert en ecriture.
+    :param model: Numero du modele.
+    :param conf: Structure correspondant a la conformation.
+    :param list_dom_prot: Liste des domaines proteiques.
+    :param rna_dom: Domaine correspondant a l'ARN.
+    :param formatter: FrameFormatter a reutiliser d'une conformation a l'autre (il garde le gabarit des lignes ATOM).
+    """
+    if formatter is None:
+        formatter = FrameFormatter(list(list_dom_prot) + [rna_dom])
+    fout.write(formatter.format(model, conf))
 
 
 # -------------------------------------------------------------------------
@@ -177,28 +333,100 @@ def contactTime(pairs, frames_dico, threshold, duration, mode, output):
     """
     Calcule le temps de contact entre differentes paires de residus.
     :param pairs: Dictionnaire contenant les paires de residus.
-    :param frames_dico: Dictionnaire contenant toutes les conformations.
+    :param frames_dico: Dictionnaire contenant toutes les conformations, iterable de couples (modele, Structure) parcouru une seule fois,
+    ou ParallelFrames.
     :param threshold: Seuil (en Angstrom) pour definir le contact.
     :param duration: Duree de la dynamique.
     :param mode: Mode de calcul des distances.
     :param output: Nom du fichier de sortie.
     :return: Fichier texte contenant les temps de contact entre paires de residus.
     """
-    f=open(output, "w")
-
-    for res in pairs.keys():
-        pairs[res]['contact time'] = 0      # nombre de conformations pour lesquelles les residus sont en contact
-        for model in frames_dico.keys():
-            d = distDico(frames_dico[model][pairs[res]['dom1']][res], frames_dico[model][pairs[res]['dom2']][pairs[res]['res2']], mode)
-            if d <= threshold:
-                pairs[res]['contact time'] += 1
-
-        pairs[res]['contact time'] = pairs[res]['contact time']*duration/len(frames_dico.keys()) # duree de contact
-
-        f.write("Residue " + res + "(domain " + pairs[res]['dom1'] + ") - " + "Residue " + pairs[res]['res2'] + "(domain " + pairs[res]['dom2'] + ") : " +
-                str(pairs[res]['contact time']) + " ns\n")
-
-    f.close()
+    analyseFrames(frames_dico, [ContactAccumulator(pairs, threshold, duration, mode, output)])
 
 
+class ContactAccumulator(Accumulator):
+    """
+    Nombre de conformations ou chaque paire de residus est en contact, converti en temps de contact (voir analyseFrames).
+    """
 
+    stage = "contacts"
+
+    def __init__(self, pairs, threshold, duration, mode, output, budget=None):
+        """
+        :param pairs: Dictionnaire contenant les paires de residus.
+        :param threshold: Seuil (en Angstrom) pour definir le contact.
+        :param duration: Duree de la dynamique.
+        :param mode: Mode de calcul des distances.
+        :param output: Nom du fichier de sortie.
+        :param budget: Memoire maximale (en octets) de la recherche des voisins (voir neighbourSearch.neighbourPairs).
+        """
+        self.pairs = pairs
+        self.threshold = threshold
+        self.duration = duration
+        self.mode = mode
+        self.output = output
+        self.budget = budget
+
+        # les paires sont regroupees par couple de domaines: une seule recherche de voisins par couple et par conformation
+        self.domPairs = dict()
+        for res in pairs.keys():
+            self.domPairs.setdefault((pairs[res]['dom1'], pairs[res]['dom2']), []).append(res)
+        self.reset()
+
+    def reset(self):
+        self.counts = dict()     # nombre de conformations pour lesquelles les residus sont en contact
+        for res in self.pairs.keys():
+            self.counts[res] = 0
+        self.nb_frames = 0
+
+    def cacheKey(self):
+        return ('contacts', sorted((res, pair['dom1'], pair['res2'], pair['dom2']) for res, pair in self.pairs.items()),
+                self.threshold, self.mode)
+
+    def _pairCodes(self, conf, dom1, dom2, residues):
+        """
+        :return: Le code r1 * n2 + r2 (rangs dans 'reslist', voir pairCodes) de la paire de chaque residu de residues,
+        calcule une seule fois pour la topologie de conf.
+        """
+        pairs = tuple((res, self.pairs[res]['res2']) for res in residues)
+        return conf.selection(('contactCodes', dom1, dom2, pairs), lambda: pairCodes(conf, dom1, dom2, pairs))
+
+    def update(self, model, conf, memo, fout=None):
+        self.nb_frames += 1
+        for (dom1, dom2), residues in self.domPairs.items():
+            codes = self._pairCodes(conf, dom1, dom2, residues)
+            r1, r2, d = residuePairs(conf, dom1, dom2, self.threshold, self.mode, memo, self.budget)
+            n2 = len(conf.chainResList(dom2))
+            inContact = np.isin(codes, r1.astype(np.int64) * n2 + r2)
+            for res, hit in zip(residues, inContact.tolist()):
+                if hit:
+                    self.counts[res] += 1
+
+    def partial(self):
+        """
+        :return: Le dictionnaire {residu: nombre de conformations en contact} et le nombre de conformations.
+        """
+        return self.counts, self.nb_frames
+
+    def merge(self, partial):
+        counts, nb = partial
+        self.nb_frames += nb
+        for res in self.pairs.keys():
+            self.counts[res] += counts[res]
+
+    def finish(self):
+        """
+        Ecrit les temps de contact dans le fichier de sortie.
+        :return: Le dictionnaire des paires, complete par le temps de contact ('contact time') de chaque paire.
+        """
+        pairs = self.pairs
+        f=open(self.output, "w")
+
+        for res in pairs.keys():
+            pairs[res]['contact time'] = self.counts[res]*self.duration/self.nb_frames # duree de contact
+
+            f.write("Residue " + res + "(domain " + pairs[res]['dom1'] + ") - " + "Residue " + pairs[res]['res2'] + "(domain " + pairs[res]['dom2'] + ") : " +
+                    str(pairs[res]['contact time']) + " ns\n")
+
+        f.close()
+        return pairs
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: All-pairs contact map: number of conformations in which each pair of residues of two
+different domains (protein-protein and protein-RNA) is in contact, found with the neighbour search
+and stored as a sparse matrix (CSR, in the .npz layout of scipy.sparse.save_npz).
+"""
+
+import numpy as np
+
+from neighbourSearch import residuePairs
+from parallel import Accumulator
+
+
+class ContactMap(object):
+    """
+    Matrice creuse (residus x residus) du nombre de conformations en contact de chaque paire de residus,
+    stockee au format COO (lignes, colonnes, comptages) avec ligne < colonne.
+    """
+
+    def __init__(self, chains, residues, rows, cols, counts, nFrames):
+        """
+        :param chains: Domaine de chaque residu (lignes et colonnes de la matrice).
+        :param residues: Numero de chaque residu.
+        :param rows, cols: Indices des residus de chaque paire en contact au moins une fois.
+        :param counts: Nombre de conformations en contact de chaque paire.
+        :param nFrames: Nombre de conformations.
+        """
+        self.chains = np.asarray(chains, dtype=str)
+        self.residues = np.asarray(residues, dtype=str)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.nFrames = nFrames
+
+    @property
+    def shape(self):
+        return len(self.residues), len(self.residues)
+
+    def frequencies(self):
+        """
+        :return: La frequence de contact (fraction des conformations) de chaque paire en contact.
+        """
+        return self.counts / self.nFrames
+
+    def csr(self):
+        """
+        :return: Les tableaux (indptr, indices, data) du format CSR (scipy.sparse.csr_matrix((data, indices, indptr))).
+        """
+        order = np.lexsort((self.cols, self.rows))
+        indptr = np.searchsorted(self.rows[order], np.arange(self.shape[0] + 1))
+        return indptr, self.cols[order], self.counts[order]
+
+    def toDense(self):
+        """
+        :return: La matrice pleine (symetrique) des comptages; a reserver aux petits systemes.
+        """
+        dense = np.zeros(self.shape, dtype=np.int64)
+        dense[self.rows, self.cols] = self.counts
+        dense[self.cols, self.rows] = self.counts
+        return dense
+
+    def count(self, dom1, res1, dom2, res2):
+        """
+        :return: Le nombre de conformations ou les residus res1 (domaine dom1) et res2 (domaine dom2) sont en contact.
+        """
+        i = np.flatnonzero((self.chains == dom1) & (self.residues == res1))
+        j = np.flatnonzero((self.chains == dom2) & (self.residues == res2))
+        if len(i) == 0 or len(j) == 0:
+            raise KeyError("Unknown residue: %s" % ((dom1, res1) if len(i) == 0 else (dom2, res2),))
+        i, j = min(i[0], j[0]), max(i[0], j[0])
+        hit = np.flatnonzero((self.rows == i) & (self.cols == j))
+        return int(self.counts[hit[0]]) if len(hit) else 0
+
+    def save(self, output):
+        """
+        Enregistre la carte au format CSR de scipy.sparse.save_npz (lisible par scipy.sparse.load_npz),
+        avec les etiquettes des residus et le nombre de conformations.
+        """
+        indptr, indices, data = self.csr()
+        with open(output, "wb") as f:
+            np.savez(f, format=np.array("csr"), shape=np.array(self.shape), indptr=indptr, indices=indices, data=data,
+                     chains=self.chains, residues=self.residues, nFrames=self.nFrames)
+
+    def writeSummary(self, output, duration=None):
+        """
+        Ecrit les paires en contact au moins une fois, par frequence de contact decroissante.
+        :param output: Fichier texte de sortie.
+        :param duration: Duree de la dynamique (en ns), optionnelle: ajoute le temps de contact de chaque paire.
+        """
+        order = np.lexsort((self.cols, self.rows, -self.counts))
+        f = open(output, "w")
+        f.write("dom1\tres1\tdom2\tres2\tframes\tfrequency" + ("\tcontact_time_ns" if duration is not None else "") + "\n")
+        for k in order.tolist():
+            i, j, nb = self.rows[k], self.cols[k], self.counts[k]
+            row = [self.chains[i], self.residues[i], self.chains[j], self.residues[j], str(nb), str(nb / self.nFrames)]
+            if duration is not None:
+                row.append(str(nb * duration / self.nFrames))
+            f.write("\t".join(row) + "\n")
+        f.close()
+
+
+def loadContactMap(output):
+    """
+    :param output: Fichier .npz ecrit par ContactMap.save.
+    :return: La ContactMap.
+    """
+    with np.load(output) as data:
+        indptr = data['indptr']
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return ContactMap(data['chains'], data['residues'], rows, data['indices'], data['data'], int(data['nFrames']))
+
+
+class ContactMapAccumulator(Accumulator):
+    """
+    Carte des contacts entre tous les residus de domaines differents (voir analyseFrames).
+    Chaque paire est codee par i * n_residus + j (i < j, indices des residus dans la Structure); les codes des
+    conformations sont regroupes periodiquement (np.unique) pour que la memoire ne depende que des paires en contact.
+    """
+
+    stage = "contactmap"
+
+    def __init__(self, threshold, mode, domains=None, output=None, summary=None, duration=None, compactSize=1 << 20,
+                 budget=None):
+        """
+        :param threshold: Seuil (en Angstrom) pour definir le contact.
+        :param mode: Mode de calcul des distances.
+        :param domains: Domaines a considerer (par defaut tous les domaines parses).
+        :param output: Fichier .npz optionnel de la matrice creuse.
+        :param summary: Fichier texte optionnel des paires en contact (voir ContactMap.writeSummary).
+        :param duration: Duree de la dynamique (en ns) pour le resume, optionnelle.
+        :param compactSize: Nombre de codes en attente au-dela duquel ils sont regroupes.
+        :param budget: Memoire maximale (en octets) de la recherche des voisins (voir neighbourSearch.neighbourPairs).
+        """
+        self.threshold = threshold
+        self.mode = mode
+        self.domains = domains
+        self.output = output
+        self.summary = summary
+        self.duration = duration
+        self.compactSize = compactSize
+        self.budget = budget
+        self.reset()
+
+    def reset(self):
+        self.labels = None
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._nbPending = 0
+        self.nb_frames = 0
+        self._topology = None
+
+    def cacheKey(self):
+        return ('contactmap', self.threshold, self.mode, None if self.domains is None else list(self.domains))
+
+    def _addCounts(self, codes, counts):
+        """
+        Ajoute des comptages (eventuellement plusieurs fois le meme code) aux comptages deja connus.
+        """
+        weights = np.concatenate([self.counts, counts])
+        self.codes, inverse = np.unique(np.concatenate([self.codes, codes]), return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=weights, minlength=len(self.codes)).astype(np.int64)
+
+    def _compact(self):
+        """
+        Regroupe les codes en attente avec les comptages deja connus.
+        """
+        if self._pending:
+            codes = np.concatenate(self._pending)
+            self._pending = []
+            self._nbPending = 0
+            self._addCounts(codes, np.ones(len(codes), dtype=np.int64))
+
+    def update(self, model, conf, memo, fout=None):
+        if self._topology is None:
+            self._topology = conf
+            domains = self.domains if self.domains is not None else list(conf.chainOffsets)
+            # domaines dans l'ordre de la Structure: pour dom1 avant dom2, les indices verifient i < j
+            self._domains = sorted(domains, key=lambda dom: conf.chainOffsets[dom][0])
+            self.labels = (conf.resChain.tolist(), conf.resList.tolist())
+        elif not conf.sameTopology(self._topology):
+            raise ValueError("Model %s does not have the same atoms as the first model: no common contact map" % model)
+
+        self.nb_frames += 1
+        n = conf.nResidues
+        for a, dom1 in enumerate(self._domains):
+            for dom2 in self._domains[a + 1:]:
+                r1, r2, d = residuePairs(conf, dom1, dom2, self.threshold, self.mode, memo, self.budget)
+                if len(r1):
+                    codes = (r1.astype(np.int64) + conf.chainOffsets[dom1][0]) * n + r2 + conf.chainOffsets[dom2][0]
+                    self._pending.append(codes)
+                    self._nbPending += len(codes)
+        if self._nbPending >= self.compactSize:
+            self._compact()
+
+    def partial(self):
+        """
+        :return: Les etiquettes (domaines, residus), les codes des paires, leurs comptages et le nombre de conformations.
+        """
+        self._compact()
+        return self.labels, self.codes, self.counts, self.nb_frames
+
+    def merge(self, partial):
+        labels, codes, counts, nb = partial
+        if labels is None:   # aucune conformation dans cette partie
+            return
+        if self.labels is None:
+            self.labels = labels
+        elif labels != self.labels:
+            raise ValueError("The conformations do not all have the same residues: no common contact map")
+        self.nb_frames += nb
+        self._addCounts(codes, counts)
+
+    def finish(self):
+        """
+        Enregistre la matrice creuse et son resume.
+        :return: La ContactMap.
+        """
+        self._compact()
+        chains, residues = self.labels if self.labels is not None else ([], [])
+        n = len(residues)
+        contactMap = ContactMap(chains, residues, self.codes // max(n, 1), self.codes % max(n, 1), self.counts,
+                                self.nb_frames)
+        if self.output is not None:
+            contactMap.save(self.output)
+        if self.summary is not None:
+            contactMap.writeSummary(self.summary, self.duration)
+        return contactMap
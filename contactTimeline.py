@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Contact timelines: the contact state of each pair of residues in each conformation,
+stored as packed bit arrays (one bit per pair and per frame). Lifetimes, residence-time distributions,
+longest contacts and sliding-window occupancies are derived from the bits without any distance
+computation, and new frames can be appended as a simulation runs.
+"""
+
+import numpy as np
+
+from neighbourSearch import pairCodes, residuePairs
+from parallel import Accumulator
+
+# nombre de bits a 1 de chaque octet
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def pairList(pairs):
+    """
+    :param pairs: Dictionnaire des paires au format de contactTime ({residu1: {'dom1', 'res2', 'dom2'}}),
+    ou liste de quadruplets (domaine1, residu1, domaine2, residu2).
+    :return: La liste des quadruplets (domaine1, residu1, domaine2, residu2).
+    """
+    if isinstance(pairs, dict):
+        return [(p['dom1'], res1, p['dom2'], p['res2']) for res1, p in pairs.items()]
+    return [tuple(str(x) for x in pair) for pair in pairs]
+
+
+class ContactTimeline(object):
+    """
+    Etat de contact (bit a 1: en contact) de chaque paire de residus dans chaque conformation.
+    Les bits d'une paire sont ranges par ordre des conformations, 8 conformations par octet.
+    """
+
+    def __init__(self, pairs, bits=None, nFrames=0, models=()):
+        """
+        :param pairs: Liste des quadruplets (domaine1, residu1, domaine2, residu2), ou dictionnaire (voir pairList).
+        :param bits: Tableau (n_pairs, n_octets) des bits deja connus (np.packbits sur l'axe des conformations).
+        :param nFrames: Nombre de conformations deja connues.
+        :param models: Numero du modele de chaque conformation.
+        """
+        self.pairs = pairList(pairs)
+        self.nFrames = nFrames
+        self.models = [str(model) for model in models]
+        self._bits = np.zeros((len(self.pairs), 64), dtype=np.uint8)
+        if bits is not None:
+            self._reserve(bits.shape[1])
+            self._bits[:, :bits.shape[1]] = bits
+
+    @property
+    def nPairs(self):
+        return len(self.pairs)
+
+    @property
+    def bits(self):
+        """
+        :return: Le tableau (n_pairs, ceil(n_frames / 8)) des bits.
+        """
+        return self._bits[:, :(self.nFrames + 7) // 8]
+
+    def _reserve(self, nBytes):
+        """
+        Agrandit (en doublant la capacite) le tableau des bits pour contenir nBytes octets par paire.
+        """
+        if nBytes > self._bits.shape[1]:
+            bits = np.zeros((self.nPairs, max(nBytes, 2 * self._bits.shape[1])), dtype=np.uint8)
+            bits[:, :self._bits.shape[1]] = self._bits
+            self._bits = bits
+
+    def append(self, states, models=None):
+        """
+        Ajoute des conformations a la fin de la chronologie.
+        :param states: Tableau booleen (n_pairs,) d'une conformation ou (n_frames, n_pairs) de plusieurs conformations.
+        :param models: Numero du modele de chaque conformation ajoutee.
+        """
+        states = np.asarray(states, dtype=bool).reshape(-1, self.nPairs).T
+        nb = states.shape[1]
+        if nb == 0:
+            return
+        first = self.nFrames // 8
+        head = self.nFrames % 8
+        if head:   # complete le dernier octet, deja partiellement rempli
+            states = np.concatenate([np.unpackbits(self._bits[:, first:first + 1], axis=1)[:, :head].astype(bool),
+                                     states], axis=1)
+        packed = np.packbits(states, axis=1)
+        self._reserve(first + packed.shape[1])
+        self._bits[:, first:first + packed.shape[1]] = packed
+        self.nFrames += nb
+        if models is None:
+            models = range(len(self.models), len(self.models) + nb)
+        self.models.extend(str(model) for model in models)
+
+    def states(self, rows=slice(None), start=0, stop=None):
+        """
+        :param rows: Paires selectionnees (indice, slice ou tableau d'indices).
+        :param start, stop: Conformations selectionnees.
+        :return: Tableau booleen (paires, conformations) des etats de contact.
+        """
+        bits = self.bits[rows]
+        return np.unpackbits(bits, axis=-1, count=self.nFrames)[..., start:stop].astype(bool)
+
+    def _chunks(self, chunkSize=1024):
+        """
+        :return: Generateur de couples (slice des paires, etats de contact de ces paires), pour borner la memoire.
+        """
+        for i in range(0, self.nPairs, chunkSize):
+            rows = slice(i, min(i + chunkSize, self.nPairs))
+            yield rows, self.states(rows)
+
+    def counts(self):
+        """
+        :return: Le nombre de conformations en contact de chaque paire.
+        """
+        return _POPCOUNT[self.bits].sum(axis=1)
+
+    def occupancy(self):
+        """
+        :return: La fraction des conformations en contact de chaque paire.
+        """
+        return self.counts() / self.nFrames
+
+    def contactTimes(self, duration):
+        """
+        :param duration: Duree de la dynamique (en ns).
+        :return: Le temps de contact de chaque paire, comme contactTime.
+        """
+        return self.counts() * duration / self.nFrames
+
+    def runs(self):
+        """
+        Intervalles de contact ininterrompu de toutes les paires.
+        :return: Trois tableaux (paire, premiere conformation, duree en conformations), tries par paire puis par debut.
+        """
+        list_pair, list_start, list_length = [], [], []
+        for rows, states in self._chunks():
+            edges = np.diff(np.pad(states.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+            pair, start = np.nonzero(edges == 1)     # debuts de contact
+            end = np.nonzero(edges == -1)[1]         # fins de contact, dans le meme ordre
+            list_pair.append(pair + rows.start)
+            list_start.append(start)
+            list_length.append(end - start)
+        if not list_pair:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        return np.concatenate(list_pair), np.concatenate(list_start), np.concatenate(list_length)
+
+    def lifetimes(self, pair):
+        """
+        :param pair: Indice de la paire.
+        :return: La duree (en conformations) de chacun des contacts de la paire.
+        """
+        edges = np.diff(np.pad(self.states(pair).astype(np.int8), (1, 1)))
+        return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+    def longestContact(self):
+        """
+        :return: La duree (en conformations) du plus long contact ininterrompu de chaque paire.
+        """
+        pair, start, length = self.runs()
+        longest = np.zeros(self.nPairs, dtype=np.intp)
+        np.maximum.at(longest, pair, length)
+        return longest
+
+    def residenceDistribution(self, pair=None):
+        """
+        Distribution des temps de residence: nombre de contacts de chaque duree.
+        :param pair: Indice de la paire, ou None pour toutes les paires.
+        :return: Tableau dont l'element t est le nombre de contacts ininterrompus de t conformations.
+        """
+        length = self.runs()[2] if pair is None else self.lifetimes(pair)
+        return np.bincount(length, minlength=1)
+
+    def slidingOccupancy(self, window):
+        """
+        :param window: Largeur de la fenetre glissante (en conformations).
+        :return: Tableau (n_pairs, n_frames - window + 1): fraction des conformations en contact dans chaque fenetre.
+        """
+        if not 1 <= window <= self.nFrames:
+            raise ValueError("The window must be between 1 and the number of frames (%d): %s" % (self.nFrames, window))
+        occupancy = np.zeros((self.nPairs, self.nFrames - window + 1))
+        for rows, states in self._chunks():
+            cumul = np.pad(np.cumsum(states, axis=1), ((0, 0), (1, 0)))
+            occupancy[rows] = (cumul[:, window:] - cumul[:, :-window]) / window
+        return occupancy
+
+    def save(self, output):
+        """
+        Enregistre la chronologie (fichier .npz), qui peut etre relue par loadTimeline puis completee.
+        """
+        pairs = np.asarray(self.pairs, dtype=str).reshape(-1, 4)
+        with open(output, "wb") as f:
+            np.savez(f, bits=self.bits, nFrames=self.nFrames, models=np.asarray(self.models, dtype=str), pairs=pairs)
+
+    def writeSummary(self, output, duration=None, window=None):
+        """
+        Ecrit, pour chaque paire, le nombre et la fraction de conformations en contact, le nombre de contacts,
+        leur duree moyenne et la duree du plus long (en conformations), le temps de contact si la duree de
+        la dynamique est connue, et les occupations minimale et maximale sur une fenetre glissante.
+        :param output: Fichier texte de sortie.
+        :param duration: Duree de la dynamique (en ns), optionnelle.
+        :param window: Largeur de la fenetre glissante (en conformations), optionnelle; tant qu'elle depasse le nombre
+        de conformations (resultats partiels, dynamique courte), les occupations de la fenetre valent nan.
+        """
+        counts = self.counts()
+        pair, start, length = self.runs()
+        events = np.bincount(pair, minlength=self.nPairs)
+        total = np.bincount(pair, weights=length, minlength=self.nPairs)
+        longest = self.longestContact()
+        sliding = None
+        if window is not None and (window < 1 or window <= self.nFrames):   # window < 1: erreur de slidingOccupancy
+            sliding = self.slidingOccupancy(window)
+
+        f = open(output, "w")
+        header = ["dom1", "res1", "dom2", "res2", "frames", "occupancy", "contacts", "mean_lifetime", "longest"]
+        if duration is not None:
+            header.append("contact_time_ns")
+        if window is not None:
+            header.extend(["min_window_occupancy", "max_window_occupancy"])
+        f.write("\t".join(header) + "\n")
+        for i, (dom1, res1, dom2, res2) in enumerate(self.pairs):
+            row = [dom1, res1, dom2, res2, str(counts[i]), str(counts[i] / self.nFrames), str(events[i]),
+                   str(total[i] / events[i] if events[i] else 0.0), str(longest[i])]
+            if duration is not None:
+                row.append(str(counts[i] * duration / self.nFrames))
+            if sliding is not None:
+                row.extend([str(sliding[i].min()), str(sliding[i].max())])
+            elif window is not None:
+                row.extend(["nan", "nan"])
+            f.write("\t".join(row) + "\n")
+        f.close()
+
+
+def loadTimeline(output):
+    """
+    :param output: Fichier .npz ecrit par ContactTimeline.save.
+    :return: La ContactTimeline.
+    """
+    with np.load(output) as data:
+        return ContactTimeline([tuple(pair) for pair in data['pairs'].tolist()], data['bits'], int(data['nFrames']),
+                               data['models'].tolist())
+
+
+class TimelineAccumulator(Accumulator):
+    """
+    Etats de contact des paires de residus dans chaque conformation, ajoutes a une ContactTimeline (voir analyseFrames).
+    """
+
+    stage = "timeline"
+
+    def __init__(self, pairs, threshold, mode, output=None, summary=None, duration=None, window=None,
+                 timeline=None, budget=None):
+        """
+        :param pairs: Paires de residus (voir pairList).
+        :param threshold: Seuil (en Angstrom) pour definir le contact.
+        :param mode: Mode de calcul des distances.
+        :param output: Fichier .npz optionnel ou est enregistree la chronologie.
+        :param summary: Fichier texte optionnel du resume des contacts (voir ContactTimeline.writeSummary).
+        :param duration, window: Duree de la dynamique et fenetre glissante du resume.
+        :param timeline: ContactTimeline existante (par exemple relue par loadTimeline) a completer.
+        :param budget: Memoire maximale (en octets) de la recherche des voisins (voir neighbourSearch.neighbourPairs).
+        """
+        self.pairs = pairList(pairs)
+        self.threshold = threshold
+        self.mode = mode
+        self.output = output
+        self.summary = summary
+        self.duration = duration
+        self.window = window
+        self.budget = budget
+        if timeline is None:
+            timeline = ContactTimeline(self.pairs)
+        elif timeline.pairs != self.pairs:
+            raise ValueError("The timeline does not contain the requested pairs of residues")
+        self.timeline = timeline
+
+        # les paires sont regroupees par couple de domaines: une seule recherche de voisins par couple et par conformation
+        self.domPairs = dict()
+        for i, (dom1, res1, dom2, res2) in enumerate(self.pairs):
+            self.domPairs.setdefault((dom1, dom2), []).append(i)
+        self.reset()
+
+    def spawn(self):
+        """
+        :return: Un accumulateur de memes parametres, sans conformation ni chronologie (seul l'original la complete).
+        """
+        acc = Accumulator.spawn(self)
+        acc.timeline = None
+        return acc
+
+    def reset(self):
+        self.models = []
+        self.states = []
+        self._topology = None
+
+    def _pairCodes(self, conf):
+        """
+        :return: Pour chaque couple de domaines, le code r1 * n2 + r2 (rangs dans 'reslist', voir pairCodes) de chacune
+        de ses paires.
+        """
+        codes = dict()
+        for (dom1, dom2), indices in self.domPairs.items():
+            codes[(dom1, dom2)] = pairCodes(conf, dom1, dom2, [(self.pairs[i][1], self.pairs[i][3]) for i in indices])
+        return codes
+
+    def update(self, model, conf, memo, fout=None):
+        if self._topology is None or not conf.sameTopology(self._topology):
+            self._topology = conf
+            self._codes = self._pairCodes(conf)
+        state = np.zeros(len(self.pairs), dtype=bool)
+        for (dom1, dom2), indices in self.domPairs.items():
+            r1, r2, d = residuePairs(conf, dom1, dom2, self.threshold, self.mode, memo, self.budget)
+            n2 = len(conf.chainResList(dom2))
+            state[indices] = np.isin(self._codes[(dom1, dom2)], r1.astype(np.int64) * n2 + r2)
+        self.models.append(model)
+        self.states.append(state)
+
+    def partial(self):
+        """
+        :return: La liste des modeles et le tableau booleen (n_frames, n_pairs) des etats de contact.
+        """
+        return self.models, np.array(self.states, dtype=bool).reshape(-1, len(self.pairs))
+
+    def merge(self, partial):
+        models, states = partial
+        self.timeline.append(states, models)
+
+    def finish(self):
+        """
+        Enregistre la chronologie et son resume.
+        :return: La ContactTimeline.
+        """
+        if self.output is not None:
+            self.timeline.save(self.output)
+        if self.summary is not None:
+            self.timeline.writeSummary(self.summary, self.duration, self.window)
+        return self.timeline
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Byte-offset index of the MODEL/ENDMDL blocks of a multi-model PDB file, stored in a
+sidecar file, giving random access to any conformation through a memory-mapped file.
+"""
+
+import mmap
+import os
+import re
+import zipfile
+
+import numpy as np
+
+from readerPDB import compression
+
+# enregistrements MODEL et ENDMDL en debut de ligne (colonnes 1-6)
+_RECORDS = re.compile(rb'^(?:MODEL(?=[ \r\n]|$)|ENDMDL)', re.M)
+
+INDEX_SUFFIX = ".mdlidx.npz"
+
+
+class ModelIndex(object):
+    """
+    Position (offset et longueur en octets) de chaque bloc MODEL ... ENDMDL d'un fichier pdb.
+    """
+
+    def __init__(self, pdbFile, models, offsets, lengths):
+        """
+        :param pdbFile: Fichier pdb indexe.
+        :param models: Numero de chaque modele (chaines de caracteres).
+        :param offsets: Position en octets du debut de chaque bloc.
+        :param lengths: Longueur en octets de chaque bloc.
+        """
+        self.pdbFile = pdbFile
+        self.models = np.asarray(models, dtype=str)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def select(self, start=0, stop=None, step=1):
+        """
+        :return: Les rangs des conformations selectionnees par start:stop:step.
+        """
+        if step < 1:
+            raise ValueError("step must be a positive integer: %s" % step)
+        return range(len(self))[start:stop:step]
+
+    def blocks(self, ranks):
+        """
+        Lit les blocs de texte de certaines conformations, par acces direct dans le fichier (mmap).
+        :param ranks: Rangs des conformations a lire.
+        :return: Generateur de couples (modele, liste des lignes du bloc).
+        """
+        for model, block in self.rawBlocks(ranks):
+            yield model, block.decode('latin-1').splitlines(True)
+
+    def rawBlocks(self, ranks):
+        """
+        Lit les blocs de certaines conformations sans les decouper en lignes (voir ParserPDB.FrameDecoder).
+        :param ranks: Rangs des conformations a lire.
+        :return: Generateur de couples (modele, octets du bloc).
+        """
+        ranks = list(ranks)
+        if not ranks:
+            return
+        with open(self.pdbFile, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for i in ranks:
+                    offset = int(self.offsets[i])
+                    yield str(self.models[i]), mm[offset:offset + int(self.lengths[i])]
+
+    def subset(self, ranks):
+        """
+        :return: Un ModelIndex restreint a certaines conformations (par exemple le chunk d'un processus).
+        """
+        ranks = np.asarray(ranks, dtype=np.intp)
+        return ModelIndex(self.pdbFile, self.models[ranks], self.offsets[ranks], self.lengths[ranks])
+
+    def block(self, i):
+        """
+        :return: Le couple (modele, liste des lignes) de la conformation de rang i.
+        """
+        return next(self.blocks([i]))
+
+    def save(self, indexFile):
+        """
+        Enregistre l'index, avec la taille et la date de modification du fichier pdb qui permettent de l'invalider.
+        """
+        st = os.stat(self.pdbFile)
+        with open(indexFile, 'wb') as f:
+            np.savez(f, models=self.models, offsets=self.offsets, lengths=self.lengths,
+                     size=st.st_size, mtime=st.st_mtime_ns)
+
+
+def buildIndex(pdbFile):
+    """
+    Parcourt une fois le fichier pdb pour reperer les blocs MODEL ... ENDMDL.
+    Un bloc commence a la ligne MODEL et se termine a la fin de la ligne ENDMDL, ou a defaut au MODEL suivant.
+    Un fichier sans enregistrement MODEL est considere comme une seule conformation de numero "".
+    :param pdbFile: Fichier pdb.
+    :return: Un ModelIndex.
+    """
+    models = []
+    offsets = []
+    lengths = []
+
+    size = os.path.getsize(pdbFile)
+    if size == 0:
+        return ModelIndex(pdbFile, models, offsets, lengths)
+
+    with open(pdbFile, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = None
+            for match in _RECORDS.finditer(mm):
+                eol = mm.find(b'\n', match.start())
+                eol = size if eol == -1 else eol + 1
+                if match.group() == b'ENDMDL':
+                    if start is not None:
+                        lengths.append(eol - start)
+                        start = None
+                    continue
+                if start is not None:                     # MODEL sans ENDMDL: le bloc s'arrete ici
+                    lengths.append(match.start() - start)
+                start = match.start()
+                models.append(mm[start:eol][10:14].decode('latin-1').strip())
+                offsets.append(start)
+            if start is not None:
+                lengths.append(size - start)
+
+    if not offsets:
+        models, offsets, lengths = [""], [0], [size]
+
+    return ModelIndex(pdbFile, models, offsets, lengths)
+
+
+def loadIndex(pdbFile, indexFile=None):
+    """
+    Renvoie l'index des conformations d'un fichier pdb, en reutilisant le fichier d'index s'il est a jour
+    (meme taille et meme date de modification que le fichier pdb), sinon en le reconstruisant et l'enregistrant.
+    :param pdbFile: Fichier pdb.
+    :param indexFile: Fichier d'index (par defaut pdbFile + '.mdlidx.npz').
+    :return: Un ModelIndex.
+    """
+    if compression(pdbFile) is not None:
+        raise ValueError("No random access to the compressed file %s: read it with readerPDB.streamBlocks" % pdbFile)
+    if indexFile is None:
+        indexFile = pdbFile + INDEX_SUFFIX
+
+    st = os.stat(pdbFile)
+    try:
+        with np.load(indexFile) as data:
+            if int(data['size']) == st.st_size and int(data['mtime']) == st.st_mtime_ns:
+                return ModelIndex(pdbFile, data['models'], data['offsets'], data['lengths'])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass   # pas d'index, ou index illisible: on le reconstruit
+
+    index = buildIndex(pdbFile)
+    try:
+        index.save(indexFile)
+    except OSError:
+        pass   # repertoire en lecture seule: l'index reste en memoire
+    return index
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Non-interactive analysis jobs: a job (read from a JSON, YAML or TOML file and/or from
+the command line) lists the inputs, domains, contact pairs, parameters and outputs of one analysis,
+and a manifest runs many jobs (for example replicas of a dynamics) with a bounded pool of processes.
+"""
+
+import json
+import os
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ParserPDB import PDBparser, PDBparserMulti, PDBiterMulti, PDBfollowMulti, PDBconvert, countFrames
+from computeInterface import distMatrix, plotRMSD, RMSDAccumulator, RMSFAccumulator, InterfaceAccumulator, \
+    ContactAccumulator
+from contactMap import ContactMapAccumulator
+from contactTimeline import TimelineAccumulator
+from parallel import ParallelFrames, analyseFrames
+from plotting import FORMATS
+from profiling import PROFILERS, RunTimer, makeProfiler, profilePath, timedStage
+from resultCache import PAIR_RADIUS, ResultCache, analyseCached
+from selectionPDB import AtomSelection
+from trajectoryCache import loadCache
+
+# paires de residus choisies a partir de la Figure 2 (residu du premier domaine: domaine, residu et domaine du partenaire)
+DEFAULT_PAIRS = {'41': {'dom1':'A4', 'res2':'32', 'dom2':'B'},
+                 '100':{'dom1':'A4', 'res2':'31', 'dom2':'B'},
+                 '46': {'dom1':'A4', 'res2':'25', 'dom2':'B'},
+                 '34': {'dom1':'A3', 'res2':'33', 'dom2':'B'},
+                 '6' : {'dom1':'A3', 'res2':'63', 'dom2':'A4'},
+                 '66': {'dom1':'A4', 'res2':'41', 'dom2':'A3'},
+                 '98': {'dom1':'A4', 'res2':'30', 'dom2':'B'},
+                 '26': {'dom1':'A3', 'res2':'65', 'dom2':'A4'}}
+
+# parametres d'un job et leur valeur par defaut (None: pas de valeur par defaut)
+DEFAULTS = {'ref': None,
+            'conf': None,
+            'domains': None,
+            'rna': None,
+            'pairs': DEFAULT_PAIRS,
+            'threshold': 9.0,
+            'rmsd_mode': "CM",
+            'dist_mode': "CM",
+            'fit': "none",
+            'start': 0,
+            'stop': None,
+            'step': 1,
+            'stream': False,
+            'follow': False,
+            'follow_poll': 1.0,
+            'follow_timeout': None,
+            'cache': False,
+            'mass': False,
+            'altloc': "first",
+            'domain_field': "segid",
+            'hetatm': None,
+            'workers': 1,
+            'duration': None,
+            'distmat': False,
+            'plots': False,
+            'plot_dir': ".",
+            'plot_format': "png",
+            'show': False,
+            'rmsd_output': None,
+            'rmsf_output': None,
+            'freq_output': None,
+            'bfactor_output': None,
+            'bfactor_models': None,
+            'contact_output': None,
+            'timeline_output': None,
+            'timeline_summary': None,
+            'timeline_window': None,
+            'contactmap_output': None,
+            'contactmap_summary': None,
+            'overwrite': False,
+            'memory_budget': None,
+            'result_cache': None,
+            'result_cache_size': 1024,
+            'cache_radius': None,
+            'checkpoint': None,
+            'checkpoint_delay': None,
+            'timing': None,
+            'progress': False,
+            'profile': None}
+
+# parametres contenant un chemin, relatif au repertoire du fichier de job ou du manifeste
+OUTPUT_KEYS = ('rmsd_output', 'rmsf_output', 'freq_output', 'bfactor_output', 'contact_output', 'timeline_output', 'timeline_summary',
+               'contactmap_output', 'contactmap_summary')
+PATH_KEYS = ('ref', 'conf', 'plot_dir', 'timing', 'result_cache') + OUTPUT_KEYS
+
+TIMING_REPORT = "timing.json"   # nom du rapport des temps (timing: true), a cote des fichiers de sortie
+FOLLOW_DELAY = 30.0             # duree minimale (en s) entre deux ecritures des sorties en mode follow, par defaut
+
+
+def loadConfig(path):
+    """
+    Lit un fichier de configuration, selon son extension: .json, .yaml/.yml (module PyYAML) ou .toml.
+    :param path: Fichier de configuration.
+    :return: Le contenu du fichier (dictionnaire ou liste).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path) as f:
+            return json.load(f)
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("The PyYAML package is needed to read the YAML file %s" % path)
+        with open(path) as f:
+            return yaml.safe_load(f)
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:   # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("The tomli package is needed to read the TOML file %s with Python < 3.11" % path)
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    raise ValueError("Unknown configuration format (expected .json, .yaml, .yml or .toml): %s" % path)
+
+
+def resolvePaths(config, directory):
+    """
+    :return: Une copie de config dont les chemins relatifs sont rapportes au repertoire directory.
+    """
+    config = dict(config)
+    for key in PATH_KEYS:
+        if isinstance(config.get(key), str):
+            config[key] = os.path.join(directory, config[key])
+    return config
+
+
+def loadJob(path):
+    """
+    Lit un fichier de job (voir DEFAULTS pour les parametres), les chemins relatifs etant rapportes a son repertoire.
+    :param path: Fichier de job .json, .yaml/.yml ou .toml.
+    :return: Dictionnaire des parametres presents dans le fichier.
+    """
+    config = loadConfig(path)
+    if not isinstance(config, dict):
+        raise ValueError("A job file must contain a mapping of parameters: %s" % path)
+    return resolvePaths(config, os.path.dirname(os.path.abspath(path)))
+
+
+def loadManifest(path, base=None):
+    """
+    Lit un manifeste de jobs: une liste de jobs, ou un dictionnaire {'defaults': {...}, 'jobs': [...]}.
+    Chaque job est complete par base (par exemple les options de la ligne de commande), puis par 'defaults'.
+    :param path: Fichier manifeste .json, .yaml/.yml ou .toml.
+    :param base: Parametres communs a tous les jobs.
+    :return: La liste des jobs (voir makeJob).
+    """
+    config = loadConfig(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    if isinstance(config, dict):
+        defaults = resolvePaths(config.get('defaults', {}), directory)
+        entries = config.get('jobs', [])
+    else:
+        defaults = dict()
+        entries = config
+    if not isinstance(entries, list):
+        raise ValueError("The 'jobs' of a manifest must be a list: %s" % path)
+
+    jobs = []
+    for entry in entries:
+        job = dict(base or {})
+        job.update(defaults)
+        job.update(resolvePaths(entry, directory))
+        jobs.append(makeJob(job))
+    return jobs
+
+
+def parsePairs(pairs):
+    """
+    Convertit les paires de residus au format de contactTime: {residu1: {'dom1': ..., 'res2': ..., 'dom2': ...}}.
+    :param pairs: Dictionnaire a ce format, ou liste de dictionnaires {'res1', 'dom1', 'res2', 'dom2'}.
+    :return: Le dictionnaire des paires.
+    """
+    if isinstance(pairs, dict):
+        return dict((str(res1), {'dom1': str(p['dom1']), 'res2': str(p['res2']), 'dom2': str(p['dom2'])})
+                    for res1, p in pairs.items())
+
+    converted = dict()
+    for p in pairs:
+        res1 = str(p['res1'])
+        if res1 in converted:
+            raise ValueError("Residue %s appears in several contact pairs" % res1)
+        converted[res1] = {'dom1': str(p['dom1']), 'res2': str(p['res2']), 'dom2': str(p['dom2'])}
+    return converted
+
+
+def makeJob(config):
+    """
+    Complete un job par les valeurs par defaut et verifie ses parametres.
+    :param config: Dictionnaire des parametres du job.
+    :return: Le job complet.
+    """
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown job parameters: %s" % ", ".join(sorted(unknown)))
+
+    job = dict(DEFAULTS)
+    job.update((key, value) for key, value in config.items() if value is not None)
+
+    for key in ('ref', 'conf', 'domains', 'rna'):
+        if job[key] is None:
+            raise ValueError("Missing job parameter: %s" % key)
+    if isinstance(job['domains'], str):
+        job['domains'] = job['domains'].split(sep=",")
+    job['domains'] = [str(dom) for dom in job['domains']]
+    job['rna'] = str(job['rna'])
+    job['pairs'] = parsePairs(job['pairs'])
+    if isinstance(job['bfactor_models'], str):
+        job['bfactor_models'] = job['bfactor_models'].split(sep=",")
+
+    if job['fit'] not in ("none", "global", "domain"):
+        raise ValueError("fit must be 'none', 'global' or 'domain': %s" % job['fit'])
+    if job['plot_format'] not in FORMATS:
+        raise ValueError("plot_format must be %s: %s" % (" or ".join(FORMATS), job['plot_format']))
+    AtomSelection(job['altloc'], job['domain_field'], job['hetatm'])   # verifie la selection des atomes
+    if job['workers'] < 1:
+        raise ValueError("The number of workers must be a positive integer: %s" % job['workers'])
+    if job['memory_budget'] is not None and job['memory_budget'] <= 0:
+        raise ValueError("The memory budget must be positive (in MB): %s" % job['memory_budget'])
+    if job['checkpoint'] is not None and job['checkpoint'] < 1:
+        raise ValueError("The checkpoint interval must be a positive number of frames: %s" % job['checkpoint'])
+    if job['checkpoint_delay'] is not None and job['checkpoint_delay'] < 0:
+        raise ValueError("The delay between two checkpoints must be positive (in s): %s" % job['checkpoint_delay'])
+    if job['result_cache_size'] <= 0:
+        raise ValueError("The size of the result cache must be positive (in MB): %s" % job['result_cache_size'])
+    if job['cache_radius'] is not None and job['cache_radius'] <= 0:
+        raise ValueError("The cache radius must be positive (in Angstrom): %s" % job['cache_radius'])
+    if job['follow']:
+        if job['workers'] > 1 or job['cache'] or job['result_cache'] is not None:
+            raise ValueError("follow reads the conformations as they are written: no workers nor cache")
+        if job['follow_poll'] <= 0:
+            raise ValueError("The polling interval must be positive (in s): %s" % job['follow_poll'])
+        if job['follow_timeout'] is not None and job['follow_timeout'] < 0:
+            raise ValueError("The follow timeout must be positive (in s): %s" % job['follow_timeout'])
+        if job['checkpoint'] is None:   # chaque nouvelle conformation est fusionnee des qu'elle est lue ...
+            job['checkpoint'] = 1
+            if job['checkpoint_delay'] is None:   # ... mais les sorties ne sont pas reecrites a chaque fois
+                job['checkpoint_delay'] = FOLLOW_DELAY
+    if job['contact_output'] is not None and job['duration'] is None:
+        raise ValueError("The duration of the dynamics is needed to compute the contact times")
+    if all(job[key] is None for key in OUTPUT_KEYS):
+        raise ValueError("The job has no output (%s)" % ", ".join(OUTPUT_KEYS))
+    if job['bfactor_output'] is not None and job['freq_output'] is None:
+        raise ValueError("bfactor_output needs freq_output (the B-factors are those of the interface analysis)")
+
+    if job['profile'] is not None and job['profile'] not in PROFILERS:
+        raise ValueError("profile must be %s: %s" % (" or ".join(PROFILERS), job['profile']))
+    if job['profile'] is not None and not job['timing']:   # le profil est ecrit a cote du rapport des temps
+        job['timing'] = True
+    if job['timing'] is True:
+        first = next(job[key] for key in OUTPUT_KEYS if job[key] is not None)
+        job['timing'] = os.path.join(os.path.dirname(first), TIMING_REPORT)
+    elif job['timing'] is False:
+        job['timing'] = None
+    return job
+
+
+def checkFiles(job):
+    """
+    Verifie que les fichiers d'entree existent, et que les fichiers de sortie n'existent pas (sauf si overwrite).
+    """
+    for key in ('ref', 'conf'):
+        if not os.path.isfile(job[key]):
+            raise FileNotFoundError("This file does not exist: %s" % job[key])
+    if not job['overwrite']:
+        for key in OUTPUT_KEYS:
+            if job[key] is not None and os.path.exists(job[key]):
+                raise FileExistsError("This output file already exists (use overwrite): %s" % job[key])
+
+
+def runJob(job):
+    """
+    Execute un job sans aucune interaction: parsing, puis une seule passe sur les conformations pour le RMSD,
+    l'interface et les temps de contact (seules les analyses dont le fichier de sortie est donne sont faites),
+    puis les figures demandees (distmat, plots) dans plot_dir.
+    Si timing ou progress est demande, les temps de chaque etape sont mesures (voir profiling.RunTimer) et ecrits
+    dans le rapport JSON timing, a cote duquel est ecrit le profil demande par profile.
+    :param job: Job complet (voir makeJob).
+    :return: Dictionnaire {'rmsd', 'rmsf', 'interface', 'contacts'} des resultats des analyses faites.
+    """
+    checkFiles(job)
+    timer = None
+    if job['timing'] is not None or job['progress']:
+        timer = RunTimer(progress=job['progress'])
+    profiler = None
+    if job['profile'] is not None:
+        profiler = makeProfiler(job['profile'])
+        profiler.enable()
+    try:
+        results = _runAnalyses(job, timer)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    if profiler is not None:
+        profiler.dump_stats(profilePath(job['timing'], job['profile']))
+    if timer is not None:
+        if job['progress']:
+            timer.showProgress()
+        if job['timing'] is not None:
+            timer.write(job['timing'])
+    return results
+
+
+def _frameCount(job, frames, parsing_list, selection=None):
+    """
+    :return: Le nombre de conformations analysees s'il est connu sans lire les conformations (pour la progression),
+    sinon None (fichier compresse ou en cours d'ecriture).
+    """
+    if isinstance(frames, Mapping):
+        return len(frames)
+    if job['follow']:   # fichier en cours d'ecriture
+        return None
+    return countFrames(job['conf'], parsing_list, job['start'], job['stop'], job['step'], selection)
+
+
+def _runAnalyses(job, timer=None):
+    """
+    Corps de runJob: chaque etape est mesuree par timer s'il est donne.
+    """
+    list_dom_prot = job['domains']
+    dom_rna = job['rna']
+    parsing_list = list_dom_prot + [dom_rna]
+    massWeighted = job['mass']
+    selection = AtomSelection(job['altloc'], job['domain_field'], job['hetatm'])
+    budget = None if job['memory_budget'] is None else int(job['memory_budget'] * 1024 * 1024)
+
+    with timedStage(timer, "parse"):
+        ref = PDBparser(job['ref'], parsing_list, massWeighted=massWeighted, selection=selection)
+
+        if job['cache'] and loadCache(job['conf'], parsing_list, selection) is None:   # cache absent ou perime: on le (re)construit
+            PDBconvert(job['conf'], parsing_list, massWeighted=massWeighted, selection=selection)
+
+    if (job['distmat'] or job['plots']) and not job['show']:
+        os.makedirs(job['plot_dir'], exist_ok=True)
+
+    if job['distmat']:
+        with timedStage(timer, "distmat"):
+            for dom in list_dom_prot:
+                distMatrix(ref, dom, dom_rna, job['dist_mode'], job['plot_dir'], job['plot_format'], job['show'],
+                           budget)
+
+    def loadFrames():
+        """
+        :return: Les conformations a analyser (lues seulement si un resultat n'est pas en cache).
+        """
+        if job['workers'] > 1:
+            frames = ParallelFrames(job['conf'], parsing_list, job['workers'], start=job['start'],
+                                    stop=job['stop'], step=job['step'], massWeighted=massWeighted,
+                                    selection=selection)
+        elif job['follow']:
+            frames = PDBfollowMulti(job['conf'], parsing_list, start=job['start'], stop=job['stop'], step=job['step'],
+                                    massWeighted=massWeighted, selection=selection, poll=job['follow_poll'],
+                                    timeout=job['follow_timeout'])
+        elif job['stream']:
+            frames = PDBiterMulti(job['conf'], parsing_list, start=job['start'], stop=job['stop'], step=job['step'],
+                                  massWeighted=massWeighted, selection=selection)
+        else:
+            with timedStage(timer, "parse"):
+                frames = PDBparserMulti(job['conf'], parsing_list, start=job['start'], stop=job['stop'],
+                                        step=job['step'], massWeighted=massWeighted, selection=selection,
+                                        reference=ref)
+        if timer is not None and timer.progress:
+            timer.total = _frameCount(job, frames, parsing_list, selection)
+        return frames
+
+    names = []
+    accumulators = []
+    if job['rmsd_output'] is not None:
+        names.append('rmsd')
+        accumulators.append(RMSDAccumulator(ref, list_dom_prot, job['rmsd_mode'], job['rmsd_output'],
+                                            None if job['fit'] == "none" else job['fit']))
+    if job['rmsf_output'] is not None:
+        names.append('rmsf')
+        accumulators.append(RMSFAccumulator(ref, parsing_list, job['rmsd_mode'], job['rmsf_output'],
+                                            None if job['fit'] == "none" else job['fit']))
+    if job['freq_output'] is not None:
+        names.append('interface')
+        accumulators.append(InterfaceAccumulator(list_dom_prot, dom_rna, job['threshold'], job['dist_mode'],
+                                                 job['freq_output'], job['bfactor_models'], budget))
+    if job['contact_output'] is not None:
+        names.append('contacts')
+        accumulators.append(ContactAccumulator(job['pairs'], job['threshold'], job['duration'], job['dist_mode'],
+                                               job['contact_output'], budget))
+
+    if job['timeline_output'] is not None or job['timeline_summary'] is not None:
+        names.append('timeline')
+        accumulators.append(TimelineAccumulator(job['pairs'], job['threshold'], job['dist_mode'], job['timeline_output'],
+                                                job['timeline_summary'], job['duration'], job['timeline_window'],
+                                                budget=budget))
+
+    if job['contactmap_output'] is not None or job['contactmap_summary'] is not None:
+        names.append('contactmap')
+        accumulators.append(ContactMapAccumulator(job['threshold'], job['dist_mode'], parsing_list,
+                                                  job['contactmap_output'], job['contactmap_summary'], job['duration'],
+                                                  budget=budget))
+
+    if job['result_cache'] is None:
+        results = analyseFrames(loadFrames(), accumulators, job['bfactor_output'], timer, job['checkpoint'],
+                                job['checkpoint_delay'])
+    else:
+        with timedStage(timer, "cache"):
+            cache = ResultCache(job['result_cache'], int(job['result_cache_size'] * 1024 * 1024))
+            parts = (cache.fileDigest(job['conf']), parsing_list, selection.key(), massWeighted, job['start'],
+                     job['stop'], job['step'])
+        radius = PAIR_RADIUS if job['cache_radius'] is None else job['cache_radius']
+        results = analyseCached(cache, parts, loadFrames, accumulators, job['bfactor_output'], timer,
+                                job['checkpoint'], radius, job['checkpoint_delay'])
+    results = dict(zip(names, results))
+
+    if job['plots'] and 'rmsd' in results:
+        with timedStage(timer, "plots"):
+            plotRMSD(*results['rmsd'], list_dom_prot, job['rmsd_mode'], job['plot_dir'], job['plot_format'],
+                     job['show'])
+    return results
+
+
+def runManifest(jobs, maxJobs=1):
+    """
+    Execute plusieurs jobs, au plus maxJobs a la fois (un processus par job). L'echec d'un job n'arrete pas les autres.
+    :param jobs: Liste de jobs complets (voir loadManifest).
+    :param maxJobs: Nombre maximal de jobs executes simultanement.
+    :return: La liste des erreurs (None pour un job reussi), dans l'ordre des jobs.
+    """
+    if maxJobs < 1:
+        raise ValueError("The number of simultaneous jobs must be a positive integer: %s" % maxJobs)
+
+    errors = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=maxJobs) as pool:
+        futures = dict((pool.submit(runJob, job), i) for i, job in enumerate(jobs))
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                future.result()
+                print("[%d/%d] done: %s" % (done, len(jobs), jobs[i]['conf']))
+            except Exception as e:
+                errors[i] = e
+                print("[%d/%d] FAILED: %s (%s: %s)" % (done, len(jobs), jobs[i]['conf'], type(e).__name__, e))
+    return errors
@@ -10,48 +10,193 @@ Description: A program that analyzes the sRNP H/ACA complex of the archea Pyrocc
 
 from ParserPDB import *
 from computeInterface import *
+from jobs import loadJob, loadManifest, makeJob, runJob, runManifest
+import argparse
 import sys, os
 
-def usage():
-    print ("""
-    
+def buildParser():
+    """
+    :return: L'analyseur des arguments de la ligne de commande.
+    """
+    parser = argparse.ArgumentParser(
+        allow_abbrev=False, formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""
     This program allows you to analyze a molecular dynamics in PDB format.
-    
+
     Inputs:  - a PDB file (ATOM format) containing the reference structure
              - a PDB file (ATOM format) containing all the structures of the dynamics
-             
+
     Outputs: - Root Mean Square Deviation (RMSD) for the whole structure or for particular domains
              - Distance matrices between residues or domains
              - Residues' frequency of belonging to an interface
              - Duration of contact between key residues
-    
-    ==================================================================================
-                                      Arguments
-    
-    obligatory:
-    ===========
-    
-    -ref    -> pdb file containing the reference structure of the protein/RNA complex
-    
-    -conf   -> pdb file containing the different conformations of the complex
-    
-    
-    optional:
-    =========
-    
-    -th     -> threshold to define a contact,in Ansgtrom (default = 9.0)
-    
-    -rmsd   -> if rmsd = 'CA', computes the RMSD between alpha carbons of two residues
-               and returns it.
-               if rmsd = 'CM', commputes the RMSD between the centers of mass of the two
-               residues and returns it. (default = 'CM')
-                   
-    -mode   -> if mode = 'atom', computes the distance between all the atoms of two residues
-               or of a residue and a nucleotide and returns the smallest distance.
-               if mode = 'CM', computes the distance between the centers of mass and returns it.
-               (default = 'CM)
+
+    The parameters missing from the command line (and from the job file) are asked interactively,
+    unless --batch, --job or --manifest is given: the program then never waits for the keyboard.
+    """,
+        epilog="""
+    Job files (--job) and the entries of a manifest (--manifest) are JSON, YAML or TOML mappings
+    with the keys: ref, conf, domains, rna, pairs, threshold, rmsd_mode, dist_mode, fit, start,
+    stop, step, stream, follow, follow_poll, follow_timeout, cache, mass, altloc, domain_field, hetatm,
+    workers, duration, distmat, plots, plot_dir, plot_format, show, rmsd_output, rmsf_output, freq_output,
+    bfactor_output, bfactor_models, contact_output, timeline_output, timeline_summary, timeline_window,
+    contactmap_output, contactmap_summary, overwrite, memory_budget, result_cache, result_cache_size,
+    cache_radius, checkpoint, checkpoint_delay, timing, progress, profile.
+    Relative paths are relative to the file.
+    pairs is a list of {res1, dom1, res2, dom2} (default: the pairs of the Figure 2).
+    A manifest is a list of jobs, or a mapping {defaults: {...}, jobs: [...]}.
     """)
 
+    inputs = parser.add_argument_group("inputs")
+    inputs.add_argument("-ref", dest="ref",
+                        help="pdb file containing the reference structure of the protein/RNA complex")
+    inputs.add_argument("-conf", dest="conf", help="pdb file containing the different conformations of the complex")
+    inputs.add_argument("--domains", help="list of proteic domains identifiers (example: A1,A2,A3,A4)")
+    inputs.add_argument("--rna", help="RNA domain identifier (example: B)")
+    inputs.add_argument("--altloc", metavar="{first,occupancy,all,LETTER}",
+                        help="alternate locations of an atom: keep the first one, the one of highest occupancy, "
+                             "all of them as distinct atoms, or the given one (example: B, the first one for the "
+                             "atoms without it) (default = 'first')")
+    inputs.add_argument("--domain-field", dest="domain_field", choices=("segid", "chain", "auto"),
+                        help="columns identifying the domains: segment ID (73-76), chain ID (22), or the segment "
+                             "ID and the chain ID when it is blank (default = 'segid')")
+    inputs.add_argument("--hetatm", choices=("ions", "ligands", "all"),
+                        help="also read the HETATM records of the ions, of everything but the water, or all of "
+                             "them (default: ATOM records only)")
+
+    analysis = parser.add_argument_group("analysis")
+    analysis.add_argument("-th", dest="threshold", type=float,
+                          help="threshold to define a contact, in Angstrom (default = 9.0)")
+    analysis.add_argument("-rmsd", dest="rmsd_mode", choices=("CA", "CM"),
+                          help="'CA': RMSD between the alpha carbons of the residues, "
+                               "'CM': RMSD between the centers of mass of the residues (default = 'CM')")
+    analysis.add_argument("-mode", dest="dist_mode", choices=("atom", "CM"),
+                          help="'atom': smallest distance between the atoms of two residues, "
+                               "'CM': distance between the centers of mass (default = 'CM')")
+    analysis.add_argument("-fit", dest="fit", choices=("none", "global", "domain"),
+                          help="'global': each conformation is optimally superimposed (Kabsch) on the reference "
+                               "before computing the RMSDs; 'domain': the global RMSD uses the global superposition "
+                               "and each domain is superimposed separately for its own RMSD "
+                               "(default = 'none': the conformations are assumed to be already superimposed)")
+    analysis.add_argument("-mass", dest="mass", action="store_true", default=None,
+                          help="weight the centers of mass of the residues by the atomic masses (element column, "
+                               "or first letter of the atom name) instead of the plain mean of the atom coordinates")
+    analysis.add_argument("--duration", type=float, help="duration of the dynamics, in ns")
+    analysis.add_argument("--memory-budget", dest="memory_budget", type=float,
+                          help="memory (in MB) of the temporary arrays of a distance computation, which is done by "
+                               "blocks of residues for the largest domains (default = 256; no effect on the results)")
+
+    plots = parser.add_argument_group("figures (matplotlib is only loaded when a figure is requested)")
+    plots.add_argument("--distmat", action="store_true", default=None,
+                       help="draw the distance matrices between the proteic domains and RNA for the reference "
+                            "structure as heatmaps (distmat_<domain>_<RNA>.png)")
+    plots.add_argument("--plots", action="store_true", default=None,
+                       help="draw the RMSDs as a function of the conformations (rmsd.png and rmsd_domains.png)")
+    plots.add_argument("--plot-dir", dest="plot_dir", help="directory of the figures (default = current directory)")
+    plots.add_argument("--plot-format", dest="plot_format", choices=("png", "svg"),
+                       help="format of the figures (default = 'png')")
+    plots.add_argument("--show", action="store_true", default=None,
+                       help="show the figures in windows instead of writing them (needs a display)")
+
+    frames = parser.add_argument_group("conformations")
+    frames.add_argument("-start", dest="start", type=int,
+                        help="index (from 0) of the first conformation to analyze (default = 0)")
+    frames.add_argument("-stop", dest="stop", type=int,
+                        help="index of the conformation where the analysis stops (excluded, default = end of file)")
+    frames.add_argument("-step", dest="step", type=int,
+                        help="analyze one conformation every 'step' conformations (default = 1)")
+    frames.add_argument("-stream", dest="stream", action="store_true", default=None,
+                        help="read the conformations one at a time instead of loading the whole dynamics in memory "
+                             "(constant memory, the file is read once for all the analyses)")
+    frames.add_argument("--follow", action="store_true", default=None,
+                        help="analyze a conformations pdb still being written by a simulation: each MODEL block is "
+                             "read as soon as its ENDMDL is written, and the outputs are updated at most every "
+                             "--checkpoint-delay seconds (default = 30), until the END record, --follow-timeout "
+                             "or Ctrl-C")
+    frames.add_argument("--follow-poll", dest="follow_poll", type=float,
+                        help="with --follow, seconds between two reads of the end of the file (default = 1)")
+    frames.add_argument("--follow-timeout", dest="follow_timeout", type=float,
+                        help="with --follow, stop after this many seconds without a new conformation "
+                             "(default: wait for the END record)")
+    frames.add_argument("-cache", dest="cache", action="store_true", default=None,
+                        help="store the parsed conformations in a binary cache next to the conformations pdb "
+                             "(file.pdb.cache/), reused automatically by the next runs while it is newer than "
+                             "the pdb file, so that changing -th or -mode does not parse the pdb text again")
+    frames.add_argument("--result-cache", dest="result_cache",
+                        help="directory of a cache of results shared by all the runs, keyed by the content of the "
+                             "conformations pdb and the parameters: the RMSDs, RMSFs, interface, contact and contact "
+                             "map counts of a rerun are read back, and the distances between residues (kept up to "
+                             "--cache-radius) are reused when only -th changes")
+    frames.add_argument("--result-cache-size", dest="result_cache_size", type=float,
+                        help="size of the result cache, in MB: the least recently used results are removed "
+                             "beyond it (default = 1024)")
+    frames.add_argument("--cache-radius", dest="cache_radius", type=float,
+                        help="distance (in Angstrom, at least -th) up to which the pairs of residues are kept in the "
+                             "result cache, so that a rerun with a threshold up to this radius computes no distance "
+                             "(default = 12)")
+    frames.add_argument("-j", "--workers", dest="workers", type=int,
+                        help="number of processes used to analyze the conformations in parallel (default = 1); "
+                             "the conformations are read one at a time, as with -stream")
+
+    outputs = parser.add_argument_group("outputs")
+    outputs.add_argument("--rmsd-output", dest="rmsd_output", help="output file of the RMSDs (example: rmsd.txt)")
+    outputs.add_argument("--rmsf-output", dest="rmsf_output",
+                         help="output file of the fluctuation (RMSF) and mean position of each residue, computed "
+                              "in one pass with the points of -rmsd and the superposition of -fit")
+    outputs.add_argument("--freq-output", dest="freq_output",
+                         help="output file of the frequences of belonging to the interface (example: freq.txt)")
+    outputs.add_argument("--bfactor-output", dest="bfactor_output",
+                         help="output pdb file with B-factors different for residues belonging to the interface "
+                              "(gzip-compressed if its name ends with .gz)")
+    outputs.add_argument("--bfactor-models", dest="bfactor_models",
+                         help="numbers of the models written in --bfactor-output (example: 1,100,200; default = all)")
+    outputs.add_argument("--contact-output", dest="contact_output", help="output file of the durations of contact")
+    outputs.add_argument("--timeline-output", dest="timeline_output",
+                         help="output file (.npz) of the contact state of each pair in each conformation, "
+                              "from which lifetimes and occupancies are computed without any new distance")
+    outputs.add_argument("--timeline-summary", dest="timeline_summary",
+                         help="output file of the occupancy, number and lifetimes of the contacts of each pair")
+    outputs.add_argument("--timeline-window", dest="timeline_window", type=int,
+                         help="sliding window (in conformations) of the occupancies of --timeline-summary")
+    outputs.add_argument("--contact-map", dest="contactmap_output",
+                         help="output file (.npz, sparse CSR matrix readable by scipy.sparse.load_npz) of the number "
+                              "of conformations in contact of every pair of residues of different domains")
+    outputs.add_argument("--contact-map-summary", dest="contactmap_summary",
+                         help="output file of all the pairs of residues of different domains in contact, "
+                              "by decreasing frequency")
+    outputs.add_argument("--checkpoint", type=int,
+                         help="rewrite the output files with the results of the conformations already analyzed "
+                              "every N conformations (rounded to whole chunks with -j), so that a long run can be "
+                              "followed while it is going (default: written once at the end)")
+    outputs.add_argument("--checkpoint-delay", dest="checkpoint_delay", type=float,
+                         help="minimum number of seconds between two rewrites of the output files by --checkpoint "
+                              "(default: none, 30 with --follow)")
+    outputs.add_argument("--overwrite", action="store_true", default=None, help="overwrite the existing output files")
+
+    timing = parser.add_argument_group("instrumentation (nothing is measured without these options)")
+    timing.add_argument("--timing", nargs="?", const=True,
+                        help="write the wall and CPU times of each stage (parse, rmsd, interface, contacts, writing...), "
+                             "the frames/s and the memory high-water marks as JSON in this file "
+                             "(default = timing.json next to the outputs)")
+    timing.add_argument("--progress", action="store_true", default=None,
+                        help="print the number of conformations analyzed, the frames/s, the remaining time and the "
+                             "memory high-water mark every 10 s (on the error output)")
+    timing.add_argument("--profile", choices=("cprofile", "sample"),
+                        help="profile the run: 'cprofile' writes timing.prof (python -m pstats), 'sample' writes the "
+                             "stacks sampled every 5 ms in timing.folded (flame graphs); only the main process is "
+                             "profiled with -j")
+
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--batch", action="store_true",
+                       help="never ask anything: the missing parameters are errors")
+    batch.add_argument("--job", help="job file (.json, .yaml, .yml or .toml) giving the parameters; "
+                                     "the command line options take precedence")
+    batch.add_argument("--manifest", help="file listing many jobs (for example replicas of a dynamics), "
+                                          "completed by --job and the command line options")
+    batch.add_argument("--jobs", type=int, default=1,
+                       help="number of jobs of the manifest run at the same time (default = 1)")
+    return parser
+
 
 def exists_file(f):
     """
@@ -77,128 +222,82 @@ def overwrite_file(f):
     return f
 
 
-# Get arguments
-# =============
-
-try:
-    ref_file = sys.argv[sys.argv.index("-ref")+1]
-except:
-    usage()
-    print("ERROR: please, enter the name of the reference pdb input")
-    sys.exit()
-
-try:
-    conf_file = sys.argv[sys.argv.index("-conf")+1]
-except:
-    usage()
-    print("ERROR: please, enter the name of the conformations pdb input")
-    sys.exit()
-
-try:
-    f = open(ref_file)
-    f.close()
-except:
-    print("ERROR: this file does not exist: ", ref_file)
-    sys.exit()
-
-try:
-    f = open(conf_file)
-    f.close()
-except:
-    print("ERROR: this file does not exist: ", conf_file)
-    sys.exit()
-
-try:
-    threshold = float(sys.argv[sys.argv.index("-th")+1])
-except:
-    threshold = 9.0
-
-try:
-    rmsd_mode = sys.argv[sys.argv.index("-rmsd")+1]
-except:
-    rmsd_mode = "CM"
-
-try:
-    dist_mode = sys.argv[sys.argv.index("-mode")+1]
-except:
-    dist_mode = "CM"
-
-
-list_dom_prot = input("Please, enter the list of proteic domains identifiers (example: A1,A2,A3,A4) :").split(sep=",")
-dom_rna = input("Please, enter the RNA domain identifier (example: B) :")
-parsing_list = list(list_dom_prot)
-parsing_list.append(dom_rna)
-
-# ----------------------------------------
-# Parsing de la conformation de reference
-# ----------------------------------------
-
-ref = PDBparser(ref_file, parsing_list)
-
-
-# ------------------------------
-# Parsing des 500 conformations
-# ------------------------------
-
-frames = PDBparserMulti(conf_file, parsing_list)
-
-
-# --------------------------------------------------------------------------------------------
-# Calcul du RMSD entre la structure de reference et chacune des conformations de la dynamique
-# --------------------------------------------------------------------------------------------
-
-rmsd_output = input("Please, enter the name of the output file to store the RMSDs\n(example: rmsd.txt): ")
-# Verifie si le fichier existe deja:
-rmsd_output = overwrite_file(rmsd_output)
-
-computeRMSD(ref, frames, list_dom_prot, rmsd_mode, rmsd_output)
-
-
-# ---------------------------------------------------------------------------
-
-# ----------------------------------------------------------------------------------------------------------
-# Calcul de la matrice des distances entre chaque domaine proteique et l'ARN pour la structure de reference
-# ----------------------------------------------------------------------------------------------------------
-
-distmat_ref = input("Do you want to show the distance matrices (between the proteic domains and RNA)\nfor the reference structure as heatmaps ? (yes / no) ")
-if distmat_ref == "yes" or distmat_ref == "Yes":
-    for dom in list_dom_prot:
-        distMatrix(ref, dom, dom_rna, dist_mode)
-
-
-# -------------------------------------------------------------------------------------------------
-# Calcul de la frequence d'appartenance a l'interface avec l'ARN pour chaque residu de la proteine
-# -------------------------------------------------------------------------------------------------
+def askMissing(config):
+    """
+    Demande a l'utilisateur les parametres absents de la ligne de commande (mode interactif).
+    :param config: Dictionnaire des parametres deja connus, complete sur place.
+    """
+    if config.get('domains') is None:
+        config['domains'] = input("Please, enter the list of proteic domains identifiers (example: A1,A2,A3,A4) :")
+    if config.get('rna') is None:
+        config['rna'] = input("Please, enter the RNA domain identifier (example: B) :")
 
-freq_output = input("Please, enter the name of the output file to store the frequences\nof belonging to the interface (example: freq.txt): ")
-freq_output = overwrite_file(freq_output)
+    if config.get('rmsd_output') is None:
+        config['rmsd_output'] = input("Please, enter the name of the output file to store the RMSDs\n(example: rmsd.txt): ")
+    # Verifie si le fichier existe deja:
+    config['rmsd_output'] = overwrite_file(config['rmsd_output'])
 
-writing = input("Do you want to get a pdb file with B-factors different for\nresidues belonging to the interface ? (yes / no)")
-if writing == "yes" or writing == "Yes":
-    bfactor_output = input("Please enter the name of the output pdb file (example: bfactor.pdb):")
-    bfactor_output = overwrite_file(bfactor_output)
-    freq_interface = resInterface(frames, list_dom_prot, dom_rna, threshold, dist_mode, freq_output, writePDB=bfactor_output)
-else:
-    freq_interface = resInterface(frames, list_dom_prot, dom_rna, threshold, dist_mode, freq_output)
+    if config.get('distmat') is None:
+        distmat_ref = input("Do you want to draw the distance matrices (between the proteic domains and RNA)\nfor the reference structure as heatmaps ? (yes / no) ")
+        config['distmat'] = distmat_ref == "yes" or distmat_ref == "Yes"
 
+    if config.get('freq_output') is None:
+        config['freq_output'] = input("Please, enter the name of the output file to store the frequences\nof belonging to the interface (example: freq.txt): ")
+    config['freq_output'] = overwrite_file(config['freq_output'])
 
-# ------------------------------------------------------------------------------------
-# Calcul des temps de contact entre paires de residus choisis a partir de la Figure 2
-# ------------------------------------------------------------------------------------
+    if config.get('bfactor_output') is None:
+        writing = input("Do you want to get a pdb file with B-factors different for\nresidues belonging to the interface ? (yes / no)")
+        if writing == "yes" or writing == "Yes":
+            config['bfactor_output'] = input("Please enter the name of the output pdb file (example: bfactor.pdb):")
+    if config.get('bfactor_output') is not None:
+        config['bfactor_output'] = overwrite_file(config['bfactor_output'])
 
-pairs = {'41': {'dom1':'A4', 'res2':'32', 'dom2':'B'},
-         '100':{'dom1':'A4', 'res2':'31', 'dom2':'B'},
-         '46': {'dom1':'A4', 'res2':'25', 'dom2':'B'},
-         '34': {'dom1':'A3', 'res2':'33', 'dom2':'B'},
-         '6' : {'dom1':'A3', 'res2':'63', 'dom2':'A4'},
-         '66': {'dom1':'A4', 'res2':'41', 'dom2':'A3'},
-         '98': {'dom1':'A4', 'res2':'30', 'dom2':'B'},
-         '26': {'dom1':'A3', 'res2':'65', 'dom2':'A4'}}
+    if config.get('contact_output') is None:
+        config['contact_output'] = input("Please, enter the name of the output file to store the durations\n of contact: ")
+    config['contact_output'] = overwrite_file(config['contact_output'])
 
-contact_output = input("Please, enter the name of the output file to store the durations\n of contact: ")
-contact_output = overwrite_file(contact_output)
+    if config.get('duration') is None:
+        config['duration'] = int(input("Please, enter the duration of the dynamic (in ns):"))
 
-duration = int(input("Please, enter the duration of the dynamic (in ns):"))
+    config['overwrite'] = True   # l'utilisateur a deja accepte d'ecraser les fichiers existants
 
-contacts = contactTime(pairs, frames, threshold, duration, dist_mode, contact_output)
 
+def main():
+    """
+    Programme principal: lit les arguments (et le fichier de job ou le manifeste), puis execute le ou les jobs.
+    """
+    parser = buildParser()
+    args = parser.parse_args()
+
+    options = vars(args)
+    batch = options.pop('batch') or args.job is not None or args.manifest is not None
+    jobFile = options.pop('job')
+    manifest = options.pop('manifest')
+    maxJobs = options.pop('jobs')
+
+    config = loadJob(jobFile) if jobFile is not None else dict()
+    config.update((key, value) for key, value in options.items() if value is not None)
+
+    try:
+        if manifest is not None:
+            errors = runManifest(loadManifest(manifest, config), maxJobs)
+            failed = sum(e is not None for e in errors)
+            if failed:
+                print("ERROR: %d of %d jobs failed" % (failed, len(errors)))
+                sys.exit(1)
+            return
+
+        for key in ('ref', 'conf'):
+            if config.get(key) is None:
+                parser.error("please, enter the name of the %s pdb input (-%s)"
+                             % ("reference" if key == 'ref' else "conformations", key))
+        if not batch:
+            askMissing(config)
+        runJob(makeJob(config))
+    except (ValueError, OSError, ImportError) as e:
+        print("ERROR:", e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Neighbour search with a uniform cell list: finds all the pairs of points (atoms or
+centers of mass of residues) closer than a cutoff without comparing every pair. Sets whose bounding
+boxes are farther than the cutoff are skipped, and the candidate pairs are processed in blocks
+bounded by a memory budget, so that the memory does not grow with the size of the domains.
+"""
+
+import numpy as np
+
+# decalages vers les 27 cellules voisines (cellule courante comprise)
+_NEIGHBOURS = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
+# taille maximale (en octets) des tableaux temporaires d'un calcul de distances, par defaut
+MEMORY_BUDGET = 256 * 1024 * 1024
+PAIR_BYTES = 64    # octets par couple candidat de la liste de cellules (indices, differences, distance)
+CELL_BYTES = 56    # octets par case d'un bloc de distances (differences, carres et leur somme)
+
+# cle du memo d'une conformation donnant la source des couples de residus (voir resultCache.PairCacheAccumulator)
+PAIR_SOURCE = 'pairSource'
+
+
+def tileRows(nCols, bytesPerCell, budget=None):
+    """
+    :param nCols: Nombre de colonnes du bloc.
+    :param bytesPerCell: Memoire utilisee par case du bloc.
+    :param budget: Memoire disponible (en octets), MEMORY_BUDGET par defaut.
+    :return: Le nombre de lignes d'un bloc qui tient dans le budget (au moins 1).
+    """
+    budget = MEMORY_BUDGET if budget is None else budget
+    return max(1, int(budget // (bytesPerCell * max(nCols, 1))))
+
+
+def splitRows(weights, limit):
+    """
+    Decoupe des lignes consecutives en blocs dont la somme des poids ne depasse pas limit
+    (un bloc contient au moins une ligne, meme si son poids depasse limit).
+    :param weights: Poids (entiers positifs) de chaque ligne.
+    :param limit: Poids maximal d'un bloc.
+    :return: Liste des couples (debut, fin) des blocs.
+    """
+    cumul = np.cumsum(weights)
+    bounds = []
+    start = 0
+    while start < len(cumul):
+        base = cumul[start - 1] if start > 0 else 0
+        stop = max(int(np.searchsorted(cumul, base + limit, side='right')), start + 1)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def _inBox(coords, low, high):
+    """
+    :return: Le masque des points de coords dans la boite [low, high].
+    """
+    return ((coords >= low) & (coords <= high)).all(axis=1)
+
+
+def neighbourPairs(coords1, coords2, cutoff, budget=None):
+    """
+    Cherche tous les couples de points (un dans chaque ensemble) a une distance inferieure ou egale a cutoff.
+    Seuls les points a moins de cutoff de la boite englobante de l'autre ensemble sont gardes (aucun calcul si les
+    boites sont eloignees); l'espace est ensuite decoupe en cellules cubiques de cote cutoff: seuls les points de
+    cellules voisines sont compares, par blocs de points de coords1 dont les couples candidats tiennent dans budget.
+    :param coords1: Tableau (n1, 3) des coordonnees du premier ensemble.
+    :param coords2: Tableau (n2, 3) des coordonnees du second ensemble.
+    :param cutoff: Distance maximale (en Angstrom).
+    :param budget: Memoire maximale (en octets) des couples candidats d'un bloc, MEMORY_BUDGET par defaut.
+    :return: Trois tableaux (i, j, d): indices dans coords1, indices dans coords2 et distances, tries par (i, j).
+    """
+    if cutoff <= 0:
+        raise ValueError("The cutoff must be strictly positive: %s" % cutoff)
+
+    empty = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0))
+    if len(coords1) == 0 or len(coords2) == 0:
+        return empty
+
+    # boites englobantes, elargies d'une marge qui couvre les arrondis (float32 compris): un point hors de la boite
+    # de l'autre ensemble elargie de cutoff n'a aucun voisin
+    reach = cutoff * 1.001 + 1e-3
+    index2 = np.flatnonzero(_inBox(coords2, coords1.min(axis=0) - reach, coords1.max(axis=0) + reach))
+    if len(index2) == 0:
+        return empty
+    index1 = np.flatnonzero(_inBox(coords1, coords2[index2].min(axis=0) - reach, coords2[index2].max(axis=0) + reach))
+    if len(index1) == 0:
+        return empty
+    points1 = coords1[index1]
+    points2 = coords2[index2]
+
+    # indices (entiers) des cellules, decales de 1 pour que les cellules voisines restent positives
+    origin = np.minimum(points1.min(axis=0), points2.min(axis=0))
+    cells1 = np.floor((points1 - origin) / cutoff).astype(np.int64) + 1
+    cells2 = np.floor((points2 - origin) / cutoff).astype(np.int64) + 1
+    dims = np.maximum(cells1.max(axis=0), cells2.max(axis=0)) + 2
+
+    ids1 = (cells1[:, 0] * dims[1] + cells1[:, 1]) * dims[2] + cells1[:, 2]
+    ids2 = (cells2[:, 0] * dims[1] + cells2[:, 1]) * dims[2] + cells2[:, 2]
+    order2 = np.argsort(ids2, kind='stable')
+    sorted2 = ids2[order2]
+    shifts = [(di * dims[1] + dj) * dims[2] + dk for di, dj, dk in _NEIGHBOURS]
+
+    # nombre de couples candidats de chaque point, pour decouper coords1 en blocs qui tiennent dans le budget
+    candidates = np.zeros(len(points1), dtype=np.int64)
+    for shift in shifts:
+        candidates += (np.searchsorted(sorted2, ids1 + shift, side='right')
+                       - np.searchsorted(sorted2, ids1 + shift, side='left'))
+    limit = max(1, (MEMORY_BUDGET if budget is None else budget) // PAIR_BYTES)
+
+    list_i = []
+    list_j = []
+    list_d = []
+    for start, stop in splitRows(candidates, limit):
+        if candidates[start:stop].sum() == 0:
+            continue
+        ids = ids1[start:stop]
+        for shift in shifts:
+            lo = np.searchsorted(sorted2, ids + shift, side='left')
+            hi = np.searchsorted(sorted2, ids + shift, side='right')
+            counts = hi - lo
+            total = counts.sum()
+            if total == 0:
+                continue
+            # deroule les intervalles [lo, hi) de chaque point du bloc
+            i = np.repeat(np.arange(start, stop), counts)
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            j = order2[starts + np.arange(total)]
+            d = np.sqrt(((points1[i] - points2[j]) ** 2).sum(axis=1))
+            keep = d <= cutoff
+            list_i.append(i[keep])
+            list_j.append(j[keep])
+            list_d.append(d[keep])
+
+    if not list_i:
+        return empty
+
+    i = index1[np.concatenate(list_i)]
+    j = index2[np.concatenate(list_j)]
+    d = np.concatenate(list_d)
+
+    order = np.lexsort((j, i))
+    return i[order], j[order], d[order]
+
+
+def residuePairs(dico, dom1, dom2, cutoff, mode, memo=None, budget=None):
+    """
+    Cherche les couples de residus de 2 domaines a une distance inferieure ou egale a cutoff.
+    :param dico: Structure correspondant au complexe proteine-ARN.
+    :param dom1: Nom du premier domaine.
+    :param dom2: Nom du second domaine.
+    :param cutoff: Distance maximale (en Angstrom).
+    :param mode: 'CM' (distance entre centres de masse) ou 'atom' (distance entre les 2 atomes les plus proches).
+    :param memo: Dictionnaire optionnel propre a la conformation: la recherche n'est faite qu'une fois
+    pour les memes parametres (par exemple par l'interface et les contacts dans analyseFrames), par la fonction
+    memo[PAIR_SOURCE] si elle existe (memes arguments et resultat que residuePairs, par exemple relus dans un cache).
+    :param budget: Memoire maximale (en octets) des tableaux temporaires (voir neighbourPairs); sans effet sur le resultat.
+    :return: Trois tableaux (r1, r2, d): indices des residus dans chaque domaine (rang dans 'reslist') et distances,
+    tries par (r1, r2).
+    """
+    if memo is not None:
+        key = ('residuePairs', dom1, dom2, cutoff, mode)
+        if key not in memo:
+            source = memo.get(PAIR_SOURCE)
+            if source is None:
+                memo[key] = residuePairs(dico, dom1, dom2, cutoff, mode, budget=budget)
+            else:
+                memo[key] = source(dico, dom1, dom2, cutoff, mode, budget)
+        return memo[key]
+
+    if mode == "CM":
+        return neighbourPairs(dico.chainCenters(dom1), dico.chainCenters(dom2), cutoff, budget)
+
+    elif mode == "atom":
+        offsets1 = dico.chainResOffsets(dom1)
+        offsets2 = dico.chainResOffsets(dom2)
+        i, j, d = neighbourPairs(dico.coords[dico.chainAtoms(dom1)], dico.coords[dico.chainAtoms(dom2)], cutoff, budget)
+        if len(d) == 0:
+            return i, j, d
+        # residu de chaque atome, puis distance minimale pour chaque couple de residus
+        r1 = np.searchsorted(offsets1, i, side='right') - 1
+        r2 = np.searchsorted(offsets2, j, side='right') - 1
+        order = np.lexsort((r2, r1))
+        r1, r2, d = r1[order], r2[order], d[order]
+        first = np.flatnonzero(np.r_[True, (r1[1:] != r1[:-1]) | (r2[1:] != r2[:-1])])
+        return r1[first], r2[first], np.minimum.reduceat(d, first)
+
+    raise ValueError("Unknown distance mode: %s" % mode)
+
+
+def pairCodes(dico, dom1, dom2, pairs):
+    """
+    Code les couples de residus a suivre comme r1 * n2 + r2, a comparer aux couples de residuePairs.
+    :param dico: Structure correspondant au complexe proteine-ARN.
+    :param dom1: Nom du domaine des premiers residus.
+    :param dom2: Nom du domaine des seconds residus.
+    :param pairs: Liste des couples (residu de dom1, residu de dom2).
+    :return: Le tableau des codes (rangs dans 'reslist') de chaque couple.
+    """
+    for dom in (dom1, dom2):
+        if dom not in dico.chainOffsets:
+            raise ValueError("Domain %s is not in the topology" % dom)
+    rank1 = dict((res, i) for i, res in enumerate(dico.chainResList(dom1)))
+    rank2 = dict((res, i) for i, res in enumerate(dico.chainResList(dom2)))
+    for res1, res2 in pairs:
+        for res, dom, rank in ((res1, dom1, rank1), (res2, dom2, rank2)):
+            if res not in rank:
+                raise ValueError("Residue %s of the pair %s-%s is not in domain %s of the topology"
+                                 % (res, res1, res2, dom))
+    return np.array([rank1[res1] * len(rank2) + rank2[res2] for res1, res2 in pairs], dtype=np.int64)
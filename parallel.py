@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Frame-parallel execution of the analyses: contiguous chunks of MODEL records are
+parsed and analysed by a pool of processes, and the partial results are merged in MODEL order.
+Several analyses (accumulators) can share a single pass over the conformations.
+"""
+
+import copy
+import io
+import itertools
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ParserPDB import FrameDecoder, PDBiterMulti, iterFrames
+from indexPDB import loadIndex
+from profiling import RunTimer
+from readerPDB import compression, streamBlocks
+from trajectoryCache import loadCache
+from writerPDB import END_RECORD, openOutput
+
+
+class ParallelFrames(object):
+    """
+    Conformations d'une dynamique a analyser en parallele.
+    Peut etre passee a la place du dictionnaire de conformations a computeRMSD, resInterface et contactTime.
+    """
+
+    def __init__(self, pdbFile, list_dom, workers, start=0, stop=None, step=1, chunkSize=50, dtype=np.float64,
+                 massWeighted=False, selection=None):
+        """
+        :param pdbFile: Fichier pdb contenant toutes les conformations de la dynamique.
+        :param list_dom: Liste des domaines a parser.
+        :param workers: Nombre de processus.
+        :param start, stop, step: Selection des conformations (voir PDBiterMulti).
+        :param chunkSize: Nombre de conformations consecutives confiees a un processus.
+        :param dtype: Type des coordonnees.
+        :param massWeighted: Si True, les centres de masse des residus sont ponderes par la masse des atomes.
+        :param selection: Regles de selection des atomes (voir ParserPDB.PDBparserConf).
+        """
+        if workers < 1:
+            raise ValueError("The number of workers must be a positive integer: %s" % workers)
+        if chunkSize < 1:
+            raise ValueError("The chunk size must be a positive integer: %s" % chunkSize)
+        self.pdbFile = pdbFile
+        self.list_dom = list_dom
+        self.workers = workers
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.chunkSize = chunkSize
+        self.dtype = dtype
+        self.massWeighted = massWeighted
+        self.selection = selection
+
+    def chunks(self):
+        """
+        :return: Generateur de range de chunkSize rangs de conformations consecutives; pour un fichier compresse
+        sans cache (pas d'acces direct), generateur de listes de chunkSize blocs (modele, lignes) deja decompresses.
+        """
+        cache = loadCache(self.pdbFile, self.list_dom, self.selection)
+        if cache is None and compression(self.pdbFile) is not None:
+            chunk = []
+            for block in streamBlocks(self.pdbFile, self.start, self.stop, self.step):
+                chunk.append(block)
+                if len(chunk) == self.chunkSize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+            return
+
+        ranks = (cache if cache is not None else loadIndex(self.pdbFile)).select(self.start, self.stop, self.step)
+        for i in range(0, len(ranks), self.chunkSize):
+            yield ranks[i:i + self.chunkSize]
+
+
+class Accumulator(ABC):
+    """
+    Analyse alimentee conformation par conformation par analyseFrames.
+    Une copie vide (spawn) accumule chaque partie des conformations; son resultat partiel (partial) est
+    ensuite fusionne (merge) dans l'accumulateur d'origine, qui ecrit les resultats (finish).
+    Les sous-classes doivent definir reset, update, partial, merge et finish.
+    """
+
+    stage = "analysis"   # nom de l'etape dans le rapport des temps (voir profiling.RunTimer)
+
+    def spawn(self):
+        """
+        :return: Un accumulateur de memes parametres, sans aucune conformation.
+        """
+        acc = copy.copy(self)
+        acc.reset()
+        return acc
+
+    @abstractmethod
+    def reset(self):
+        """
+        Vide l'etat de l'accumulateur (les conteneurs doivent etre recrees, spawn faisant une copie superficielle).
+        """
+
+    @abstractmethod
+    def update(self, model, conf, memo, fout=None):
+        """
+        Ajoute une conformation.
+        :param model: Numero du modele.
+        :param conf: Structure de la conformation.
+        :param memo: Dictionnaire propre a la conformation, partage par les accumulateurs (voir residuePairs).
+        :param fout: Fichier pdb de sortie optionnel.
+        """
+
+    @abstractmethod
+    def partial(self):
+        """
+        :return: Le resultat partiel (serialisable) des conformations ajoutees.
+        """
+
+    @abstractmethod
+    def merge(self, partial):
+        """
+        Fusionne un resultat partiel, les parties etant fusionnees dans l'ordre des conformations.
+        """
+
+    @abstractmethod
+    def finish(self):
+        """
+        Ecrit les resultats de toutes les conformations fusionnees.
+        :return: Le resultat de l'analyse.
+        """
+
+    def cacheKey(self):
+        """
+        :return: Les parametres dont depend le resultat partiel (hors fichiers de sortie), pour l'enregistrer dans un
+        cache de resultats (voir resultCache.analyseCached), ou None si le resultat n'est pas mis en cache.
+        partial doit alors pouvoir etre appele apres la fusion de toutes les parties.
+        """
+        return None
+
+    def checkpoint(self):
+        """
+        Ecrit, pendant l'analyse, les resultats des conformations deja fusionnees (voir analyseFrames), que finish
+        remplace a la fin. Par defaut appelle finish, qui ne doit donc pas modifier l'etat de l'accumulateur.
+        """
+        self.finish()
+
+
+def analyseFrames(frames, accumulators, writePDB=None, timer=None, checkpoint=None, checkpointDelay=None):
+    """
+    Parcourt une seule fois les conformations et fournit chacune d'elles a tous les accumulateurs.
+    :param frames: Dictionnaire, iterable de couples (modele, Structure) ou ParallelFrames.
+    :param accumulators: Liste d'Accumulator.
+    :param writePDB: Fichier pdb de sortie optionnel (compresse si son extension est .gz), passe aux accumulateurs
+    (voir InterfaceAccumulator).
+    :param timer: profiling.RunTimer optionnel: temps de lecture, de chaque accumulateur et d'ecriture des resultats,
+    et progression des conformations (aucune mesure sans timer).
+    :param checkpoint: Nombre de conformations entre deux ecritures des resultats partiels (Accumulator.checkpoint),
+    arrondi a un nombre entier de chunks en parallele; None pour n'ecrire les resultats qu'a la fin.
+    :param checkpointDelay: Duree minimale (en s) entre deux points de controle, None pour aucune: les points de
+    controle plus rapproches sont sautes (les resultats qu'ils auraient ecrits le sont au suivant, ou par finish).
+    :return: La liste des resultats des accumulateurs (finish).
+    """
+    if checkpoint is not None and checkpoint < 1:
+        raise ValueError("The checkpoint interval must be a positive number of frames: %s" % checkpoint)
+    if checkpointDelay is not None and checkpointDelay < 0:
+        raise ValueError("The delay between two checkpoints must be positive (in s): %s" % checkpointDelay)
+    pieceSize = None
+    every = 1   # nombre de resultats partiels fusionnes entre deux points de controle
+    if checkpoint is not None:
+        if isinstance(frames, ParallelFrames):
+            every = max(1, round(checkpoint / frames.chunkSize))
+        else:
+            pieceSize = checkpoint
+
+    # copies vides transmises aux processus: les chunks soumis ne transportent pas les resultats deja fusionnes
+    empty = [acc.spawn() for acc in accumulators]
+    fout = None
+    if writePDB is not None:
+        fout = openOutput(writePDB)
+    try:
+        merged = 0
+        written = time.monotonic()   # instant du dernier point de controle
+        for partials in mapFrames(frames, _fusedPartial, (empty,), fout, timer, pieceSize):
+            for acc, partial in zip(accumulators, partials):
+                acc.merge(partial)
+            merged += 1
+            if checkpoint is not None and merged % every == 0:
+                if checkpointDelay is not None:
+                    if time.monotonic() - written < checkpointDelay:
+                        continue
+                    written = time.monotonic()
+                if fout is not None:
+                    fout.flush()
+                for acc in accumulators:
+                    if timer is None:
+                        acc.checkpoint()
+                    else:
+                        timer.call("checkpoint", acc.checkpoint)
+        if fout is not None:
+            fout.write(END_RECORD)
+    finally:
+        if fout is not None:
+            fout.close()
+
+    if timer is None:
+        return [acc.finish() for acc in accumulators]
+    return [timer.call("writing", acc.finish) for acc in accumulators]
+
+
+def _fusedPartial(frames, accumulators, fout=None, timer=None):
+    """
+    Fournit une partie des conformations a des copies vides des accumulateurs.
+    :return: La liste des resultats partiels, dans l'ordre des accumulateurs.
+    """
+    local = [acc.spawn() for acc in accumulators]
+    if timer is not None:
+        _timedPass(frames, local, fout, timer)
+        return [timer.call(acc.stage, acc.partial) for acc in local]   # calculs groupes de fin de morceau compris
+
+    for model, conf in iterFrames(frames):
+        memo = dict()    # resultats intermediaires partages par les accumulateurs pour cette conformation
+        for acc in local:
+            acc.update(model, conf, memo, fout)
+    return [acc.partial() for acc in local]
+
+
+def _timedPass(frames, accumulators, fout, timer):
+    """
+    Meme parcours que _fusedPartial, en mesurant chaque accumulateur (etape acc.stage) et, pour des conformations
+    lues a la volee, la lecture de chaque conformation (etape 'parse').
+    """
+    iterator = iterFrames(frames)
+    parsed = isinstance(frames, Mapping)   # dictionnaire deja parse: lecture deja mesuree
+    while True:
+        try:
+            model, conf = next(iterator) if parsed else timer.call("parse", next, iterator)
+        except StopIteration:
+            break
+        memo = dict()
+        for acc in accumulators:
+            timer.call(acc.stage, acc.update, model, conf, memo, fout)
+        timer.framesDone()
+
+
+def mapFrames(frames, func, args, fout=None, timer=None, pieceSize=None):
+    """
+    Applique une analyse partielle a des conformations, en parallele si frames est un ParallelFrames.
+    :param frames: Dictionnaire, iterable de couples (modele, Structure) ou ParallelFrames.
+    :param func: Fonction func(conformations, *args[, fout=...][, timer=...]) renvoyant un resultat partiel.
+    :param args: Arguments supplementaires de func.
+    :param fout: Fichier pdb de sortie optionnel passe a func; en parallele chaque processus ecrit dans un tampon
+    qui est recopie dans fout dans l'ordre des conformations.
+    :param timer: profiling.RunTimer optionnel passe a func; en parallele chaque processus mesure sa partie avec
+    son propre RunTimer, dont les mesures sont ajoutees a celles des processus de calcul (RunTimer.mergeWorker).
+    :param pieceSize: Sans parallelisme, nombre de conformations consecutives de chaque appel a func
+    (par defaut un seul appel pour toutes les conformations).
+    :return: Iterable des resultats partiels, dans l'ordre des conformations (calcules au fur et a mesure).
+    """
+    if not isinstance(frames, ParallelFrames):
+        kwargs = dict()
+        if fout is not None:
+            kwargs['fout'] = fout
+        if timer is not None:
+            kwargs['timer'] = timer
+        if pieceSize is None:
+            return [func(frames, *args, **kwargs)]
+        return (func(piece, *args, **kwargs) for piece in _pieces(frames, pieceSize))
+    return _mapChunks(frames, func, args, fout, timer)
+
+
+def _pieces(frames, size):
+    """
+    Decoupe des conformations en parties de size conformations consecutives, lues au fur et a mesure
+    (chaque partie doit etre parcourue avant de demander la suivante).
+    :param frames: Dictionnaire ou iterable de couples (modele, Structure).
+    :return: Generateur de dictionnaires (pour un dictionnaire) ou d'iterables de couples (modele, Structure).
+    """
+    if isinstance(frames, Mapping):
+        models = list(frames.keys())
+        for i in range(0, len(models), size):
+            yield dict((model, frames[model]) for model in models[i:i + size])
+        return
+
+    iterator = iter(frames)
+    for first in iterator:
+        yield itertools.chain([first], itertools.islice(iterator, size - 1))
+
+
+def _mapChunks(frames, func, args, fout=None, timer=None):
+    """
+    Partie parallele de mapFrames: le texte pdb et les mesures de chaque chunk sont recopies dans l'ordre.
+    :return: Generateur des resultats partiels, dans l'ordre des conformations.
+    """
+    for result, text, timing in _imapChunks(frames, func, args, fout is not None, timer is not None):
+        if fout is not None:
+            fout.write(text)
+        if timer is not None:
+            timer.mergeWorker(timing)
+        yield result
+
+
+def _imapChunks(frames, func, args, buffered, timed=False):
+    """
+    Distribue les chunks de conformations au pool de processus et renvoie les resultats dans l'ordre.
+    Le nombre de chunks en cours est borne pour que la memoire ne depende pas de la longueur de la dynamique.
+    """
+    with ProcessPoolExecutor(max_workers=frames.workers) as pool:
+        pending = []
+        for chunk in frames.chunks():
+            pending.append(pool.submit(_analyseChunk, func, frames.pdbFile, chunk, frames.list_dom, frames.dtype,
+                                       frames.massWeighted, frames.selection, args, buffered, timed))
+            if len(pending) >= 2 * frames.workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def _analyseChunk(func, pdbFile, chunk, list_dom, dtype, massWeighted, selection, args, buffered, timed=False):
+    """
+    Execute dans un processus du pool: lit (par acces direct ou dans le cache binaire) un chunk de conformations,
+    ou parse les blocs de texte du chunk, puis lui applique l'analyse.
+    :return: Le resultat partiel, le texte pdb ecrit par l'analyse (ou None) et les mesures du chunk (ou None, voir timed).
+    """
+    if isinstance(chunk, range):
+        conformations = PDBiterMulti(pdbFile, list_dom, dtype, chunk.start, chunk.stop, chunk.step,
+                                     massWeighted=massWeighted, selection=selection)
+    else:
+        decoder = FrameDecoder(list_dom, dtype, massWeighted, selection)
+        conformations = ((model, decoder.decode(lines)) for model, lines in chunk)
+    kwargs = dict()
+    timer = None
+    if timed:
+        timer = RunTimer()
+        kwargs['timer'] = timer
+    if buffered:
+        kwargs['fout'] = io.StringIO()
+    result = func(conformations, *args, **kwargs)
+    return (result, kwargs['fout'].getvalue() if buffered else None,
+            timer.partial() if timer is not None else None)
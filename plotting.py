@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Lazy access to matplotlib for the reporting stage: matplotlib is only imported when a
+figure is requested, with the headless Agg backend unless the figures are shown in windows.
+"""
+
+import os
+
+FORMATS = ("png", "svg")
+
+
+def pyplot(show=False):
+    """
+    Importe matplotlib.pyplot a la premiere figure demandee.
+    :param show: Si True, les figures sont affichees dans des fenetres (backend par defaut de matplotlib),
+    sinon le backend Agg (sans affichage) est utilise.
+    :return: Le module matplotlib.pyplot.
+    """
+    import matplotlib
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def figurePath(directory, name, fmt="png"):
+    """
+    :return: Le chemin du fichier d'une figure: directory/name.fmt.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown figure format (expected %s): %s" % (" or ".join(FORMATS), fmt))
+    return os.path.join(directory, name + "." + fmt)
+
+
+def saveFigure(fig, path, show=False):
+    """
+    Ecrit une figure dans un fichier (PNG ou SVG selon l'extension), ou l'affiche, puis la ferme.
+    :param fig: Figure matplotlib.
+    :param path: Fichier de sortie (ignore si show).
+    :param show: Si True, la figure est affichee au lieu d'etre ecrite.
+    :return: Le fichier ecrit, ou None.
+    """
+    plt = pyplot(show)
+    try:
+        if show:
+            plt.show()
+            return None
+        fig.savefig(path)
+        return path
+    finally:
+        plt.close(fig)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Instrumentation of long runs: wall and CPU time of each stage (parsing, RMSD, interface,
+contacts, writing), progress in frames/s, memory high-water marks and optional profilers (cProfile,
+or a sampling profiler writing folded stacks for flame graphs), with a JSON timing report.
+Nothing is measured when no RunTimer is given to the analyses.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:   # Windows: pas de mesure de la memoire
+    resource = None
+
+REPORT_FORMAT = 1
+PROFILERS = ("cprofile", "sample")
+
+
+def peakRSS(children=False):
+    """
+    :param children: Si True, pic des processus fils termines (processus de calcul en parallele).
+    :return: Le pic de memoire residente (en Mo), ou None si la mesure n'est pas disponible.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # octets sous macOS, Ko sous Linux
+
+
+def _duration(seconds):
+    """
+    :return: Une duree au format h:mm:ss.
+    """
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class RunTimer(object):
+    """
+    Temps (horloge et CPU) et nombre d'appels de chaque etape d'une execution, et progression des conformations.
+    """
+
+    def __init__(self, progress=False, total=None, interval=10.0, stream=None):
+        """
+        :param progress: Si True, la progression est affichee au plus toutes les interval secondes.
+        :param total: Nombre de conformations attendues (pour le pourcentage et le temps restant), optionnel.
+        :param interval: Intervalle (en s) entre deux affichages de la progression.
+        :param stream: Flux de la progression (sys.stderr par defaut).
+        """
+        self.progress = progress
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.stages = OrderedDict()    # etape -> [horloge, CPU, appels] dans ce processus
+        self.workers = OrderedDict()   # idem, sommes sur les processus de calcul en parallele
+        self.frames = 0
+        self.begin = time.perf_counter()
+        self.beginCpu = time.process_time()
+        self._shown = self.begin
+
+    def add(self, name, wall, cpu, calls=1, stages=None):
+        """
+        Ajoute une mesure a une etape.
+        """
+        stages = self.stages if stages is None else stages
+        total = stages.setdefault(name, [0.0, 0.0, 0])
+        total[0] += wall
+        total[1] += cpu
+        total[2] += calls
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Mesure le bloc with comme une execution de l'etape name.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def call(self, name, func, *args):
+        """
+        :return: Le resultat de func(*args), mesure comme une execution de l'etape name.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return func(*args)
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def partial(self):
+        """
+        :return: Les mesures de ce processus et son nombre de conformations (pour mergeWorker).
+        """
+        return dict(self.stages), self.frames
+
+    def mergeWorker(self, partial):
+        """
+        Ajoute les mesures d'un processus de calcul (partial) et ses conformations a la progression.
+        """
+        stages, frames = partial
+        for name, (wall, cpu, calls) in stages.items():
+            self.add(name, wall, cpu, calls, self.workers)
+        self.framesDone(frames)
+
+    def framesDone(self, nb=1):
+        """
+        Compte des conformations traitees et affiche la progression si l'intervalle est ecoule.
+        """
+        self.frames += nb
+        if self.progress:
+            now = time.perf_counter()
+            if now - self._shown >= self.interval:
+                self._shown = now
+                self.showProgress(now)
+
+    def showProgress(self, now=None):
+        """
+        Affiche le nombre de conformations traitees, le debit, le temps ecoule (et restant) et le pic de memoire.
+        """
+        elapsed = (now or time.perf_counter()) - self.begin
+        rate = self.frames / elapsed if elapsed > 0 else 0.0
+        line = "[progress] %d" % self.frames
+        if self.total:
+            line += "/%d frames (%.0f %%)" % (self.total, 100.0 * self.frames / self.total)
+        else:
+            line += " frames"
+        line += "  %.1f frames/s  elapsed %s" % (rate, _duration(elapsed))
+        if self.total and rate > 0:
+            line += "  remaining %s" % _duration(max(self.total - self.frames, 0) / rate)
+        peak = peakRSS()
+        if peak is not None:
+            line += "  peak RSS %.0f MB" % peak
+        stream = self.stream or sys.stderr
+        stream.write(line + "\n")
+        stream.flush()
+
+    def report(self):
+        """
+        :return: Le rapport (dictionnaire enregistrable en JSON) des mesures.
+        """
+        elapsed = time.perf_counter() - self.begin
+
+        def table(stages):
+            return OrderedDict((name, {'wall_s': wall, 'cpu_s': cpu, 'calls': calls})
+                               for name, (wall, cpu, calls) in stages.items())
+
+        report = OrderedDict([('format', REPORT_FORMAT), ('wall_s', elapsed), ('cpu_s', time.process_time() - self.beginCpu),
+                              ('frames', self.frames), ('frames_per_s', self.frames / elapsed if elapsed > 0 else None),
+                              ('peak_rss_mb', peakRSS()), ('children_peak_rss_mb', peakRSS(children=True)),
+                              ('stages', table(self.stages))])
+        if self.workers:
+            report['workers'] = table(self.workers)
+        return report
+
+    def write(self, output):
+        """
+        Ecrit le rapport JSON des mesures.
+        """
+        with open(output, "w") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+
+def timedStage(timer, name):
+    """
+    :return: Le contexte qui mesure l'etape name avec timer (RunTimer.stage), ou un contexte vide si timer est None.
+    """
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+class SamplingProfiler(object):
+    """
+    Profileur par echantillonnage: un thread releve la pile du thread principal a intervalle regulier.
+    Les piles sont ecrites au format 'folded' (fonction;fonction;... nombre) de flamegraph.pl et speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        """
+        :param interval: Intervalle (en s) entre deux echantillons.
+        """
+        self.interval = interval
+        self.counts = dict()
+        self._target = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def enable(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def dump_stats(self, output):
+        """
+        Ecrit les piles echantillonnees (une ligne par pile, suivie de son nombre d'echantillons).
+        """
+        with open(output, "w") as f:
+            for stack, nb in sorted(self.counts.items(), key=lambda item: -item[1]):
+                f.write("%s %d\n" % (stack, nb))
+
+
+def makeProfiler(kind):
+    """
+    :param kind: 'cprofile' (cProfile, statistiques lisibles par pstats) ou 'sample' (voir SamplingProfiler).
+    :return: Le profileur, a demarrer avec enable() et arreter avec disable(); dump_stats(fichier) ecrit ses resultats.
+    """
+    if kind == "cprofile":
+        return cProfile.Profile()
+    if kind == "sample":
+        return SamplingProfiler()
+    raise ValueError("Unknown profiler (expected %s): %s" % (" or ".join(PROFILERS), kind))
+
+
+def profilePath(report, kind):
+    """
+    :return: Le fichier du profil, a cote du rapport JSON: timing.prof (cProfile) ou timing.folded (echantillonnage).
+    """
+    return os.path.splitext(report)[0] + (".prof" if kind == "cprofile" else ".folded")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Transparent reading of compressed PDB files (gzip, bzip2, xz, detected from their first
+bytes): the text is decompressed while it is parsed, with the multi-threaded pigz for gzip when it is
+installed, and multi-model files are split into MODEL blocks in a single sequential pass. A file still
+being written by a simulation can also be followed, its MODEL blocks being read as soon as they are complete.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import re
+import shutil
+import subprocess
+import time
+
+# signature (premiers octets) de chaque format de compression
+_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+# enregistrements MODEL, ENDMDL et END en debut de ligne (voir indexPDB), pour suivre un fichier en cours d'ecriture
+_RECORDS = re.compile(rb'^(?:MODEL(?=[ \r\n]|$)|ENDMDL|END(?=[ \r\n]|$))', re.M)
+
+PIGZ = shutil.which("pigz")
+
+
+def compression(pdbFile):
+    """
+    :return: Le format de compression du fichier ('gzip', 'bz2' ou 'xz'), ou None s'il n'est pas compresse.
+    """
+    with open(pdbFile, 'rb') as f:
+        head = f.read(6)
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+class _PipeReader(object):
+    """
+    Lignes de texte produites par un processus de decompression (pigz).
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+        self.text = io.TextIOWrapper(self.proc.stdout, encoding='latin-1')
+
+    def __iter__(self):
+        for line in self.text:
+            yield line
+        if self.proc.wait() != 0:
+            raise OSError("%s failed: %s" % (" ".join(self.command), self.proc.stderr.read().decode(errors='replace')))
+
+    def close(self):
+        if self.proc.poll() is None:   # lecture interrompue avant la fin du fichier
+            self.proc.kill()
+        self.text.close()
+        self.proc.stderr.close()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def openInput(pdbFile):
+    """
+    Ouvre un fichier pdb en lecture (mode texte), en le decompressant a la volee s'il est compresse.
+    :param pdbFile: Fichier pdb, eventuellement compresse (gzip, bzip2 ou xz).
+    :return: Un fichier (iterable de lignes) a utiliser dans un bloc with.
+    """
+    kind = compression(pdbFile)
+    if kind is None:
+        return open(pdbFile, encoding='latin-1')
+    if kind == 'gzip' and PIGZ is not None:
+        return _PipeReader([PIGZ, "-dc", pdbFile])
+    return _OPENERS[kind](pdbFile, 'rt', encoding='latin-1')
+
+
+def _isModel(line):
+    """
+    :return: True si la ligne est un enregistrement MODEL (colonnes 1-6), comme dans indexPDB.
+    """
+    return line.startswith("MODEL") and (len(line) == 5 or line[5] in " \r\n")
+
+
+def countModels(pdbFile):
+    """
+    :return: Le nombre de conformations d'un fichier pdb, par une lecture sequentielle (1 pour un fichier non vide sans MODEL).
+    """
+    nb = 0
+    empty = True
+    with openInput(pdbFile) as f:
+        for line in f:
+            empty = False
+            if _isModel(line):
+                nb += 1
+    return 0 if empty else max(nb, 1)
+
+
+def streamBlocks(pdbFile, start=0, stop=None, step=1):
+    """
+    Decoupe un fichier pdb (eventuellement compresse) en blocs MODEL ... ENDMDL par une lecture sequentielle,
+    avec les memes regles que indexPDB.buildIndex. La lecture s'arrete des que la derniere conformation demandee est lue.
+    :param pdbFile: Fichier pdb.
+    :param start, stop, step: Selection des conformations (voir ParserPDB.PDBiterMulti).
+    :return: Generateur de couples (modele, liste des lignes de la conformation).
+    """
+    if step < 1:
+        raise ValueError("step must be a positive integer: %s" % step)
+    if start < 0 or (stop is not None and stop < 0):   # rangs comptes depuis la fin: il faut le nombre de conformations
+        ranks = range(countModels(pdbFile))[start:stop:step]
+        start, stop = ranks.start, ranks.stop
+
+    def selected(rank):
+        return rank >= start and (rank - start) % step == 0
+
+    rank = -1
+    block = None       # lignes de la conformation en cours, si elle est selectionnee
+    inModel = False
+    header = []        # lignes d'un fichier sans MODEL
+    with openInput(pdbFile) as f:
+        for line in f:
+            if _isModel(line):
+                if block is not None:                     # MODEL sans ENDMDL: le bloc s'arrete ici
+                    yield model, block
+                rank += 1
+                if stop is not None and rank >= stop:
+                    return
+                model = line[10:14].strip()
+                block = [line] if selected(rank) else None
+                inModel = True
+                header = None
+            elif line.startswith("ENDMDL"):
+                if block is not None:
+                    block.append(line)
+                    yield model, block
+                block = None
+                inModel = False
+            elif inModel:
+                if block is not None:
+                    block.append(line)
+            elif header is not None:
+                header.append(line)
+
+    if block is not None:
+        yield model, block
+    elif header and selected(0) and (stop is None or stop > 0):
+        yield "", header
+
+
+def followBlocks(pdbFile, start=0, stop=None, step=1, poll=1.0, timeout=None):
+    """
+    Suit un fichier pdb multi-modeles en cours d'ecriture (par exemple par une simulation) et renvoie chaque bloc
+    MODEL ... ENDMDL des que sa ligne ENDMDL (ou le MODEL suivant) est ecrite, avec les memes regles que
+    indexPDB.buildIndex. Un bloc incomplet n'est jamais renvoye.
+    La lecture s'arrete a l'enregistrement END qui termine la dynamique, apres timeout secondes sans nouveau bloc,
+    ou par Ctrl-C pendant l'attente (la fin de la lecture est alors normale).
+    :param pdbFile: Fichier pdb non compresse.
+    :param start, stop, step: Selection des conformations (voir ParserPDB.PDBiterMulti), rangs positifs seulement.
+    :param poll: Intervalle (en s) entre deux lectures de la fin du fichier.
+    :param timeout: Duree (en s) sans nouveau bloc apres laquelle la lecture s'arrete, None pour attendre END.
+    :return: Generateur de couples (modele, octets de la conformation).
+    """
+    if step < 1:
+        raise ValueError("step must be a positive integer: %s" % step)
+    if start < 0 or (stop is not None and stop < 0):
+        raise ValueError("A file being written cannot be followed with ranks counted from its end")
+    if compression(pdbFile) is not None:
+        raise ValueError("A compressed file cannot be followed: %s" % pdbFile)
+
+    rank = -1
+    pending = b''       # octets lus a partir du debut du bloc en cours (ou de la ligne incomplete)
+    scanned = 0         # longueur de pending deja parcourue (lignes completes)
+    begin = None        # debut, dans pending, du bloc en cours
+    model = None
+    last = time.monotonic()   # instant du dernier bloc complet
+    with open(pdbFile, 'rb') as f:
+        while True:
+            data = f.read()
+            if not data:
+                if timeout is not None and time.monotonic() - last >= timeout:
+                    return
+                try:
+                    time.sleep(poll)
+                except KeyboardInterrupt:
+                    return
+                continue
+
+            pending += data
+            complete = pending.rfind(b'\n') + 1   # seules les lignes terminees sont analysees
+            blocks = []
+            end = False
+            for match in _RECORDS.finditer(pending, scanned, complete):
+                eol = pending.index(b'\n', match.start()) + 1
+                record = match.group()
+                if record == b'MODEL':
+                    if begin is not None:                     # MODEL sans ENDMDL: le bloc s'arrete ici
+                        blocks.append((rank, model, pending[begin:match.start()]))
+                    rank += 1
+                    if stop is not None and rank >= stop:
+                        begin = None
+                        end = True
+                        break
+                    begin = match.start()
+                    model = pending[begin:eol][10:14].decode('latin-1').strip()
+                elif begin is not None:                       # ENDMDL, ou END qui termine le dernier bloc
+                    blocks.append((rank, model, pending[begin:eol if record == b'ENDMDL' else match.start()]))
+                    begin = None
+                if record == b'END':
+                    end = True
+                    break
+
+            for i, name, block in blocks:
+                if i >= start and (i - start) % step == 0:
+                    yield name, block
+            if blocks:
+                last = time.monotonic()
+            if end:
+                return
+            keep = complete if begin is None else begin
+            pending = pending[keep:]
+            scanned = complete - keep
+            if begin is not None:
+                begin = 0
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Content-addressed cache of analysis results, shared by all the runs: each entry is keyed
+by the hash of the trajectory content and of the analysis parameters, and the least recently used
+entries are evicted beyond a size budget. The final results (RMSD series, RMSF, interface and contact
+counts) are reused as such; the minimum distances between residues of each conformation are kept up
+to a radius larger than the threshold, so that a new threshold only filters them again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from neighbourSearch import PAIR_SOURCE, residuePairs
+from parallel import Accumulator, analyseFrames
+
+CACHE_FORMAT = 1
+ENTRY_SUFFIX = ".npz"
+CACHE_BUDGET = 1024 * 1024 * 1024   # taille maximale (en octets) du cache, par defaut
+PAIR_RADIUS = 12.0                  # distance (en Angstrom) jusqu'a laquelle les couples de residus sont gardes
+RECORD_BUDGET = 64 * 1024 * 1024    # taille maximale (en octets) des couples gardes en memoire pendant une passe
+
+_loaded = dict()   # derniere entree de couples lue dans ce processus: {fichier: (date, entree)}
+
+
+class ResultCache(object):
+    """
+    Repertoire d'entrees nommees par le hachage de leur cle: fichiers npz d'un en-tete JSON et de tableaux numpy,
+    relus sans pickle (un fichier du cache ne peut pas executer de code). La date de modification d'une entree est
+    mise a jour a chaque lecture: les entrees les plus anciennes sont supprimees quand le budget est depasse.
+    """
+
+    def __init__(self, directory, budget=CACHE_BUDGET):
+        """
+        :param directory: Repertoire du cache (cree s'il n'existe pas).
+        :param budget: Taille maximale (en octets) de toutes les entrees.
+        """
+        if budget <= 0:
+            raise ValueError("The size of the result cache must be positive: %s" % budget)
+        self.directory = directory
+        self.budget = budget
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        """
+        :param parts: Elements de la cle (chaines, nombres, octets et tuples, listes ou dictionnaires de ceux-ci).
+        :return: Le hachage (hexadecimal) de la cle.
+        """
+        return hashlib.blake2b(repr((CACHE_FORMAT,) + parts).encode('utf-8'), digest_size=20).hexdigest()
+
+    def path(self, key):
+        """
+        :return: Le fichier de l'entree de cle key (voir ResultCache.key).
+        """
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        :return: La valeur de l'entree (devenue la plus recemment utilisee), ou None si elle est absente ou illisible.
+        """
+        path = self.path(key)
+        try:
+            value = _readEntry(path)
+            os.utime(path)
+        except _UNREADABLE:
+            return None
+        return value
+
+    def put(self, key, value):
+        """
+        Enregistre une entree (ecriture atomique, fichier reserve a son proprietaire), puis supprime les entrees les
+        moins recemment utilisees jusqu'a ce que le cache tienne dans son budget.
+        :param value: Valeur faite de chaines, nombres, booleens, None, tableaux numpy (sans objets), et de listes,
+        tuples ou dictionnaires de ceux-ci.
+        :return: True si l'entree est gardee, False si elle depasse a elle seule le budget.
+        """
+        arrays = []
+        header = json.dumps(_encode(value, arrays))
+        fd, tmp = tempfile.mkstemp(prefix=".", suffix=ENTRY_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, header=np.array(header), **dict(("a%d" % i, a) for i, a in enumerate(arrays)))
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+        return os.path.exists(self.path(key))
+
+    def entries(self):
+        """
+        :return: La liste des couples (date de derniere utilisation, taille, fichier) des entrees, de la plus ancienne
+        a la plus recente.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX) and not name.startswith("."):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:   # supprimee entre-temps par un autre job
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Supprime les entrees les moins recemment utilisees tant que la taille du cache depasse le budget.
+        """
+        entries = self.entries()
+        total = sum(size for date, size, path in entries)
+        for date, size, path in entries:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def fileDigest(self, pdbFile):
+        """
+        :return: Le hachage du contenu d'un fichier, garde dans le cache tant que le fichier n'est pas modifie.
+        """
+        stat = os.stat(pdbFile)
+        statKey = self.key('digest', os.path.abspath(pdbFile), stat.st_size, stat.st_mtime_ns)
+        digest = self.get(statKey)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            with open(pdbFile, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            self.put(statKey, digest)
+        return digest
+
+
+# erreurs d'une entree absente, tronquee ou d'un autre format
+_UNREADABLE = (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile)
+
+
+def _encode(value, arrays):
+    """
+    :return: La valeur convertie en donnees JSON, ses tableaux numpy etant ajoutes a arrays (voir _decode).
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, np.generic):
+        return value
+    if isinstance(value, (np.ndarray, np.generic)):
+        if value.dtype.hasobject:
+            raise TypeError("An array of objects cannot be stored in the result cache")
+        arrays.append(np.asarray(value))
+        return {'array': len(arrays) - 1, 'scalar': isinstance(value, np.generic)}
+    if isinstance(value, list):
+        return [_encode(item, arrays) for item in value]
+    if isinstance(value, tuple):
+        return {'tuple': [_encode(item, arrays) for item in value]}
+    if isinstance(value, dict):
+        return {'dict': [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    raise TypeError("A %s cannot be stored in the result cache" % type(value).__name__)
+
+
+def _decode(data, arrays):
+    """
+    :return: La valeur codee par _encode, ses tableaux etant lus dans arrays (fichier npz ouvert).
+    """
+    if isinstance(data, list):
+        return [_decode(item, arrays) for item in data]
+    if not isinstance(data, dict):
+        return data
+    if 'array' in data:
+        array = arrays["a%d" % data['array']]
+        return array[()] if data['scalar'] else array
+    if 'tuple' in data:
+        return tuple(_decode(item, arrays) for item in data['tuple'])
+    return dict((_decode(k, arrays), _decode(v, arrays)) for k, v in data['dict'])
+
+
+def _readEntry(path):
+    """
+    :return: La valeur de l'entree enregistree dans path (voir ResultCache.put), lue sans pickle.
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        return _decode(json.loads(str(arrays['header'])), arrays)
+
+
+def analyseCached(cache, parts, loadFrames, accumulators, writePDB=None, timer=None, checkpoint=None,
+                  radius=PAIR_RADIUS, checkpointDelay=None):
+    """
+    Comme parallel.analyseFrames, en reutilisant les resultats du cache: un accumulateur dont le resultat partiel
+    (Accumulator.cacheKey) est en cache n'est pas recalcule, et les couples de residus proches de chaque
+    conformation sont relus dans le cache (voir PairCacheAccumulator). Les conformations ne sont lues que si
+    un accumulateur doit etre recalcule.
+    :param cache: ResultCache.
+    :param parts: Elements de cle communs a tous les resultats: hachage de la dynamique et parametres de lecture
+    (domaines, selection des atomes, ponderation, conformations selectionnees).
+    :param loadFrames: Fonction sans argument renvoyant les conformations (voir analyseFrames).
+    :param accumulators: Liste d'Accumulator.
+    :param writePDB: Fichier pdb de sortie optionnel: les conformations sont alors toujours lues et aucun resultat
+    n'est relu (les resultats calcules sont enregistres).
+    :param timer, checkpoint, checkpointDelay: Voir analyseFrames.
+    :param radius: Distance (en Angstrom) jusqu'a laquelle les couples de residus sont enregistres.
+    :return: La liste des resultats des accumulateurs (finish).
+    """
+    try:
+        return _analyseCached(cache, parts, loadFrames, accumulators, writePDB, timer, checkpoint, radius,
+                              checkpointDelay)
+    finally:
+        _loaded.clear()   # l'entree de couples lue n'est plus gardee apres la passe
+
+
+def _analyseCached(cache, parts, loadFrames, accumulators, writePDB, timer, checkpoint, radius, checkpointDelay):
+    """
+    Voir analyseCached.
+    """
+    keys = [acc.cacheKey() for acc in accumulators]
+    keys = [None if key is None else cache.key('result', parts, key) for key in keys]
+    cached = dict()
+    if writePDB is None:
+        for i, key in enumerate(keys):
+            if key is not None:
+                partial = cache.get(key) if timer is None else timer.call("cache", cache.get, key)
+                if partial is not None:
+                    cached[i] = partial
+
+    results = [None] * len(accumulators)
+    remaining = [i for i in range(len(accumulators)) if i not in cached]
+    if remaining or writePDB is not None:
+        pairs = PairCacheAccumulator(cache, parts, radius)
+        computed = analyseFrames(loadFrames(), [pairs] + [accumulators[i] for i in remaining], writePDB, timer,
+                                 checkpoint, checkpointDelay)[1:]
+        for i, result in zip(remaining, computed):
+            results[i] = result
+            if keys[i] is not None:
+                if timer is None:
+                    cache.put(keys[i], accumulators[i].partial())
+                else:
+                    timer.call("cache", cache.put, keys[i], accumulators[i].partial())
+
+    for i, partial in cached.items():
+        accumulators[i].merge(partial)
+        results[i] = accumulators[i].finish() if timer is None else timer.call("writing", accumulators[i].finish)
+    return results
+
+
+def _loadEntry(path):
+    """
+    :return: L'entree de couples enregistree dans path (gardee en memoire tant que le fichier ne change pas), ou None.
+    """
+    try:
+        date = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if path in _loaded and _loaded[path][0] == date:
+        return _loaded[path][1]
+    try:
+        entry = _readEntry(path)
+    except _UNREADABLE:
+        return None
+    entry['index'] = dict((model, i) for i, model in enumerate(entry['models']))
+    _loaded.clear()
+    _loaded[path] = (date, entry)
+    return entry
+
+
+class PairCacheAccumulator(Accumulator):
+    """
+    Source des couples de residus proches (neighbourSearch.residuePairs) des autres accumulateurs de la meme passe:
+    place en tete de la liste, il fournit a chaque conformation les couples enregistres dans le cache jusqu'a une
+    distance au moins egale au seuil demande, filtres par ce seuil (memes resultats que le calcul). Les couples
+    absents sont calcules jusqu'a radius et enregistres a la fin de la passe, s'ils tiennent dans budget.
+    """
+
+    stage = "pairs"
+
+    def __init__(self, cache, parts, radius=PAIR_RADIUS, budget=RECORD_BUDGET):
+        """
+        :param cache: ResultCache.
+        :param parts: Elements de cle de la dynamique (voir analyseCached).
+        :param radius: Distance (en Angstrom) jusqu'a laquelle les couples calcules sont enregistres.
+        :param budget: Taille maximale (en octets) des couples gardes en memoire jusqu'a la fin de la passe (au plus
+        celle du cache): au-dela, rien n'est enregistre.
+        """
+        self.cache = cache
+        self.key = cache.key('pairs', parts)
+        self.path = cache.path(self.key)
+        self.radius = radius
+        self.budget = min(budget, cache.budget)
+        self.reset()
+
+    def reset(self):
+        self.models = []
+        self.recorded = dict()   # (domaine 1, domaine 2, mode) -> [distance maximale, couples de chaque conformation]
+        self.nbytes = 0
+        self.overflow = False    # couples plus volumineux que le budget: rien n'est enregistre
+
+    def update(self, model, conf, memo, fout=None):
+        self.models.append(model)
+
+        def source(dico, dom1, dom2, cutoff, mode, budget):
+            return self._pairs(model, dico, dom1, dom2, cutoff, mode, budget)
+        memo[PAIR_SOURCE] = source
+
+    def _pairs(self, model, dico, dom1, dom2, cutoff, mode, budget):
+        """
+        :return: Les couples de residus a moins de cutoff (voir residuePairs), relus dans le cache si possible.
+        """
+        entry = _loadEntry(self.path)
+        stored = None if entry is None else entry['pairs'].get((dom1, dom2, mode))
+        if stored is not None and stored[0] >= cutoff and model in entry['index']:
+            radius, offsets, r1, r2, d = stored
+            i = entry['index'][model]
+            r1, r2, d = r1[offsets[i]:offsets[i + 1]], r2[offsets[i]:offsets[i + 1]], d[offsets[i]:offsets[i + 1]]
+        else:
+            radius = max(cutoff, self.radius)
+            r1, r2, d = residuePairs(dico, dom1, dom2, radius, mode, budget=budget)
+            self._record((dom1, dom2, mode), radius, r1, r2, d)
+        keep = d <= cutoff
+        return r1[keep].astype(np.intp), r2[keep].astype(np.intp), d[keep]
+
+    def _record(self, key, radius, r1, r2, d):
+        """
+        Garde les couples d'une conformation pour les enregistrer a la fin de la passe.
+        """
+        if self.overflow:
+            return
+        self.recorded.setdefault(key, [radius, []])[1].append((r1.astype(np.int32), r2.astype(np.int32), d))
+        self.nbytes += 16 * len(d)
+        if self.nbytes > self.budget:
+            self.overflow = True
+            self.recorded = dict()
+
+    def partial(self):
+        """
+        :return: Les modeles, les couples calcules de chaque conformation et leur taille (voir _record).
+        """
+        return self.models, self.recorded, self.nbytes, self.overflow
+
+    def merge(self, partial):
+        models, recorded, nbytes, overflow = partial
+        self.models.extend(models)
+        self.nbytes += nbytes
+        self.overflow = self.overflow or overflow or self.nbytes > self.budget
+        if self.overflow:
+            self.recorded = dict()
+            return
+        for key, (radius, frames) in recorded.items():
+            self.recorded.setdefault(key, [radius, []])[1].extend(frames)
+
+    def checkpoint(self):
+        """
+        Rien n'est enregistre avant la fin de la passe.
+        """
+
+    def finish(self):
+        """
+        Enregistre les couples calcules pour toutes les conformations, avec ceux deja en cache pour les memes modeles.
+        """
+        complete = dict((key, value) for key, value in self.recorded.items() if len(value[1]) == len(self.models))
+        if self.overflow or not complete or len(set(self.models)) != len(self.models):
+            return None
+        entry = _loadEntry(self.path)
+        pairs = dict(entry['pairs']) if entry is not None and entry['models'] == self.models else dict()
+        for key, (radius, frames) in complete.items():
+            counts = [len(d) for r1, r2, d in frames]
+            offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            pairs[key] = (radius, offsets, np.concatenate([f[0] for f in frames]),
+                          np.concatenate([f[1] for f in frames]), np.concatenate([f[2] for f in frames]))
+        self.cache.put(self.key, {'models': list(self.models), 'pairs': pairs})
+        return None
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Rules selecting the atoms read from a PDB file: policy for the alternate locations of an
+atom (first, highest occupancy or all), columns identifying the domains (segment ID or chain ID) and
+HETATM records to read (ions, ligands or all).
+"""
+
+
+# politiques de lecture des positions alternatives (colonne 17) d'un meme atome (ou une lettre, voir AtomSelection)
+ALTLOC_POLICIES = ("first", "occupancy", "all")
+# colonnes identifiant le domaine d'un atome: segment (73-76), chaine (22), ou segment a defaut chaine
+DOMAIN_FIELDS = ("segid", "chain", "auto")
+# enregistrements HETATM lus: ions seulement, tous sauf l'eau, ou tous
+HETERO_RECORDS = ("ions", "ligands", "all")
+
+WATERS = frozenset(("HOH", "WAT", "H2O", "DOD", "TIP", "TIP3", "TIP4", "SOL", "SPC"))
+# nom de residu des ions -> element (noms PDB et CHARMM/AMBER)
+IONS = {'MG': 'MG', 'NA': 'NA', 'K': 'K', 'CL': 'CL', 'CA': 'CA', 'ZN': 'ZN', 'MN': 'MN', 'FE': 'FE', 'FE2': 'FE',
+        'CU': 'CU', 'CU1': 'CU', 'CO': 'CO', 'NI': 'NI', 'CD': 'CD', 'LI': 'LI', 'RB': 'RB', 'CS': 'CS', 'SR': 'SR',
+        'BA': 'BA', 'BR': 'BR', 'IOD': 'I', 'SOD': 'NA', 'POT': 'K', 'CLA': 'CL', 'CAL': 'CA', 'MG2': 'MG'}
+
+
+class AtomSelection(object):
+    """
+    Regles de selection des atomes lus dans un fichier pdb: position alternative gardee pour chaque atome,
+    colonnes identifiant les domaines et enregistrements HETATM lus.
+    """
+
+    def __init__(self, altloc="first", field="segid", hetero=None):
+        """
+        :param altloc: 'first' (premiere position alternative de chaque atome), 'occupancy' (position d'occupation
+        la plus elevee, la premiere en cas d'egalite), 'all' (toutes les positions, comme des atomes distincts) ou
+        l'indicateur d'une position (par exemple 'B': cette position, a defaut la premiere).
+        :param field: 'segid' (colonnes 73-76), 'chain' (colonne 22) ou 'auto' (segment, a defaut chaine).
+        :param hetero: None (ATOM seulement), 'ions' (et ions HETATM), 'ligands' (et HETATM sauf l'eau) ou 'all'.
+        """
+        if altloc not in ALTLOC_POLICIES and not (len(altloc) == 1 and altloc.isalnum()):
+            raise ValueError("altloc must be %s, or a single letter: %s" % (" or ".join(ALTLOC_POLICIES), altloc))
+        if field not in DOMAIN_FIELDS:
+            raise ValueError("The domain field must be %s: %s" % (" or ".join(DOMAIN_FIELDS), field))
+        if hetero is not None and hetero not in HETERO_RECORDS:
+            raise ValueError("hetero must be %s: %s" % (" or ".join(HETERO_RECORDS), hetero))
+        self.altloc = altloc
+        self.field = field
+        self.hetero = hetero
+
+    def key(self):
+        """
+        :return: Une chaine identifiant la selection (enregistree dans le cache binaire, voir trajectoryCache).
+        """
+        return "altloc=%s,field=%s,hetero=%s" % (self.altloc, self.field, self.hetero)
+
+    def keepHetero(self, resName):
+        """
+        :return: True si un enregistrement HETATM du residu resName est lu.
+        """
+        if self.hetero == "ions":
+            return resName in IONS
+        if self.hetero == "ligands":
+            return resName not in WATERS
+        return self.hetero == "all"
+
+    def __eq__(self, other):
+        return isinstance(other, AtomSelection) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "AtomSelection(altloc=%r, field=%r, hetero=%r)" % (self.altloc, self.field, self.hetero)
+
+
+DEFAULT_SELECTION = AtomSelection()
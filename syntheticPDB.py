@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Generator of synthetic protein/RNA complexes and multi-model trajectories in PDB format,
+with a configurable number of atoms, protein domains and conformations. The files are fully
+determined by the seed, so that benchmarks (see benchmark.py) can be reproduced offline.
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+from Structure import Structure
+from writerPDB import PDBWriter
+
+# atomes et noms des residus generes
+PROTEIN_ATOMS = ("N", "CA", "C", "O", "CB")
+PROTEIN_RESIDUES = ("ALA", "ARG", "ASN", "ASP", "GLU", "LEU", "LYS", "SER", "THR", "VAL")
+RNA_ATOMS = ("P", "O5'", "C5'", "C4'", "C3'", "N1")
+RNA_RESIDUES = ("A", "C", "G", "U")
+
+RNA_DOMAIN = "B"
+RESIDUE_VOLUME = 130.0   # volume moyen d'un residu (Angstrom^3), pour la taille des domaines
+
+
+def syntheticDomains(nAtoms, nDomains=4, rnaFraction=0.25):
+    """
+    Repartit un nombre d'atomes entre des domaines proteiques (A1, A2, ...) et un ARN (B).
+    :param nAtoms: Nombre total d'atomes souhaite (approche au residu pres).
+    :param nDomains: Nombre de domaines proteiques.
+    :param rnaFraction: Fraction des atomes dans l'ARN (0 pour une proteine seule).
+    :return: Liste de triplets (domaine, 'protein' ou 'rna', nombre de residus).
+    """
+    if nDomains < 1:
+        raise ValueError("The number of protein domains must be a positive integer: %s" % nDomains)
+    if not 0 <= rnaFraction < 1:
+        raise ValueError("The RNA fraction must be in [0, 1): %s" % rnaFraction)
+    nRes = max(1, int(round(nAtoms * (1 - rnaFraction) / len(PROTEIN_ATOMS) / nDomains)))
+    domains = [("A%d" % (i + 1), "protein", nRes) for i in range(nDomains)]
+    nRna = int(round(nAtoms * rnaFraction / len(RNA_ATOMS)))
+    if nRna > 0:
+        domains.append((RNA_DOMAIN, "rna", nRna))
+    return domains
+
+
+def _radius(nRes):
+    """
+    :return: Le rayon (en Angstrom) de la sphere contenant nRes residus.
+    """
+    return (3 * nRes * RESIDUE_VOLUME / (4 * math.pi)) ** (1 / 3)
+
+
+def syntheticStructure(domains, seed=0):
+    """
+    Construit la structure de reference: chaque domaine est une sphere de residus; l'ARN est au centre et les
+    domaines proteiques l'entourent en le touchant (interfaces proteine-ARN et entre domaines voisins).
+    :param domains: Liste de triplets (domaine, 'protein' ou 'rna', nombre de residus), voir syntheticDomains.
+    :param seed: Graine du generateur aleatoire.
+    :return: Une Structure.
+    """
+    rng = np.random.default_rng(seed)
+    rna = [dom for dom in domains if dom[1] == "rna"]
+    core = _radius(rna[0][2]) if rna else 0.0
+    prot = [dom for dom in domains if dom[1] != "rna"]
+
+    coords = []
+    chains, resIds, names, resNames = [], [], [], []
+    for name, kind, nRes in domains:
+        radius = _radius(nRes)
+        if kind == "rna":
+            center = np.zeros(3)
+        else:
+            angle = 2 * math.pi * prot.index((name, kind, nRes)) / len(prot)
+            dist = core + radius - 3.0 if rna else radius * (len(prot) > 1)
+            center = dist * np.array([math.cos(angle), math.sin(angle), 0.0])
+        atoms = RNA_ATOMS if kind == "rna" else PROTEIN_ATOMS
+        residues = RNA_RESIDUES if kind == "rna" else PROTEIN_RESIDUES
+
+        # residus tires uniformement dans la sphere du domaine, atomes autour du centre de leur residu
+        direction = rng.normal(size=(nRes, 3))
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        resCenters = center + direction * radius * rng.random((nRes, 1)) ** (1 / 3)
+        coords.append((resCenters[:, None, :] + rng.normal(0, 1.2, (nRes, len(atoms), 3))).reshape(-1, 3))
+        for r, resName in enumerate(rng.choice(residues, nRes).tolist()):
+            for atom in atoms:
+                chains.append(name)
+                resIds.append(str(r + 1))
+                names.append(atom)
+                resNames.append(resName)
+
+    coords = np.concatenate(coords) if coords else np.zeros((0, 3))
+    serials = [str(i + 1) for i in range(len(coords))]
+    return Structure(coords, chains, resIds, names, resNames, serials, elements=[atom[0] for atom in names])
+
+
+def syntheticFrames(ref, nFrames, noise=0.5, drift=1.0, seed=0):
+    """
+    Genere les conformations d'une dynamique autour de la structure de reference.
+    Chaque conformation ne depend que de la graine et de son rang (reproductible quel que soit le decoupage).
+    :param ref: Structure de reference (voir syntheticStructure).
+    :param nFrames: Nombre de conformations.
+    :param noise: Ecart-type (en Angstrom) du deplacement aleatoire de chaque atome.
+    :param drift: Ecart-type (en Angstrom) de la translation de chaque domaine.
+    :param seed: Graine du generateur aleatoire.
+    :return: Generateur de couples (modele, Structure), modeles numerotes a partir de 1.
+    """
+    domainOf = np.unique(ref.chainIds, return_inverse=True)[1].ravel()
+    nDomains = domainOf.max() + 1 if ref.nAtoms else 0
+    for rank in range(nFrames):
+        rng = np.random.default_rng([seed, rank])
+        shifts = rng.normal(0, drift, (nDomains, 3))
+        coords = ref.coords + rng.normal(0, noise, ref.coords.shape) + shifts[domainOf]
+        yield str(rank + 1), ref.withCoords(coords)
+
+
+def writeSynthetic(refFile, confFile, domains, nFrames, noise=0.5, drift=1.0, seed=0):
+    """
+    Ecrit une structure de reference et une dynamique synthetiques (compressees si leur extension est .gz).
+    :param refFile: Fichier pdb de la structure de reference.
+    :param confFile: Fichier pdb multi-modeles de la dynamique.
+    :param domains: Liste de triplets (domaine, 'protein' ou 'rna', nombre de residus), voir syntheticDomains.
+    :param nFrames, noise, drift, seed: Voir syntheticFrames.
+    :return: La Structure de reference.
+    """
+    ref = syntheticStructure(domains, seed)
+    names = [dom[0] for dom in domains]
+    with PDBWriter(refFile, names) as writer:
+        writer.write("1", ref)
+    with PDBWriter(confFile, names) as writer:
+        for model, conf in syntheticFrames(ref, nFrames, noise, drift, seed):
+            writer.write(model, conf)
+    return ref
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic protein/RNA reference structure and trajectory.")
+    parser.add_argument("ref", help="reference PDB file to write (.gz to compress)")
+    parser.add_argument("conf", help="multi-model PDB file to write (.gz to compress)")
+    parser.add_argument("--atoms", type=int, default=5000, help="approximate number of atoms (default 5000)")
+    parser.add_argument("--domains", type=int, default=4, help="number of protein domains (default 4)")
+    parser.add_argument("--rna-fraction", type=float, default=0.25, help="fraction of the atoms in the RNA (default 0.25)")
+    parser.add_argument("--frames", type=int, default=100, help="number of conformations (default 100)")
+    parser.add_argument("--noise", type=float, default=0.5, help="atomic displacement in Angstrom (default 0.5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    args = parser.parse_args()
+    try:
+        domains = syntheticDomains(args.atoms, args.domains, args.rna_fraction)
+    except ValueError as e:
+        parser.error(str(e))
+    ref = writeSynthetic(args.ref, args.conf, domains, args.frames, args.noise, seed=args.seed)
+    print("%d atoms, %d residues, domains %s, %d frames" % (ref.nAtoms, ref.nResidues,
+                                                            ",".join(dom[0] for dom in domains), args.frames))
+
+
+if __name__ == "__main__":
+    main()
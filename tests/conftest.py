@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Shared fixtures of the tests: a small synthetic protein/RNA trajectory (see syntheticPDB),
+written once per session, and the modules of the repository made importable.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from syntheticPDB import syntheticDomains, writeSynthetic   # noqa: E402
+
+DOMAINS = ["A1", "A2", "A3", "A4"]
+RNA = "B"
+PARSING = DOMAINS + [RNA]
+NB_FRAMES = 12
+
+# paires de residus des tests (residus presents dans la structure synthetique)
+PAIRS = {'5': {'dom1': 'A1', 'res2': '3', 'dom2': 'B'},
+         '12': {'dom1': 'A2', 'res2': '20', 'dom2': 'B'},
+         '30': {'dom1': 'A3', 'res2': '8', 'dom2': 'A4'}}
+
+
+@pytest.fixture(scope="session")
+def synthetic(tmp_path_factory):
+    """
+    :return: Les fichiers pdb (reference, dynamique) de la structure synthetique, a ne pas modifier.
+    """
+    directory = tmp_path_factory.mktemp("synthetic")
+    ref = str(directory / "ref.pdb")
+    conf = str(directory / "conf.pdb")
+    writeSynthetic(ref, conf, syntheticDomains(1500), NB_FRAMES, seed=3)
+    return ref, conf
+
+
+@pytest.fixture
+def trajectory(synthetic, tmp_path):
+    """
+    :return: Une copie (modifiable, avec ses index et caches propres) des fichiers synthetiques.
+    """
+    ref = str(tmp_path / "ref.pdb")
+    conf = str(tmp_path / "conf.pdb")
+    shutil.copyfile(synthetic[0], ref)
+    shutil.copyfile(synthetic[1], conf)
+    return ref, conf
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the bulk decoding of the MODEL blocks (FrameDecoder): each conformation must be
+identical, to the bit, to the one parsed line by line by PDBparserConf, including negative zeros,
+malformed coordinate fields, line endings and a change of layout between two conformations.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from ParserPDB import FrameDecoder, PDBblocksMulti, PDBiterMulti, PDBparserConf
+from conftest import PARSING
+from selectionPDB import AtomSelection
+
+# champs de coordonnees (colonnes 31-38) bien et mal formes
+FIELDS = ["  -0.000", "   0.000", " -12.345", "9999.999", "-999.999", "   -.500", "  +1.000", " 1.2345 ", "   1.5  "]
+
+
+def assertSame(decoded, parsed):
+    assert decoded.sameTopology(parsed)
+    assert np.array_equal(decoded.serials, parsed.serials)
+    assert np.array_equal(decoded.elements, parsed.elements)
+    assert decoded.coords.dtype == parsed.coords.dtype
+    assert decoded.coords.tobytes() == parsed.coords.tobytes()   # -0.0 et 0.0 differents
+
+
+def checkFile(pdbFile, selection=None, dtype=np.float64):
+    decoded = list(PDBiterMulti(pdbFile, PARSING, dtype, useCache=False, selection=selection))
+    parsed = [(model, PDBparserConf(lines, PARSING, dtype, selection=selection))
+              for model, lines in PDBblocksMulti(pdbFile)]
+    assert [model for model, conf in decoded] == [model for model, conf in parsed]
+    for (model, conf), (model2, reference) in zip(decoded, parsed):
+        assertSame(conf, reference)
+
+
+def craft(synthetic, path, newline="\n", nbModels=6, changed=3):
+    """
+    Ecrit une dynamique dont les coordonnees x sont tirees de FIELDS, avec un atome de plus dans le modele changed.
+    """
+    with open(synthetic[1]) as f:
+        lines = f.read().splitlines(True)
+    block = lines[:lines.index("ENDMDL\n") + 1]
+    rand = random.Random(1)
+    out = []
+    for model in range(1, nbModels + 1):
+        out.append("MODEL     %4d\n" % model)
+        for line in block[1:-1]:
+            out.append(line[:30] + rand.choice(FIELDS) + line[38:])
+        if model == changed:   # atome supplementaire (nom absent du residu)
+            out.append(block[1][:12] + " OXT" + block[1][16:])
+        out.append("ENDMDL\n")
+    with open(path, "w", newline="") as f:
+        f.write("".join(out).replace("\n", newline))
+    return path
+
+
+def test_synthetic_trajectory(synthetic):
+    checkFile(synthetic[1])
+    checkFile(synthetic[1], dtype=np.float32)
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("selection", [None, AtomSelection("occupancy", hetero="ions"),
+                                       AtomSelection("all", field="auto", hetero="all")])
+def test_crafted_fields(synthetic, tmp_path, newline, selection):
+    checkFile(craft(synthetic, str(tmp_path / "crafted.pdb"), newline), selection)
+
+
+def test_negative_zero(synthetic, tmp_path):
+    path = craft(synthetic, str(tmp_path / "crafted.pdb"))
+    for model, conf in PDBiterMulti(path, PARSING, useCache=False):
+        zeros = conf.coords[:, 0] == 0.0
+        assert np.signbit(conf.coords[zeros, 0]).any() and not np.signbit(conf.coords[zeros, 0]).all()
+
+
+def test_layout_change(synthetic, tmp_path):
+    path = craft(synthetic, str(tmp_path / "crafted.pdb"))
+    decoder = FrameDecoder(PARSING)
+    sizes = [len(decoder.decode(lines).coords) for model, lines in PDBblocksMulti(path)]
+    assert sizes[2] == sizes[0] + 1 and sizes[3] == sizes[0]
+    for model, lines in PDBblocksMulti(path):   # meme decodeur, topologie de chaque bloc
+        assertSame(decoder.decode(lines), PDBparserConf(lines, PARSING))
+
+
+def record(serial, name, res, x, chain="A", segid="", alt="", occupancy=1.0, resName="ALA", kind="ATOM", element=""):
+    """
+    :return: Un enregistrement ATOM (ou HETATM) aux colonnes du format pdb.
+    """
+    return "%-6s%5d %-4s%1s%3s %1s%4s    %8.3f%8.3f%8.3f%6.2f%6.2f      %-4s%2s\n" % (
+        kind, serial, name, alt, resName, chain, res, x, 0.0, 0.0, occupancy, 0.0, segid, element)
+
+
+# atome CA a deux positions (B plus occupee), atome CB a deux positions (A plus occupee), atome C en position C seulement
+ALTLOCS = [record(1, " N", "1", 1.0),
+           record(2, " CA", "1", 2.0, alt="A", occupancy=0.40),
+           record(3, " CA", "1", 3.0, alt="B", occupancy=0.60),
+           record(4, " CB", "1", 4.0, alt="A", occupancy=0.70),
+           record(5, " CB", "1", 5.0, alt="B", occupancy=0.30),
+           record(6, " C", "1", 6.0, alt="C", occupancy=1.00)]
+
+
+@pytest.mark.parametrize("policy, names, xs", [
+    ("first", ["N", "CA", "CB", "C"], [1.0, 2.0, 4.0, 6.0]),
+    ("occupancy", ["N", "CA", "CB", "C"], [1.0, 3.0, 4.0, 6.0]),
+    ("B", ["N", "CA", "CB", "C"], [1.0, 3.0, 5.0, 6.0]),
+    ("all", ["N", "CA", "CA", "CB", "CB", "C"], [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]),
+])
+def test_altloc_policies(policy, names, xs):
+    orders = [ALTLOCS] if policy == "first" else [ALTLOCS, ALTLOCS[::-1]]   # sinon independant de l'ordre des lignes
+    for lines in orders:
+        conf = PDBparserConf(lines, ["A"], selection=AtomSelection(policy, field="chain"))
+        order = np.argsort(conf.serials.astype(int))
+        assert conf.atomNames[order].tolist() == names
+        assert conf.coords[order, 0].tolist() == xs
+        if policy == "all":
+            assert conf.altLocs[order].tolist() == ["", "A", "B", "A", "B", "C"]
+        assert len(conf.chainResList("A")) == 1
+
+
+def test_altloc_letter():
+    with pytest.raises(ValueError):
+        AtomSelection("AB")
+    decoder = FrameDecoder(["A"], selection=AtomSelection("B", field="chain"))   # meme choix pour la topologie reutilisee
+    for x in (0.0, 10.0):
+        lines = ["MODEL        1\n"] + [line[:30] + "%8.3f" % (float(line[30:38]) + x) + line[38:] for line in ALTLOCS]
+        assert decoder.decode(lines + ["ENDMDL\n"]).coords[:, 0].tolist() == [1.0 + x, 3.0 + x, 5.0 + x, 6.0 + x]
+
+
+# domaines identifies par la chaine (colonne 22) et/ou par le segment (colonnes 73-76)
+DOMAIN_LINES = [record(1, " CA", "1", 1.0, chain="A", segid="PROT"),
+                record(2, " CA", "2", 2.0, chain="A", segid=""),
+                record(3, " CA", "1", 3.0, chain="B", segid="RNA"),
+                record(4, " CA", "5", 4.0, chain=" ", segid="RNA")]
+
+
+@pytest.mark.parametrize("field, domains, xs", [
+    ("segid", {"PROT": [1.0], "RNA": [3.0, 4.0]}, [1.0, 3.0, 4.0]),
+    ("chain", {"A": [1.0, 2.0], "B": [3.0]}, [1.0, 2.0, 3.0]),
+    ("auto", {"PROT": [1.0], "A": [2.0], "RNA": [3.0, 4.0]}, [1.0, 2.0, 3.0, 4.0]),
+])
+def test_domain_fields(field, domains, xs):
+    selection = AtomSelection(field=field)
+    conf = PDBparserConf(DOMAIN_LINES, ["PROT", "RNA", "A", "B"], selection=selection)
+    assert sorted(conf.coords[:, 0].tolist()) == xs
+    for dom, values in domains.items():
+        assert conf.coords[conf.chainAtoms(dom), 0].tolist() == values
+    for dom in set(["PROT", "RNA", "A", "B"]) - set(domains):
+        assert dom not in conf
+    # domaines non demandes: non lus
+    first = sorted(domains)[0]
+    assert list(PDBparserConf(DOMAIN_LINES, [first], selection=selection)) == [first]
+
+
+HETERO_LINES = [record(1, " CA", "1", 1.0),
+                record(2, "ZN", "2", 2.0, resName=" ZN", kind="HETATM"),
+                record(3, " C1", "3", 3.0, resName="LIG", kind="HETATM"),
+                record(4, " O", "4", 4.0, resName="HOH", kind="HETATM"),
+                record(5, "MG", "5", 5.0, resName=" MG", kind="HETATM", element="MG")]
+
+
+@pytest.mark.parametrize("hetero, xs", [(None, [1.0]), ("ions", [1.0, 2.0, 5.0]), ("ligands", [1.0, 2.0, 3.0, 5.0]),
+                                        ("all", [1.0, 2.0, 3.0, 4.0, 5.0])])
+def test_hetatm(hetero, xs):
+    conf = PDBparserConf(HETERO_LINES, ["A"], selection=AtomSelection(field="chain", hetero=hetero))
+    assert conf.coords[:, 0].tolist() == xs
+    assert conf.hetero.tolist() == [x != 1.0 for x in xs]
+    elements = dict(zip(conf.coords[:, 0].tolist(), conf.elements.tolist()))
+    assert elements[1.0] == "C"
+    if 2.0 in elements:
+        assert elements[2.0] == "ZN" and elements[5.0] == "MG"   # element des ions sans colonnes 77-78
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the optimal superposition (Kabsch) and of the online RMSF: a rotated and translated
+copy of a structure superposes with a null RMSD, a mirrored copy is only rotated, and the RMSF statistics
+combined over batches, processes and checkpoint pieces (formula of Chan) equal, up to the floating-point
+rounding, those of a single batch of all the frames.
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBiterMulti, PDBparser
+from RMSD import RMSFAccumulator, batchRMSD, superpose
+from conftest import DOMAINS, NB_FRAMES, PARSING
+from parallel import ParallelFrames, analyseFrames
+
+
+def rotation(rand):
+    """
+    :return: Une matrice de rotation aleatoire (determinant +1).
+    """
+    q, r = np.linalg.qr(rand.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    return q if np.linalg.det(q) > 0 else -q
+
+
+def moved(points, rand):
+    return points @ rotation(rand).T + rand.uniform(-50, 50, 3)
+
+
+def test_superpose_rigid_motion():
+    rand = np.random.RandomState(5)
+    target = rand.uniform(-20, 20, (40, 3))
+    mobile = np.array([moved(target, rand) for i in range(6)])
+    assert np.allclose(superpose(mobile, target), target, rtol=0, atol=1e-9)
+
+    domains = {'D1': slice(0, 15), 'D2': slice(15, 40)}
+    rmsd_global, rmsd_dom = batchRMSD(target, mobile, domains, fit='global')
+    assert np.allclose(rmsd_global, 0, atol=1e-9)
+    assert all(np.allclose(values, 0, atol=1e-9) for values in rmsd_dom.values())
+    rmsd_global, rmsd_dom = batchRMSD(target, mobile, domains)   # sans superposition
+    assert (rmsd_global > 1).all()
+
+    # chaque domaine deplace differemment: seule la superposition par domaine annule les RMSD des domaines
+    mobile = np.array([np.concatenate([moved(target[sel], rand) for sel in domains.values()]) for i in range(6)])
+    rmsd_global, rmsd_dom = batchRMSD(target, mobile, domains, fit='domain')
+    assert (rmsd_global > 1).all()
+    assert all(np.allclose(values, 0, atol=1e-9) for values in rmsd_dom.values())
+    assert np.allclose(rmsd_global, batchRMSD(target, mobile, domains, fit='global')[0], rtol=0, atol=0)
+
+
+def test_superpose_reflection():
+    rand = np.random.RandomState(6)
+    target = rand.uniform(-20, 20, (40, 3))
+    mobile = np.array([moved(target * [1, 1, -1], rand) for i in range(4)])   # images miroir: det(H) < 0
+    fitted = superpose(mobile, target)
+    for points, result in zip(mobile, fitted):
+        P = points - points.mean(axis=0)
+        R = np.linalg.lstsq(P, result - target.mean(axis=0), rcond=None)[0]
+        assert np.allclose(R.T @ R, np.eye(3), atol=1e-9)
+        assert np.isclose(np.linalg.det(R), 1.0)   # rotation, pas reflexion
+        # RMSD minimal d'une rotation (Kabsch): la plus petite valeur singuliere change de signe
+        S = np.linalg.svd(P.T @ (target - target.mean(axis=0)), compute_uv=False)
+        e = ((P ** 2).sum() + ((target - target.mean(axis=0)) ** 2).sum() - 2 * (S[0] + S[1] - S[2])) / len(P)
+        assert np.isclose(np.sqrt(((result - target) ** 2).sum(axis=1).mean()), np.sqrt(e))
+    assert (batchRMSD(target, mobile, {}, fit='global')[0] > 1).all()
+
+
+def rmsf(synthetic, tmp_path, fit, frames, batchSize=256, checkpoint=None):
+    acc = RMSFAccumulator(PDBparser(synthetic[0], PARSING), DOMAINS, 'CM', str(tmp_path / "rmsf.txt"), fit,
+                          batchSize)
+    result = analyseFrames(frames, [acc], checkpoint=checkpoint)[0]
+    with open(str(tmp_path / "rmsf.txt")) as f:
+        rows = [line.split("\t")[1:] for line in f if line.startswith("\t") and not line.startswith("\tResidue")]
+    return acc.nb_frames, acc.mean, np.array([[float(x) for x in row] for row in rows]), result
+
+
+def test_direct_statistics(synthetic, tmp_path):
+    nb, mean, rows, result = rmsf(synthetic, tmp_path, None, PDBiterMulti(synthetic[1], PARSING), batchSize=5)
+    points = np.array([np.concatenate([conf.chainCenters(dom) for dom in DOMAINS])
+                       for model, conf in PDBiterMulti(synthetic[1], PARSING)])
+    assert np.allclose(mean, points.mean(axis=0), rtol=0, atol=1e-10)
+    direct = np.sqrt(((points - points.mean(axis=0)) ** 2).sum(axis=2).mean(axis=0))
+    assert np.allclose(np.concatenate([list(result[dom].values()) for dom in DOMAINS]), direct, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("fit", [None, 'global', 'domain'])
+def test_combined_statistics(synthetic, tmp_path, fit):
+    conf = synthetic[1]
+    nb, mean, rows, result = rmsf(synthetic, tmp_path, fit, PDBiterMulti(conf, PARSING))   # un seul lot
+    assert nb == NB_FRAMES
+    for frames, params in ((PDBiterMulti(conf, PARSING), {'batchSize': 5}),
+                           (PDBiterMulti(conf, PARSING), {'checkpoint': 5}),
+                           (ParallelFrames(conf, PARSING, 2, chunkSize=3), {})):
+        nb2, mean2, rows2, result2 = rmsf(synthetic, tmp_path, fit, frames, **params)
+        assert nb2 == nb
+        assert np.allclose(mean2, mean, rtol=0, atol=1e-10)
+        assert np.allclose(rows2, rows, rtol=0, atol=1.5e-3)   # derniere decimale ecrite
+        for dom in result:
+            assert np.allclose(list(result2[dom].values()), list(result[dom].values()), rtol=0, atol=1e-12)
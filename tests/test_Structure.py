@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the Structure: its mapping views behave as the nested dictionaries of the former
+parser, and the precomputed tables of centers of mass of the residues (of a Structure, of a Trajectory
+and of the binary cache) equal, to the bit, the legacy centerOfMass computed atom by atom on plain
+nested dictionaries (and its mass-weighted equivalent).
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBconvert, PDBiterMulti, PDBparser, PDBparserMulti, iterFrames
+from RMSD import centerOfMass
+from Structure import centersOfMass
+from conftest import NB_FRAMES, PARSING
+from trajectory import Trajectory
+
+
+def plainResidue(residue):
+    """
+    :return: Le residu (vue d'une Structure) sous forme de dictionnaire {'atomlist': [...], atome: {'x', 'y', 'z'}}.
+    """
+    plain = {'atomlist': list(residue['atomlist'])}
+    for atom in plain['atomlist']:
+        plain[atom] = dict((axis, residue[atom][axis]) for axis in ('x', 'y', 'z'))
+    return plain
+
+
+def legacyCenters(conf, masses=None):
+    """
+    :return: Le tableau (n_residues, 3) des centres de masse de centerOfMass, ou ponderes par masses atome par atome.
+    """
+    centers = []
+    for i, (chain, res) in enumerate(zip(conf.resChain.tolist(), conf.resList.tolist())):
+        residue = plainResidue(conf[chain][res])
+        if masses is None:
+            center = centerOfMass(residue)
+        else:
+            weights = masses[conf.resOffsets[i]:conf.resOffsets[i + 1]].tolist()
+            total = 0
+            center = {'x': 0, 'y': 0, 'z': 0}
+            for atom, mass in zip(residue['atomlist'], weights):
+                for axis in center:
+                    center[axis] += residue[atom][axis] * mass
+                total += mass
+            center = dict((axis, value / total) for axis, value in center.items())
+        centers.append((center['x'], center['y'], center['z']))
+    return np.array(centers)
+
+
+@pytest.mark.parametrize("massWeighted", [False, True])
+def test_structure_centers(synthetic, massWeighted):
+    conf = PDBparser(synthetic[0], PARSING, massWeighted=massWeighted)
+    expected = legacyCenters(conf, conf.masses() if massWeighted else None)
+    assert np.array_equal(conf.centers(), expected)
+    start, stop = conf.chainOffsets[PARSING[1]]
+    assert np.array_equal(conf.chainCenters(PARSING[1]), expected[start:stop])
+    # centerOfMass d'une vue: lu dans la table
+    view = conf[PARSING[1]][conf[PARSING[1]]['reslist'][2]]
+    assert [centerOfMass(view)[axis] for axis in ('x', 'y', 'z')] == expected[start + 2].tolist()
+
+
+def test_trajectory_centers(synthetic):
+    frames = PDBparserMulti(synthetic[1], PARSING)
+    assert isinstance(frames, Trajectory) and len(frames) == NB_FRAMES
+    table = frames.centers()
+    weighted = frames.centers(massWeighted=True)
+    masses = frames.topology.masses()
+    for rank, (model, conf) in enumerate(iterFrames(frames)):
+        assert np.array_equal(table[rank], legacyCenters(conf))
+        assert np.array_equal(weighted[rank], legacyCenters(conf, masses))
+        assert np.array_equal(conf.centers(), table[rank])
+    assert np.array_equal(frames.centers([3, 7]), table[[3, 7]])
+    # lot de conformations en une operation, ou une par une
+    coords = np.stack([conf.coords for model, conf in iterFrames(frames)])
+    offsets = frames.topology.resOffsets
+    assert np.array_equal(centersOfMass(coords, offsets), np.stack([centersOfMass(c, offsets) for c in coords]))
+
+
+@pytest.mark.parametrize("massWeighted", [False, True])
+def test_cached_centers(trajectory, massWeighted):
+    PDBconvert(trajectory[1], PARSING, massWeighted=massWeighted)
+    for model, conf in PDBiterMulti(trajectory[1], PARSING, massWeighted=massWeighted):
+        assert conf._centers is not None   # table lue dans le cache
+        assert np.array_equal(conf.centers(), legacyCenters(conf, conf.masses() if massWeighted else None))
+
+
+def test_mapping_views(synthetic):
+    conf = PDBparser(synthetic[0], PARSING)
+    assert list(conf) == PARSING and len(conf) == len(PARSING)
+    with open(synthetic[0]) as f:
+        lines = [line for line in f if line.startswith("ATOM")]
+    for line in lines[::97]:   # valeurs des vues: celles des lignes ATOM
+        atom = conf[line[72:76].strip()][line[22:26].strip()][line[12:16].strip()]
+        assert dict(atom) == {'x': float(line[30:38]), 'y': float(line[38:46]), 'z': float(line[46:54]),
+                              'id': line[6:11].strip()}
+
+    for dom in PARSING:
+        chain = conf[dom]
+        keys = list(chain)
+        assert keys[0] == 'reslist' and keys[1:] == chain['reslist'] and len(chain) == len(keys)
+        residue = chain[chain['reslist'][-1]]
+        keys = list(residue)   # toutes les cles lisibles sont parcourues
+        assert keys == ['resname'] + residue['atomlist'] + ['atomlist', 'bfactor'] and len(residue) == len(keys)
+        assert dict(residue)['bfactor'] == 0.0
+
+    residue = conf[PARSING[0]][conf[PARSING[0]]['reslist'][3]]
+    residue['bfactor'] = 1.0
+    assert residue['bfactor'] == 1.0 and conf.resBfactors[conf.chainOffsets[PARSING[0]][0] + 3] == 1.0
+    with pytest.raises(KeyError):
+        residue['resname'] = "ALA"
+    for key in ('CA2', 'x'):
+        with pytest.raises(KeyError):
+            residue[key]
+    with pytest.raises(KeyError):
+        conf['Z']
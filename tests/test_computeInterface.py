@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Regression tests of the vectorised residue distance matrices (resDistMatrix, distMatrix):
+in both modes they equal, up to the rounding of the sums of squares, the distances of the legacy
+distDico computed residue by residue on plain nested dictionaries, whatever the memory budget.
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBparser
+from computeInterface import distDico, distMatrix, resDistMatrix
+from conftest import DOMAINS, PARSING, RNA
+
+
+def plainResidue(residue):
+    """
+    :return: Le residu (vue d'une Structure) sous forme de dictionnaire {'atomlist': [...], atome: {'x', 'y', 'z'}},
+    lu par les boucles Python de distDico et centerOfMass.
+    """
+    plain = {'atomlist': list(residue['atomlist'])}
+    for atom in plain['atomlist']:
+        plain[atom] = dict((axis, residue[atom][axis]) for axis in ('x', 'y', 'z'))
+    return plain
+
+
+def legacyMatrix(conf, dom1, dom2, mode):
+    residues1 = [plainResidue(conf[dom1][res]) for res in conf[dom1]['reslist']]
+    residues2 = [plainResidue(conf[dom2][res]) for res in conf[dom2]['reslist']]
+    return np.array([[distDico(res1, res2, mode) for res2 in residues2] for res1 in residues1])
+
+
+@pytest.mark.parametrize("mode", ["CM", "atom"])
+def test_legacy_distances(synthetic, mode):
+    conf = PDBparser(synthetic[0], PARSING)
+    for dom1, dom2 in [(DOMAINS[0], RNA), (DOMAINS[3], DOMAINS[1])]:
+        expected = legacyMatrix(conf, dom1, dom2, mode)
+        data = resDistMatrix(conf, dom1, dom2, mode)
+        assert data.shape == expected.shape == (len(conf[dom1]['reslist']), len(conf[dom2]['reslist']))
+        assert np.allclose(data, expected, rtol=1e-14, atol=0)
+        for budget in (1, 50000):   # une ligne (ou un residu) par bloc, puis des tuiles de plusieurs residus
+            assert np.array_equal(resDistMatrix(conf, dom1, dom2, mode, budget), data)
+        # vues d'une Structure
+        res1 = conf[dom1][conf[dom1]['reslist'][0]]
+        res2 = conf[dom2][conf[dom2]['reslist'][-1]]
+        assert np.isclose(distDico(res1, res2, mode), expected[0, -1], rtol=1e-14, atol=0)
+    with pytest.raises(ValueError):
+        resDistMatrix(conf, DOMAINS[0], RNA, "CA")
+
+
+def test_dist_matrix_plot(synthetic, tmp_path):
+    pytest.importorskip("matplotlib")
+    conf = PDBparser(synthetic[0], PARSING)
+    data = distMatrix(conf, DOMAINS[0], RNA, "CM", plotDir=str(tmp_path))
+    assert np.array_equal(data, resDistMatrix(conf, DOMAINS[0], RNA, "CM"))
+    assert (tmp_path / ("distmat_%s_%s.png" % (DOMAINS[0], RNA))).exists()
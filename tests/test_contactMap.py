@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the all-pairs contact map (ContactMapAccumulator, ContactMap): the counts equal
+those of distDico over every pair of residues of different domains, and the saved CSR matrix is read
+back by loadContactMap and by scipy.sparse.load_npz.
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBiterMulti
+from computeInterface import distDico
+from conftest import DOMAINS, PARSING, RNA
+from contactMap import ContactMapAccumulator, loadContactMap
+from parallel import analyseFrames
+
+THRESHOLD = 8.0
+NB_READ = 4   # conformations lues (la recherche exhaustive est lente)
+
+
+def bruteCounts(synthetic, mode, domains=PARSING):
+    """
+    :return: La matrice (residus x residus, triangle superieur) du nombre de conformations ou distDico est
+    inferieure ou egale au seuil, pour toutes les paires de residus de domaines differents.
+    """
+    counts = None
+    for model, conf in PDBiterMulti(synthetic[1], PARSING, stop=NB_READ):
+        keys = list(zip(conf.resChain.tolist(), conf.resList.tolist()))
+        views = [conf[chain][res] for chain, res in keys]
+        if counts is None:
+            counts = np.zeros((len(keys), len(keys)), dtype=np.int64)
+        for i in range(len(keys)):
+            for j in range(i + 1, len(keys)):
+                if (keys[i][0] != keys[j][0] and keys[i][0] in domains and keys[j][0] in domains
+                        and distDico(views[i], views[j], mode) <= THRESHOLD):
+                    counts[i, j] += 1
+    return counts
+
+
+def contactMap(synthetic, tmp_path, mode, **options):
+    acc = ContactMapAccumulator(THRESHOLD, mode, output=str(tmp_path / "contacts.npz"),
+                                summary=str(tmp_path / "contacts.txt"), **options)
+    return analyseFrames(PDBiterMulti(synthetic[1], PARSING, stop=NB_READ), [acc])[0]
+
+
+@pytest.mark.parametrize("mode", ["CM", "atom"])
+def test_brute_force(synthetic, tmp_path, mode):
+    expected = bruteCounts(synthetic, mode)
+    assert expected.sum() > 0 and expected.max() == NB_READ
+    for options in ({}, {'compactSize': 1, 'budget': 1}):   # regroupement apres chaque conformation
+        result = contactMap(synthetic, tmp_path, mode, **options)
+        assert result.nFrames == NB_READ and (result.rows < result.cols).all()
+        assert np.array_equal(np.triu(result.toDense()), expected)
+        assert np.array_equal(result.toDense(), result.toDense().T)
+
+
+def test_selected_domains(synthetic, tmp_path):
+    domains = [RNA, DOMAINS[1]]   # dans un autre ordre que la Structure
+    result = contactMap(synthetic, tmp_path, "CM", domains=domains)
+    assert len(result.rows) and (result.rows < result.cols).all()
+    assert np.array_equal(np.triu(result.toDense()), bruteCounts(synthetic, "CM", domains))
+    assert set(result.chains[result.rows]) | set(result.chains[result.cols]) <= set(domains)
+
+
+def test_saved_map(synthetic, tmp_path):
+    result = contactMap(synthetic, tmp_path, "atom", duration=10.0)
+    loaded = loadContactMap(str(tmp_path / "contacts.npz"))
+    assert loaded.chains.tolist() == result.chains.tolist() and loaded.residues.tolist() == result.residues.tolist()
+    assert loaded.nFrames == NB_READ
+    assert np.array_equal(loaded.toDense(), result.toDense())
+
+    i, j = result.rows[0], result.cols[0]
+    assert result.count(result.chains[i], result.residues[i], result.chains[j], result.residues[j]) == result.counts[0]
+    assert result.count(result.chains[j], result.residues[j], result.chains[i], result.residues[i]) == result.counts[0]
+    with pytest.raises(KeyError):
+        result.count(RNA, "9999", DOMAINS[0], "1")
+
+    with open(str(tmp_path / "contacts.txt")) as f:
+        rows = [line.rstrip("\n").split("\t") for line in f]
+    assert rows[0] == ["dom1", "res1", "dom2", "res2", "frames", "frequency", "contact_time_ns"]
+    assert len(rows) - 1 == len(result.counts)
+    frames = [int(row[4]) for row in rows[1:]]
+    assert frames == sorted(frames, reverse=True)
+    assert all(float(row[6]) == int(row[4]) * 10.0 / NB_READ for row in rows[1:])
+
+
+def test_scipy_load_npz(synthetic, tmp_path):
+    sparse = pytest.importorskip("scipy.sparse")
+    result = contactMap(synthetic, tmp_path, "CM")
+    matrix = sparse.load_npz(str(tmp_path / "contacts.npz"))
+    assert matrix.format == "csr" and matrix.shape == result.shape
+    assert np.array_equal(matrix.toarray(), np.triu(result.toDense()))
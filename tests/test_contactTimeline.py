@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the contact timelines: sliding windows wider than the frames seen so far, as in
+checkpoints, follow mode and short trajectories.
+"""
+
+import pytest
+
+from ParserPDB import PDBiterMulti
+from conftest import PAIRS, PARSING, RNA, DOMAINS
+from contactTimeline import TimelineAccumulator
+from jobs import FOLLOW_DELAY, makeJob, runJob
+from parallel import analyseFrames
+
+
+def readSummary(path):
+    with open(path) as f:
+        return [line.rstrip("\n").split("\t") for line in f]
+
+
+def test_window_wider_than_trajectory(synthetic, tmp_path):
+    ref, conf = synthetic
+    summary = str(tmp_path / "tl.txt")
+    timeline = analyseFrames(PDBiterMulti(conf, PARSING, stop=3),
+                             [TimelineAccumulator(PAIRS, 10.0, 'CM', summary=summary, window=5)])[0]
+    rows = readSummary(summary)
+    assert rows[0][-2:] == ["min_window_occupancy", "max_window_occupancy"]
+    assert all(row[-2:] == ["nan", "nan"] for row in rows[1:])
+    with pytest.raises(ValueError):   # appel direct: la fenetre doit rester valide
+        timeline.slidingOccupancy(5)
+
+
+def test_checkpoint_with_window(synthetic, tmp_path):
+    ref, conf = synthetic
+    final = str(tmp_path / "final.txt")
+    partial = str(tmp_path / "partial.txt")
+    analyseFrames(PDBiterMulti(conf, PARSING), [TimelineAccumulator(PAIRS, 10.0, 'CM', summary=final, window=5)])
+    analyseFrames(PDBiterMulti(conf, PARSING), [TimelineAccumulator(PAIRS, 10.0, 'CM', summary=partial, window=5)],
+                  checkpoint=1)
+    assert readSummary(partial) == readSummary(final)
+    assert readSummary(final)[1][-1] != "nan"
+
+
+def test_follow_with_window(trajectory, tmp_path):
+    ref, conf = trajectory
+    with open(conf, "a") as f:   # dynamique terminee: la lecture s'arrete a END
+        f.write("END\n")
+    summary = str(tmp_path / "follow.txt")
+    job = makeJob({'ref': ref, 'conf': conf, 'domains': DOMAINS, 'rna': RNA, 'pairs': PAIRS, 'threshold': 10.0,
+                   'follow': True, 'follow_poll': 0.01, 'timeline_summary': summary, 'timeline_window': 5})
+    assert job['checkpoint'] == 1 and job['checkpoint_delay'] == FOLLOW_DELAY   # sorties reecrites au plus toutes les 30 s
+    runJob(job)
+    reference = str(tmp_path / "stream.txt")
+    analyseFrames(PDBiterMulti(conf, PARSING), [TimelineAccumulator(PAIRS, 10.0, 'CM', summary=reference, window=5)])
+    assert readSummary(summary) == readSummary(reference)
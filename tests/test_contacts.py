@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the contact times and timelines: pairs of residues that are not in the topology
+(for example a typo in the pairs of a job file) are reported instead of counted as never in contact.
+"""
+
+import pytest
+
+from ParserPDB import PDBiterMulti
+from computeInterface import ContactAccumulator
+from conftest import PAIRS, PARSING
+from contactTimeline import TimelineAccumulator
+from parallel import analyseFrames
+
+
+def accumulators(pairs, tmp_path):
+    return [ContactAccumulator(pairs, 10.0, 1.0, 'CM', str(tmp_path / "contacts.txt")),
+            TimelineAccumulator(pairs, 10.0, 'CM')]
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_missing_first_residue(synthetic, tmp_path, index):
+    pairs = dict(PAIRS)
+    pairs['9999'] = {'dom1': 'A1', 'res2': '3', 'dom2': 'B'}
+    with pytest.raises(ValueError, match="Residue 9999 .* domain A1"):
+        analyseFrames(PDBiterMulti(synthetic[1], PARSING, stop=2), [accumulators(pairs, tmp_path)[index]])
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_missing_second_residue(synthetic, tmp_path, index):
+    pairs = dict(PAIRS)
+    pairs['12'] = {'dom1': 'A2', 'res2': '9999', 'dom2': 'B'}
+    with pytest.raises(ValueError, match="Residue 9999 .* domain B"):
+        analyseFrames(PDBiterMulti(synthetic[1], PARSING, stop=2), [accumulators(pairs, tmp_path)[index]])
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_missing_domain(synthetic, tmp_path, index):
+    pairs = dict(PAIRS)
+    pairs['5'] = {'dom1': 'A1', 'res2': '3', 'dom2': 'C'}
+    with pytest.raises(ValueError, match="Domain C"):
+        analyseFrames(PDBiterMulti(synthetic[1], PARSING, stop=2), [accumulators(pairs, tmp_path)[index]])
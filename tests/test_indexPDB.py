@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the MODEL index: random access to the blocks, reuse of the saved index, and its
+invalidation when the pdb file is modified or only touched.
+"""
+
+import os
+
+import numpy as np
+
+from conftest import NB_FRAMES
+from indexPDB import INDEX_SUFFIX, buildIndex, loadIndex
+from readerPDB import streamBlocks
+
+
+def sameIndex(index, other):
+    return (np.array_equal(index.models, other.models) and np.array_equal(index.offsets, other.offsets)
+            and np.array_equal(index.lengths, other.lengths))
+
+
+def touch(path, seconds=10):
+    """
+    Avance la date de modification de path (sans changer son contenu).
+    """
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_random_access(trajectory):
+    conf = trajectory[1]
+    index = loadIndex(conf)
+    assert len(index) == NB_FRAMES
+    blocks = list(streamBlocks(conf))
+    for i in (7, 0, NB_FRAMES - 1, 3):
+        assert index.block(i) == blocks[i]
+    assert list(index.blocks(index.select(1, None, 4))) == blocks[1::4]
+
+
+def test_saved_index_reused(trajectory):
+    conf = trajectory[1]
+    index = loadIndex(conf)
+    saved = os.stat(conf + INDEX_SUFFIX).st_mtime_ns
+    assert sameIndex(loadIndex(conf), index)
+    assert os.stat(conf + INDEX_SUFFIX).st_mtime_ns == saved   # relu, pas reecrit
+
+
+def test_touched_pdb(trajectory):
+    conf = trajectory[1]
+    loadIndex(conf)
+    with open(conf + INDEX_SUFFIX, 'wb') as f:   # index enregistre faux: il ne doit plus etre relu
+        np.savez(f, models=np.array(["1"]), offsets=np.array([0]), lengths=np.array([1]),
+                 size=os.path.getsize(conf), mtime=os.stat(conf).st_mtime_ns)
+    assert len(loadIndex(conf)) == 1
+    touch(conf)
+    assert sameIndex(loadIndex(conf), buildIndex(conf))
+
+
+def test_modified_pdb(trajectory):
+    conf = trajectory[1]
+    before = loadIndex(conf)
+    with open(conf, 'rb') as f:
+        data = f.read()
+    last = data.rindex(b"MODEL")
+    with open(conf, 'wb') as f:   # meme taille, dernier modele renumerote
+        f.write(data[:last] + b"MODEL       99" + data[last + 14:])
+    touch(conf)
+    after = loadIndex(conf)
+    assert len(after) == len(before) and after.models[-1] == "99"
+    with open(conf, 'ab') as f:   # conformation ajoutee
+        f.write(data[last:].replace(b"MODEL       %2d" % NB_FRAMES, b"MODEL      100"))
+    touch(conf, 20)
+    assert list(loadIndex(conf).models[-2:]) == ["99", "100"]
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the non-interactive jobs: job files and manifests in JSON, YAML and TOML, paths
+relative to the file that names them, validation of the parameters, and manifests run by a pool of
+processes whose jobs read the conformations with their own pool of workers.
+"""
+
+import json
+import os
+
+import pytest
+
+from conftest import DOMAINS, PAIRS, RNA
+from jobs import DEFAULTS, loadJob, loadManifest, makeJob, runJob, runManifest
+
+OUTPUTS = ('rmsd_output', 'freq_output', 'contact_output')
+
+
+def tomlValue(value):
+    """
+    :return: La valeur au format TOML (tables et listes en ligne).
+    """
+    if isinstance(value, dict):
+        return "{%s}" % ", ".join("%s = %s" % (key, tomlValue(v)) for key, v in value.items())
+    if isinstance(value, list):
+        return "[%s]" % ", ".join(tomlValue(v) for v in value)
+    return json.dumps(value)   # chaines, nombres et booleens
+
+
+def writeConfig(path, config):
+    """
+    Ecrit config au format de l'extension de path (.json, .yaml ou .toml, les valeurs None etant omises en TOML).
+    """
+    if path.endswith(".yaml"):
+        yaml = pytest.importorskip("yaml")
+        with open(path, "w") as f:
+            yaml.safe_dump(config, f)
+    elif path.endswith(".toml"):
+        tables = [("", dict((key, value) for key, value in config.items() if key not in ('defaults', 'jobs')))]
+        if 'defaults' in config:
+            tables.append(("[defaults]", config['defaults']))
+        tables.extend(("[[jobs]]", entry) for entry in config.get('jobs', []))
+        lines = []
+        for header, table in tables:
+            lines.extend([header] if header else [])
+            lines.extend("%s = %s" % (key, tomlValue(value)) for key, value in table.items() if value is not None)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        with open(path, "w") as f:
+            json.dump(config, f)
+    return path
+
+
+def jobConfig(**options):
+    config = {'domains': DOMAINS, 'rna': RNA, 'duration': 100.0, 'threshold': 8.0, 'dist_mode': "CM",
+              'pairs': [{'res1': res1, 'dom1': p['dom1'], 'res2': p['res2'], 'dom2': p['dom2']}
+                        for res1, p in PAIRS.items()]}
+    config.update(options)
+    return config
+
+
+@pytest.mark.parametrize("ext", [".json", ".yaml", ".toml"])
+def test_manifest_formats(trajectory, tmp_path, monkeypatch, ext):
+    directory = tmp_path / "manifest"
+    directory.mkdir()
+    defaults = jobConfig(ref="../ref.pdb", plot_dir="plots")
+    del defaults['pairs']   # paires par defaut de base
+    jobs = [{'conf': "../conf.pdb", 'rmsd_output': "rmsd_%d.txt" % i, 'threshold': 7.0 + i} for i in range(2)]
+    jobs[1]['ref'] = os.path.abspath(trajectory[0])   # chemin absolu garde tel quel
+    path = writeConfig(str(directory / ("replicas" + ext)), {'defaults': defaults, 'jobs': jobs})
+    monkeypatch.chdir(str(tmp_path.parent))   # chemins relatifs au manifeste, pas au repertoire courant
+
+    loaded = loadManifest(path, base={'pairs': PAIRS, 'threshold': 5.0, 'workers': 2})
+    assert len(loaded) == 2
+    for i, job in enumerate(loaded):
+        assert os.path.samefile(job['ref'], trajectory[0]) and os.path.samefile(job['conf'], trajectory[1])
+        assert job['rmsd_output'] == os.path.join(str(directory), "rmsd_%d.txt" % i)
+        assert job['plot_dir'] == os.path.join(str(directory), "plots")
+        assert job['domains'] == DOMAINS and job['rna'] == RNA
+        assert job['threshold'] == 7.0 + i   # job > defaults > base
+        assert job['workers'] == 2 and job['pairs'] == PAIRS
+        assert job['fit'] == DEFAULTS['fit']
+
+    # liste de jobs sans defaults
+    path = writeConfig(str(directory / "list.json"), [jobConfig(ref="../ref.pdb", conf="../conf.pdb",
+                                                                freq_output="freq.txt")])
+    assert [job['freq_output'] for job in loadManifest(path)] == [os.path.join(str(directory), "freq.txt")]
+
+
+@pytest.mark.parametrize("ext", [".json", ".yaml", ".toml"])
+def test_job_file(trajectory, tmp_path, monkeypatch, ext):
+    path = writeConfig(str(tmp_path / ("job" + ext)), jobConfig(ref="ref.pdb", conf="conf.pdb", domains="A1,A2",
+                                                               freq_output="out/freq.txt", bfactor_models="1,3"))
+    monkeypatch.chdir(str(tmp_path.parent))
+    job = makeJob(loadJob(path))
+    assert job['ref'] == os.path.join(str(tmp_path), "ref.pdb") and os.path.isfile(job['ref'])
+    assert job['freq_output'] == os.path.join(str(tmp_path), "out", "freq.txt")
+    assert job['domains'] == ["A1", "A2"] and job['bfactor_models'] == ["1", "3"]
+    assert job['pairs'] == PAIRS
+
+
+@pytest.mark.parametrize("options, message", [
+    ({'unknown_key': 1}, "Unknown job parameters: unknown_key"),
+    ({'conf': None}, "Missing job parameter: conf"),
+    ({'fit': "best"}, "fit must be"),
+    ({'plot_format': "jpg"}, "plot_format must be"),
+    ({'altloc': "AB"}, "altloc must be"),
+    ({'workers': 0}, "number of workers"),
+    ({'memory_budget': 0}, "memory budget"),
+    ({'checkpoint': 0}, "checkpoint interval"),
+    ({'checkpoint_delay': -1}, "delay between two checkpoints"),
+    ({'result_cache_size': 0}, "size of the result cache"),
+    ({'follow': True, 'workers': 2}, "follow reads the conformations"),
+    ({'contact_output': "contacts.txt", 'duration': None}, "duration of the dynamics"),
+    ({'freq_output': None}, "The job has no output"),
+    ({'bfactor_output': "bf.pdb", 'freq_output': None, 'rmsd_output': "rmsd.txt"}, "bfactor_output needs"),
+    ({'profile': "gprof"}, "profile must be"),
+    ({'pairs': [{'res1': 5, 'dom1': "A1", 'res2': 3, 'dom2': "B"}] * 2}, "Residue 5 appears in several"),
+])
+def test_validation(options, message):
+    config = jobConfig(ref="ref.pdb", conf="conf.pdb", freq_output="freq.txt")
+    config.update(options)
+    with pytest.raises(ValueError, match=message):
+        makeJob(config)
+
+
+def test_invalid_files(tmp_path):
+    with pytest.raises(ValueError, match="Unknown configuration format"):
+        loadJob(writeConfig(str(tmp_path / "job.ini"), {}))
+    with pytest.raises(ValueError, match="mapping of parameters"):
+        loadJob(writeConfig(str(tmp_path / "job.json"), [1, 2]))
+    with pytest.raises(ValueError, match="must be a list"):
+        loadManifest(writeConfig(str(tmp_path / "manifest.json"), {'jobs': {'conf': "conf.pdb"}}))
+    with pytest.raises(ValueError, match="Missing job parameter: ref"):   # chaque job est verifie
+        loadManifest(writeConfig(str(tmp_path / "manifest.json"), [jobConfig(conf="conf.pdb", freq_output="f.txt")]))
+
+
+def readOutputs(job):
+    result = {}
+    for key in OUTPUTS:
+        with open(job[key], "rb") as f:
+            result[key] = f.read()
+    return result
+
+
+def test_manifest_with_workers(trajectory, tmp_path):
+    """
+    Jobs d'un manifeste executes en parallele, chacun lisant les conformations avec ses propres processus (workers):
+    memes sorties que le job execute seul, sans processus.
+    """
+    outputs = dict((key, key.split("_")[0] + ".txt") for key in OUTPUTS)
+    serial = makeJob(resolveAll(jobConfig(ref=trajectory[0], conf=trajectory[1], **outputs), str(tmp_path / "serial")))
+    runJob(serial)
+    expected = readOutputs(serial)
+
+    jobs = [makeJob(resolveAll(jobConfig(ref=trajectory[0], conf=trajectory[1], workers=2, **outputs),
+                               str(tmp_path / ("replica%d" % i)))) for i in range(3)]
+    jobs.append(makeJob(resolveAll(jobConfig(ref=trajectory[0], conf=str(tmp_path / "missing.pdb"), **outputs),
+                                   str(tmp_path / "failed"))))
+    errors = runManifest(jobs, maxJobs=2)
+    assert errors[:3] == [None] * 3 and isinstance(errors[3], FileNotFoundError)   # un echec n'arrete pas les autres
+    for job in jobs[:3]:
+        assert readOutputs(job) == expected
+    with pytest.raises(ValueError):
+        runManifest(jobs, maxJobs=0)
+
+
+def resolveAll(config, directory):
+    """
+    :return: config avec ses fichiers de sortie dans directory (cree).
+    """
+    os.makedirs(directory)
+    for key in OUTPUTS:
+        config[key] = os.path.join(directory, config[key])
+    return config
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the cell-list neighbour search against a brute-force distance matrix: points
+exactly at the cutoff, bounding boxes farther than the cutoff, empty sets and memory budgets small
+enough to process one point per block, for pairs of points and pairs of residues (CM and atom modes).
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBparser
+from conftest import DOMAINS, PARSING, RNA
+from neighbourSearch import MEMORY_BUDGET, neighbourPairs, residuePairs, splitRows, tileRows
+
+
+def brutePairs(coords1, coords2, cutoff):
+    """
+    :return: Les couples (i, j, d) a une distance inferieure ou egale a cutoff, par la matrice de toutes les distances.
+    """
+    d = np.sqrt(((coords1[:, np.newaxis, :] - coords2[np.newaxis, :, :]) ** 2).sum(axis=2))
+    i, j = np.nonzero(d <= cutoff)   # ordre (i, j)
+    return i, j, d[i, j]
+
+
+def assertPairs(found, expected):
+    assert np.array_equal(found[0], expected[0])
+    assert np.array_equal(found[1], expected[1])
+    assert np.allclose(found[2], expected[2], rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("budget", [None, 1, 2000])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_random_points(budget, dtype):
+    rand = np.random.RandomState(7)
+    coords1 = rand.uniform(-30, 30, (300, 3)).astype(dtype)
+    coords2 = rand.uniform(-10, 50, (200, 3)).astype(dtype)
+    for cutoff in (0.5, 4.0, 12.0, 200.0):
+        assertPairs(neighbourPairs(coords1, coords2, cutoff, budget), brutePairs(coords1, coords2, cutoff))
+
+
+@pytest.mark.parametrize("budget", [None, 1])
+def test_points_at_cutoff(budget):
+    # grille de pas 2: distances exactement egales a 4 (entre plusieurs cellules), gardees
+    grid = np.array([(x, y, z) for x in range(0, 12, 2) for y in range(0, 12, 2) for z in range(0, 6, 2)], dtype=float)
+    found = neighbourPairs(grid, grid + [0.0, 0.0, 4.0], 4.0, budget)
+    assertPairs(found, brutePairs(grid, grid + [0.0, 0.0, 4.0], 4.0))
+    assert (found[2] == 4.0).any()
+    assert len(neighbourPairs(grid, grid + [0.0, 0.0, 4.0 + 1e-9], 4.0, budget)[0]) < len(found[0])
+
+
+def test_disjoint_and_empty_sets():
+    rand = np.random.RandomState(8)
+    coords = rand.uniform(0, 10, (50, 3))
+    for far in ([10.0 + 5.0 + 1e-6, 0, 0], [1000.0, 1000.0, -1000.0]):   # boites a plus de cutoff l'une de l'autre
+        assert [len(a) for a in neighbourPairs(coords, coords + far, 5.0)] == [0, 0, 0]
+    # boites a moins de cutoff: seuls les points des bords sont proches
+    assertPairs(neighbourPairs(coords, coords + [14.0, 0, 0], 5.0), brutePairs(coords, coords + [14.0, 0, 0], 5.0))
+    none = np.zeros((0, 3))
+    for coords1, coords2 in ((none, coords), (coords, none), (none, none)):
+        i, j, d = neighbourPairs(coords1, coords2, 5.0)
+        assert len(i) == len(j) == len(d) == 0 and i.dtype == np.intp
+    with pytest.raises(ValueError):
+        neighbourPairs(coords, coords, 0.0)
+
+
+def bruteResiduePairs(conf, dom1, dom2, cutoff, mode):
+    if mode == "CM":
+        return brutePairs(conf.chainCenters(dom1), conf.chainCenters(dom2), cutoff)
+    offsets1 = conf.chainResOffsets(dom1)
+    offsets2 = conf.chainResOffsets(dom2)
+    coords1 = conf.coords[conf.chainAtoms(dom1)]
+    coords2 = conf.coords[conf.chainAtoms(dom2)]
+    d = np.array([[np.sqrt(((coords1[a1:b1, np.newaxis] - coords2[np.newaxis, a2:b2]) ** 2).sum(axis=2)).min()
+                   for a2, b2 in zip(offsets2[:-1], offsets2[1:])] for a1, b1 in zip(offsets1[:-1], offsets1[1:])])
+    r1, r2 = np.nonzero(d <= cutoff)
+    return r1, r2, d[r1, r2]
+
+
+@pytest.mark.parametrize("mode", ["CM", "atom"])
+@pytest.mark.parametrize("budget", [None, 1])
+def test_residue_pairs(synthetic, mode, budget):
+    conf = PDBparser(synthetic[0], PARSING)
+    found = 0
+    for dom1, dom2 in [(DOMAINS[0], RNA), (DOMAINS[2], DOMAINS[3]), (DOMAINS[1], DOMAINS[1])]:
+        for cutoff in (5.0, 12.0, 30.0):
+            expected = bruteResiduePairs(conf, dom1, dom2, cutoff, mode)
+            assertPairs(residuePairs(conf, dom1, dom2, cutoff, mode, budget=budget), expected)
+            found += len(expected[0])
+    assert found > 0
+    with pytest.raises(ValueError):
+        residuePairs(conf, DOMAINS[0], RNA, 5.0, "CA")
+
+
+def test_split_rows():
+    rand = np.random.RandomState(9)
+    weights = rand.randint(0, 50, 200)
+    weights[10:20] = 0
+    weights[50] = 500   # plus lourde que la limite: seule dans son bloc
+    for limit in (1, 60, 100, 10 ** 6):
+        bounds = splitRows(weights, limit)
+        assert bounds[0][0] == 0 and bounds[-1][1] == len(weights)
+        assert all(stop == start2 for (start, stop), (start2, stop2) in zip(bounds, bounds[1:]))
+        for start, stop in bounds:
+            assert stop > start
+            assert weights[start:stop].sum() <= limit or stop == start + 1
+            if stop < len(weights):   # blocs les plus grands possibles
+                assert weights[start:stop + 1].sum() > limit
+    assert splitRows(np.ones(5, dtype=int), 1) == [(i, i + 1) for i in range(5)]
+    assert splitRows(np.zeros(0, dtype=int), 10) == []
+
+
+def test_tile_rows():
+    assert tileRows(100, 8, budget=8000) == 10
+    assert tileRows(100, 8, budget=7999) == 9
+    assert tileRows(100, 8, budget=1) == 1   # au moins une ligne
+    assert tileRows(0, 8, budget=80) == 10
+    assert tileRows(1000, 56) == MEMORY_BUDGET // (56 * 1000)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the fused passes over the conformations: the accumulator protocol, and output
+files of a run on several processes, streamed or with checkpoints identical, byte for byte, to those
+of the serial run, chunks submitted to the processes without the results already merged, and the
+minimum delay between two checkpoints.
+"""
+
+import functools
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import jobs
+import parallel
+from ParserPDB import PDBiterMulti
+from computeInterface import ContactAccumulator
+from conftest import DOMAINS, NB_FRAMES, PAIRS, PARSING, RNA
+from jobs import makeJob, runJob
+from parallel import Accumulator, ParallelFrames, analyseFrames
+
+# sorties identiques quel que soit le decoupage (le RMSF ne l'est qu'aux arrondis pres, voir test_RMSD)
+OUTPUTS = {'rmsd_output': "rmsd.txt", 'freq_output': "freq.txt", 'bfactor_output': "bfactor.pdb",
+           'contact_output': "contacts.txt", 'timeline_output': "timeline.npz", 'timeline_summary': "timeline.txt",
+           'contactmap_output': "map.npz", 'contactmap_summary': "map.txt"}
+
+
+class Incomplete(Accumulator):
+    """
+    Accumulateur sans merge ni finish.
+    """
+
+    def reset(self):
+        self.nb = 0
+
+    def update(self, model, conf, memo, fout=None):
+        self.nb += 1
+
+    def partial(self):
+        return self.nb
+
+
+def test_incomplete_accumulator():
+    with pytest.raises(TypeError, match="merge"):
+        Incomplete()
+
+
+def runOutputs(trajectory, directory, **params):
+    """
+    :return: Le contenu {fichier: octets} des sorties d'un job.
+    """
+    os.makedirs(directory)
+    params.update(dict((key, os.path.join(directory, name)) for key, name in OUTPUTS.items()))
+    params.update({'ref': trajectory[0], 'conf': trajectory[1], 'domains': DOMAINS, 'rna': RNA, 'pairs': PAIRS,
+                   'threshold': 10.0, 'duration': 10.0, 'timeline_window': 3})
+    runJob(makeJob(params))
+    contents = dict()
+    for name in OUTPUTS.values():
+        with open(os.path.join(directory, name), 'rb') as f:
+            contents[name] = f.read()
+    return contents
+
+
+@pytest.mark.parametrize("fit", ["none", "global", "domain"])
+def test_workers_same_outputs(trajectory, tmp_path, monkeypatch, fit):
+    # morceaux de 3 conformations: 4 resultats partiels fusionnes
+    monkeypatch.setattr(jobs, "ParallelFrames", functools.partial(ParallelFrames, chunkSize=3))
+    serial = runOutputs(trajectory, str(tmp_path / "serial"), fit=fit)
+    assert runOutputs(trajectory, str(tmp_path / "parallel"), fit=fit, workers=2) == serial
+    assert runOutputs(trajectory, str(tmp_path / "stream"), fit=fit, stream=True) == serial
+    assert runOutputs(trajectory, str(tmp_path / "checkpoint"), fit=fit, workers=2, checkpoint=5) == serial
+
+
+class RecordingPool(ProcessPoolExecutor):
+    """
+    Pool de processus qui mesure les arguments (pickles) de chaque chunk soumis.
+    """
+
+    sizes = []
+
+    def submit(self, fn, *args, **kwargs):
+        RecordingPool.sizes.append(len(pickle.dumps(args)))
+        return super(RecordingPool, self).submit(fn, *args, **kwargs)
+
+
+def test_chunks_without_merged_state(trajectory, tmp_path, monkeypatch):
+    # une conformation par chunk: l'etat fusionne grandirait a chaque soumission
+    monkeypatch.setattr(jobs, "ParallelFrames", functools.partial(ParallelFrames, chunkSize=1))
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", RecordingPool)
+    RecordingPool.sizes = []
+    runOutputs(trajectory, str(tmp_path / "parallel"), workers=2)
+    assert len(RecordingPool.sizes) == NB_FRAMES
+    assert max(RecordingPool.sizes) - min(RecordingPool.sizes) < 16
+
+
+class CountingContacts(ContactAccumulator):
+    """
+    Temps de contact dont les points de controle sont comptes.
+    """
+
+    def reset(self):
+        ContactAccumulator.reset(self)
+        self.checkpoints = 0
+
+    def checkpoint(self):
+        self.checkpoints += 1
+        ContactAccumulator.checkpoint(self)
+
+
+@pytest.mark.parametrize("delay, expected", [(None, NB_FRAMES), (0.0, NB_FRAMES), (3600.0, 0)])
+def test_checkpoint_delay(synthetic, tmp_path, delay, expected):
+    output = str(tmp_path / "contacts.txt")
+    acc = CountingContacts(PAIRS, 10.0, 1.0, 'CM', output)
+    analyseFrames(PDBiterMulti(synthetic[1], PARSING), [acc], checkpoint=1, checkpointDelay=delay)
+    assert acc.checkpoints == expected
+    reference = str(tmp_path / "reference.txt")
+    analyseFrames(PDBiterMulti(synthetic[1], PARSING), [ContactAccumulator(PAIRS, 10.0, 1.0, 'CM', reference)])
+    with open(output) as f, open(reference) as g:
+        assert f.read() == g.read()
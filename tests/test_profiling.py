@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the run timer: the batched work done when the partial results are taken is
+measured in the stage of its accumulator, and the CPU time of the report starts with the timer.
+"""
+
+import time
+
+from ParserPDB import PDBiterMulti, PDBparser
+from RMSD import RMSFAccumulator
+from conftest import DOMAINS, NB_FRAMES, PARSING
+from parallel import analyseFrames
+from profiling import RunTimer
+
+
+def test_partial_in_stage(synthetic, tmp_path):
+    ref, conf = synthetic
+    timer = RunTimer()
+    # lot plus grand que la dynamique: toute la superposition est faite par partial()
+    acc = RMSFAccumulator(PDBparser(ref, PARSING), DOMAINS, 'CM', str(tmp_path / "rmsf.txt"), fit='global',
+                          batchSize=10 * NB_FRAMES)
+    analyseFrames(PDBiterMulti(conf, PARSING), [acc], timer=timer)
+    wall, cpu, calls = timer.stages['rmsf']
+    assert calls == NB_FRAMES + 1
+
+
+def test_cpu_since_begin():
+    start = time.process_time()
+    while time.process_time() - start < 0.2:
+        pass
+    report = RunTimer().report()
+    assert 0.0 <= report['cpu_s'] < 0.1
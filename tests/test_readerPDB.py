@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the reading of a trajectory being written (followBlocks): the file is appended in
+pieces cut anywhere (in a record name, a coordinate or a line ending) while it is followed, and the
+blocks must be those of the complete file. Compressed inputs (gzip, bzip2, xz, detected from their first
+bytes whatever their extension) must parse as the plain file.
+"""
+
+import bz2
+import gzip
+import lzma
+import random
+import time
+
+import numpy as np
+import pytest
+
+import readerPDB
+from ParserPDB import PDBparser, PDBparserFrame, PDBparserMulti, iterFrames
+from conftest import NB_FRAMES, PARSING
+from indexPDB import buildIndex
+from readerPDB import compression, countModels, followBlocks, openInput
+
+COMPRESSORS = {'gzip': gzip.compress, 'bz2': bz2.compress, 'xz': lzma.compress}
+
+
+class Writer(object):
+    """
+    Remplace le module time de readerPDB: chaque attente de followBlocks ecrit le morceau suivant du fichier,
+    puis, quand tout est ecrit, interrompt la lecture (Ctrl-C).
+    """
+
+    def __init__(self, path, pieces):
+        self.path = path
+        self.pieces = list(pieces)
+        open(path, 'wb').close()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, poll):
+        if not self.pieces:
+            raise KeyboardInterrupt
+        with open(self.path, 'ab') as f:
+            f.write(self.pieces.pop(0))
+
+
+def cut(data, seed=2):
+    """
+    :return: Les morceaux de data, coupes a des positions aleatoires et au milieu de chaque MODEL et ENDMDL.
+    """
+    rand = random.Random(seed)
+    cuts = set(rand.sample(range(1, len(data)), 200))
+    for record in (b'MODEL', b'ENDMDL', b'\r\n'):
+        position = data.find(record)
+        while position >= 0:
+            cuts.add(position + 2 if record != b'\r\n' else position + 1)
+            position = data.find(record, position + 1)
+    cuts = sorted(cuts)
+    return [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+
+
+def expected(data, tmp_path, **selection):
+    path = str(tmp_path / "complete.pdb")
+    with open(path, 'wb') as f:
+        f.write(data)
+    index = buildIndex(path)   # blocs bruts du fichier complet (sans END)
+    return list(index.rawBlocks(index.select(**selection)))
+
+
+def follow(data, tmp_path, monkeypatch, **selection):
+    path = str(tmp_path / "growing.pdb")
+    monkeypatch.setattr(readerPDB, "time", Writer(path, cut(data)))
+    return list(followBlocks(path, poll=0.0, **selection))
+
+
+@pytest.mark.parametrize("selection", [{}, {'start': 2, 'stop': 8, 'step': 3}])
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+def test_appended_in_pieces(synthetic, tmp_path, monkeypatch, selection, newline):
+    with open(synthetic[1], 'rb') as f:
+        data = f.read().replace(b"\n", newline)
+    blocks = follow(data, tmp_path, monkeypatch, **selection)
+    assert blocks and blocks == expected(data, tmp_path, **selection)
+
+
+def test_without_endmdl(synthetic, tmp_path, monkeypatch):
+    with open(synthetic[1], 'rb') as f:
+        data = f.read().replace(b"ENDMDL\n", b"").replace(b"END\n", b"")
+    reference = expected(data, tmp_path)
+    # sans ENDMDL ni END, le dernier bloc n'est jamais complet
+    assert follow(data, tmp_path, monkeypatch) == reference[:-1]
+    assert follow(data + b"END\n", tmp_path, monkeypatch) == reference
+
+
+def test_stop_at_end(synthetic, tmp_path, monkeypatch):
+    with open(synthetic[1], 'rb') as f:
+        data = f.read()
+    assert data.endswith(b"ENDMDL\nEND\n")   # enregistrement ecrit par PDBWriter.close
+    data = data[:-len(b"END\n")]
+    writer = Writer(str(tmp_path / "growing.pdb"), cut(data + b"END\n"))
+    writer.pieces.append(b"MODEL       99\n")   # jamais ecrit: la lecture s'arrete a END
+    monkeypatch.setattr(readerPDB, "time", writer)
+    assert list(followBlocks(writer.path, poll=0.0)) == expected(data, tmp_path)
+    assert writer.pieces == [b"MODEL       99\n"]
+
+
+def compress(source, path, kind):
+    with open(source, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data if kind is None else COMPRESSORS[kind](data))
+    return path
+
+
+def assertSameFrames(frames, reference):
+    pairs = list(zip(iterFrames(frames), iterFrames(reference)))
+    assert len(pairs) == len(list(iterFrames(reference)))
+    for (model, conf), (model2, conf2) in pairs:
+        assert model == model2
+        assert conf.sameTopology(conf2)
+        assert np.array_equal(conf.coords, conf2.coords)
+
+
+# l'extension ne compte pas: le format est reconnu a ses premiers octets
+@pytest.mark.parametrize("kind, name", [('gzip', "conf.pdb.gz"), ('bz2', "conf.pdb.bz2"), ('xz', "conf.pdb.xz"),
+                                        ('gzip', "conf.pdb"), ('bz2', "conf.xz"), ('xz', "conf"), (None, "conf.pdb.gz")])
+def test_compressed_input(synthetic, tmp_path, monkeypatch, kind, name):
+    monkeypatch.setattr(readerPDB, "PIGZ", None)   # decompression par les modules de Python
+    path = compress(synthetic[1], str(tmp_path / name), kind)
+    assert compression(path) == kind
+    assert countModels(path) == NB_FRAMES
+    assertSameFrames(PDBparserMulti(path, PARSING), PDBparserMulti(synthetic[1], PARSING))
+    model, conf = PDBparserFrame(path, 4, PARSING)
+    model2, conf2 = PDBparserFrame(synthetic[1], 4, PARSING)
+    assert model == model2 and np.array_equal(conf.coords, conf2.coords)
+
+    ref = compress(synthetic[0], str(tmp_path / ("ref_" + name)), kind)
+    assertSameFrames({'0': PDBparser(ref, PARSING)}, {'0': PDBparser(synthetic[0], PARSING)})
+
+
+@pytest.mark.skipif(readerPDB.PIGZ is None, reason="pigz is not installed")
+def test_pigz(synthetic, tmp_path):
+    path = compress(synthetic[1], str(tmp_path / "conf.pdb.gz"), 'gzip')
+    with openInput(path) as f:
+        assert isinstance(f, readerPDB._PipeReader)
+    assertSameFrames(PDBparserMulti(path, PARSING), PDBparserMulti(synthetic[1], PARSING))
+    model, conf = PDBparserFrame(path, 0, PARSING)   # lecture interrompue: pigz est arrete
+    assert np.array_equal(conf.coords, PDBparserFrame(synthetic[1], 0, PARSING)[1].coords)
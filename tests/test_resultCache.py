@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the result cache: a rerun with the same parameters, or with a new threshold
+served by the cached residue pairs, gives the outputs of a run without cache; the residue pairs
+recorded during a pass are bounded by their own budget, and the pair entry read by a run is not kept
+once the run is over. Entries are read back without pickle.
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import resultCache
+from ParserPDB import PDBparser, PDBparserMulti
+from RMSD import RMSDAccumulator, RMSFAccumulator
+from computeInterface import ContactAccumulator, InterfaceAccumulator
+from conftest import DOMAINS, PAIRS, PARSING, RNA
+from contactMap import ContactMapAccumulator
+from jobs import makeJob, runJob
+from resultCache import PairCacheAccumulator, ResultCache, analyseCached
+
+OUTPUTS = {'rmsd_output': "rmsd.txt", 'rmsf_output': "rmsf.txt", 'freq_output': "freq.txt",
+           'contact_output': "contacts.txt", 'timeline_summary': "timeline.txt", 'contactmap_summary': "map.txt"}
+
+
+def runOutputs(trajectory, directory, **params):
+    """
+    :return: Le contenu {fichier: texte} des sorties d'un job.
+    """
+    os.makedirs(directory)
+    params.update(dict((key, os.path.join(directory, name)) for key, name in OUTPUTS.items()))
+    params.update({'ref': trajectory[0], 'conf': trajectory[1], 'domains': DOMAINS, 'rna': RNA, 'pairs': PAIRS,
+                   'duration': 10.0})
+    runJob(makeJob(params))
+    contents = dict()
+    for name in OUTPUTS.values():
+        with open(os.path.join(directory, name)) as f:
+            contents[name] = f.read()
+    return contents
+
+
+def noSearch(*args, **kwargs):
+    raise AssertionError("The residue pairs should be read from the cache")
+
+
+@pytest.mark.parametrize("mode", ["CM", "atom"])
+def test_rerun_new_threshold(trajectory, tmp_path, monkeypatch, mode):
+    cache = str(tmp_path / "cache")
+    cold = runOutputs(trajectory, str(tmp_path / "first"), result_cache=cache, threshold=8.0, dist_mode=mode)
+    assert cold == runOutputs(trajectory, str(tmp_path / "cold"), threshold=8.0, dist_mode=mode)
+    assert runOutputs(trajectory, str(tmp_path / "same"), result_cache=cache, threshold=8.0, dist_mode=mode) == cold
+
+    expected = runOutputs(trajectory, str(tmp_path / "cold10"), threshold=10.0, dist_mode=mode)
+    with monkeypatch.context() as patch:   # seuil inferieur au rayon: couples relus, aucune recherche de voisins
+        patch.setattr(resultCache, "residuePairs", noSearch)
+        assert runOutputs(trajectory, str(tmp_path / "rerun10"), result_cache=cache, threshold=10.0,
+                          dist_mode=mode) == expected
+    # seuil superieur au rayon: couples recalcules
+    assert (runOutputs(trajectory, str(tmp_path / "rerun13"), result_cache=cache, threshold=13.0, dist_mode=mode)
+            == runOutputs(trajectory, str(tmp_path / "cold13"), threshold=13.0, dist_mode=mode))
+
+
+def contacts(threshold, output):
+    return [ContactAccumulator(PAIRS, threshold, 1.0, 'CM', output)]
+
+
+def test_pair_entry_released(synthetic, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    load = lambda: PDBparserMulti(synthetic[1], PARSING)
+    analyseCached(cache, ('conf',), load, contacts(8.0, str(tmp_path / "c1.txt")))
+    analyseCached(cache, ('conf',), load, contacts(9.0, str(tmp_path / "c2.txt")))   # couples relus dans le cache
+    assert resultCache._loaded == {}
+
+
+def test_record_budget(synthetic, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert PairCacheAccumulator(cache, ('conf',)).budget == resultCache.RECORD_BUDGET
+    load = lambda: PDBparserMulti(synthetic[1], PARSING)
+    small = PairCacheAccumulator(cache, ('conf',), budget=1024)
+    resultCache.analyseFrames(load(), [small] + contacts(8.0, str(tmp_path / "c.txt")))
+    assert small.overflow and small.recorded == {}
+    assert not os.path.exists(small.path)
+
+
+def cachedAccumulators(ref, directory):
+    return [RMSDAccumulator(ref, DOMAINS, 'CM', os.path.join(directory, "rmsd.txt"), 'global'),
+            RMSFAccumulator(ref, DOMAINS, 'CM', os.path.join(directory, "rmsf.txt")),
+            InterfaceAccumulator(DOMAINS, RNA, 10.0, 'CM', os.path.join(directory, "freq.txt")),
+            ContactAccumulator(PAIRS, 10.0, 1.0, 'CM', os.path.join(directory, "contacts.txt")),
+            ContactMapAccumulator(10.0, 'CM', PARSING, summary=os.path.join(directory, "map.txt"))]
+
+
+def noFrames():
+    raise AssertionError("The results should be read from the cache")
+
+
+def test_results_read_back(synthetic, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    ref = PDBparser(synthetic[0], PARSING)
+    load = lambda: PDBparserMulti(synthetic[1], PARSING)
+    outputs = []
+    for name, loadFrames in (("first", load), ("rerun", noFrames)):   # relance: aucune conformation lue
+        directory = str(tmp_path / name)
+        os.makedirs(directory)
+        analyseCached(cache, ('conf',), loadFrames, cachedAccumulators(ref, directory))
+        contents = dict()
+        for output in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, output)) as f:
+                contents[output] = f.read()
+        outputs.append(contents)
+    assert len(outputs[0]) == 5 and outputs[1] == outputs[0]
+
+
+class Payload(object):
+    """
+    Objet dont la lecture par pickle cree un fichier.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return open, (self.path, 'w')
+
+
+def test_entries_not_unpickled(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = cache.key('result', 'x')
+    assert cache.put(key, {'models': ["1", "2"], 'pairs': {('A1', 'B', 'CM'): (12.0, np.arange(3), np.float64(2.5))}})
+    value = cache.get(key)
+    assert value['pairs'][('A1', 'B', 'CM')][0] == 12.0 and np.array_equal(value['pairs'][('A1', 'B', 'CM')][1],
+                                                                          np.arange(3))
+    assert os.stat(cache.path(key)).st_mode & 0o077 == 0   # entree reservee a son proprietaire
+    marker = str(tmp_path / "executed")
+    with open(cache.path(key), 'wb') as f:   # entree remplacee par un pickle
+        pickle.dump(Payload(marker), f)
+    assert cache.get(key) is None and not os.path.exists(marker)
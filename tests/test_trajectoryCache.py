@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Tests of the binary trajectory cache: conformations read from the cache equal the parsed
+ones, and the cache is no longer used once the pdb file is touched or modified, or for other domains
+or another selection of the atoms.
+"""
+
+import os
+
+import numpy as np
+
+from ParserPDB import PDBconvert, PDBiterMulti
+from conftest import DOMAINS, NB_FRAMES, PARSING
+from selectionPDB import AtomSelection
+from trajectoryCache import cachePath, loadCache
+
+
+def touch(path, seconds=10):
+    """
+    Rend path plus recent que le cache (sans changer son contenu).
+    """
+    coords = os.stat(os.path.join(cachePath(path), "coords.npy"))
+    os.utime(path, ns=(coords.st_atime_ns, coords.st_mtime_ns + seconds * 10 ** 9))
+
+
+def sameFrames(frames, other):
+    frames, other = list(frames), list(other)
+    return (len(frames) == len(other)
+            and all(m1 == m2 and c1.sameTopology(c2) and np.array_equal(c1.coords, c2.coords)
+                    for (m1, c1), (m2, c2) in zip(frames, other)))
+
+
+def test_cached_frames(trajectory):
+    conf = trajectory[1]
+    PDBconvert(conf, PARSING)
+    cache = loadCache(conf, PARSING)
+    assert cache is not None and len(cache) == NB_FRAMES
+    assert sameFrames(PDBiterMulti(conf, PARSING), PDBiterMulti(conf, PARSING, useCache=False))
+    assert loadCache(conf, DOMAINS) is not None        # domaines inclus dans ceux du cache
+    assert loadCache(conf, PARSING + ["C"]) is None    # domaine absent du cache
+    assert loadCache(conf, PARSING, AtomSelection(field="chain")) is None
+
+
+def test_touched_pdb(trajectory):
+    conf = trajectory[1]
+    PDBconvert(conf, PARSING)
+    touch(conf)
+    assert loadCache(conf, PARSING) is None
+
+
+def test_modified_pdb(trajectory):
+    conf = trajectory[1]
+    PDBconvert(conf, PARSING)
+    with open(conf) as f:
+        lines = f.read().splitlines(True)
+    atom = lines.index(next(line for line in lines if line.startswith("ATOM")))
+    lines[atom] = lines[atom][:30] + "%8.3f" % 123.456 + lines[atom][38:]
+    with open(conf, "w") as f:
+        f.write("".join(lines))
+    touch(conf)
+    frames = list(PDBiterMulti(conf, PARSING))
+    assert frames[0][1].coords[0, 0] == 123.456
+    assert sameFrames(frames, PDBiterMulti(conf, PARSING, useCache=False))
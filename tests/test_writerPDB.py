@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Round trip of the PDB writer (PDBWriter, FrameFormatter): the written frames, plain or
+gzip-compressed, must parse back to the same coordinates, with the B-factors of their residues and the
+fixed columns of the ATOM records.
+"""
+
+import numpy as np
+import pytest
+
+from ParserPDB import PDBparserConf, PDBparserMulti, iterFrames
+from Structure import Structure
+from conftest import PARSING
+from readerPDB import compression, openInput
+from selectionPDB import AtomSelection
+from writerPDB import PDBWriter
+
+
+def readLines(path):
+    with openInput(path) as f:
+        return list(f)
+
+
+def writeFrames(frames, path, models=None):
+    """
+    Ecrit les conformations avec des B-factors differents pour chaque residu et chaque conformation.
+    :return: Les B-factors ecrits, {modele: tableau des B-factors des residus}.
+    """
+    rand = np.random.RandomState(4)
+    written = {}
+    with PDBWriter(path, PARSING, models) as writer:
+        for model, conf in iterFrames(frames):
+            conf.resBfactors[:] = rand.randint(0, 10000, conf.nResidues) / 100.0
+            if writer.write(model, conf):
+                written[model] = conf.resBfactors.copy()
+    return written
+
+
+@pytest.mark.parametrize("name", ["frames.pdb", "frames.pdb.gz"])
+def test_round_trip(synthetic, tmp_path, name):
+    frames = PDBparserMulti(synthetic[1], PARSING)
+    path = str(tmp_path / name)
+    bfactors = writeFrames(frames, path)
+    assert compression(path) == ("gzip" if name.endswith(".gz") else None)
+
+    written = PDBparserMulti(path, PARSING)
+    pairs = list(zip(iterFrames(frames), iterFrames(written)))
+    assert len(pairs) == len(bfactors) > 1
+    for (model, conf), (model2, back) in pairs:
+        assert model2 == model
+        assert back.sameTopology(conf)
+        assert np.array_equal(back.coords, conf.coords)   # coordonnees lues avec 3 decimales
+
+    lines = readLines(path)
+    assert lines[-2:] == ["ENDMDL\n", "END\n"]
+    atoms = [line for line in lines if line.startswith("ATOM")]
+    assert set(len(line) for line in atoms) == {79}   # 78 colonnes et le saut de ligne
+    assert set(line[54:60] for line in atoms) == {"  1.00"}
+    model = None
+    values = {}
+    for line in lines:
+        if line.startswith("MODEL"):
+            model = line[6:].strip()
+            values[model] = []
+        elif line.startswith("ATOM"):
+            values[model].append(float(line[60:66]))
+    for model, conf in iterFrames(frames):
+        assert np.array_equal(values[model], bfactors[model][conf.atomRes])
+
+
+def test_selected_models(synthetic, tmp_path):
+    path = str(tmp_path / "frames.pdb")
+    bfactors = writeFrames(PDBparserMulti(synthetic[1], PARSING), path, models=[2, "5"])
+    assert sorted(bfactors) == ["2", "5"]
+    assert [line for line in readLines(path) if line.startswith("MODEL")] == ["MODEL        2\n", "MODEL        5\n"]
+
+
+def test_columns(tmp_path):
+    # noms d'atomes de 4 caracteres, elements de 2 lettres, HETATM, positions alternatives et coordonnees extremes
+    conf = Structure([[-999.999, 9999.999, 0.0], [1.5, -2.25, 3.125], [10.0, 20.0, 30.0], [-0.5, 0.5, 7.0]],
+                     ["A", "A", "A", "B"], ["1", "1", "1", "1000"], ["CA", "HD21", "N", "ZN"],
+                     ["ASN", "ASN", "ASN", "ZN"], ["1", "2", "99999", "3"],
+                     elements=["C", "H", "N", "ZN"], altLocs=["", "B", "", ""], hetero=[False, False, False, True])
+    conf.resBfactors[:] = [12.5, 99.99]
+    path = str(tmp_path / "columns.pdb")
+    with PDBWriter(path, ["A", "B"]) as writer:
+        writer.write(1, conf)
+    lines = readLines(path)
+    assert lines == [
+        "MODEL        1\n",
+        "ATOM      1  CA  ASN     1    -999.9999999.999   0.000  1.00 12.50      A    C\n",
+        "ATOM      2 HD21BASN     1       1.500  -2.250   3.125  1.00 12.50      A    H\n",
+        "ATOM  99999  N   ASN     1      10.000  20.000  30.000  1.00 12.50      A    N\n",
+        "HETATM    3 ZN    ZN  1000      -0.500   0.500   7.000  1.00 99.99      B   ZN\n",
+        "ENDMDL\n",
+        "END\n",
+    ]
+    back = PDBparserConf(lines, ["A", "B"], selection=AtomSelection(hetero="all"))
+    assert np.array_equal(back.coords, conf.coords)
+    assert back.atomNames.tolist() == conf.atomNames.tolist()
+    assert back.elements.tolist() == conf.elements.tolist()
+    assert back.hetero.tolist() == conf.hetero.tolist()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Trajectory container for conformations sharing one topology: the topology (names,
+residues, serials, selections) is validated and stored once, and the conformations only as an
+(n_frames, n_atoms, 3) coordinate block, a conformation being a slice of this block.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from Structure import centersOfMass
+
+
+class Trajectory(Mapping):
+    """
+    Conformations d'une dynamique ayant toutes la meme topologie, utilisable comme le dictionnaire
+    {modele: Structure} renvoye auparavant par PDBparserMulti. Chaque conformation lue est une Structure dont les
+    coordonnees (et les B-factors des residus) sont des vues sur les tableaux de la trajectoire.
+    """
+
+    def __init__(self, topology, capacity=16, dtype=None):
+        """
+        :param topology: Structure dont la topologie est partagee par toutes les conformations.
+        :param capacity: Nombre de conformations pour lequel la memoire est reservee au depart.
+        :param dtype: Type des coordonnees (par defaut celui de topology).
+        """
+        self.topology = topology
+        self.models = []
+        self._rank = dict()   # modele -> rang de la conformation
+        self._coords = np.empty((max(capacity, 1), topology.nAtoms, 3),
+                                dtype=topology.coords.dtype if dtype is None else dtype)
+        self._bfactors = np.zeros((max(capacity, 1), topology.nResidues))
+
+    @classmethod
+    def fromFrames(cls, frames, reference=None, capacity=16):
+        """
+        Construit la trajectoire d'une suite de conformations.
+        :param frames: Iterable de couples (modele, Structure), par exemple PDBiterMulti.
+        :param reference: Structure de reference (PDBparser), optionnelle: si la premiere conformation a la meme
+        topologie, la reference fournit la topologie (et ses selections deja calculees) a toutes les conformations.
+        :param capacity: Nombre de conformations attendues, s'il est connu.
+        :return: La Trajectory, ou None s'il n'y a aucune conformation.
+        :raise ValueError: Si une conformation n'a pas la meme topologie que la premiere.
+        """
+        trajectory = None
+        for model, conf in frames:
+            if trajectory is None:
+                trajectory = cls.start(conf, reference, capacity)
+            trajectory.append(model, conf)
+        return trajectory
+
+    @classmethod
+    def start(cls, conf, reference=None, capacity=16):
+        """
+        :return: Une Trajectory vide ayant la topologie de conf (celle de reference si elle est identique).
+        """
+        compatible = reference is not None and reference.massWeighted == conf.massWeighted
+        topology = reference if compatible and _sameAtoms(reference, conf) else conf
+        return cls(topology, capacity, conf.coords.dtype)
+
+    @property
+    def coords(self):
+        """
+        :return: Le tableau (n_frames, n_atoms, 3) des coordonnees de toutes les conformations.
+        """
+        return self._coords[:len(self.models)]
+
+    @property
+    def bfactors(self):
+        """
+        :return: Le tableau (n_frames, n_residues) des B-factors des residus de chaque conformation.
+        """
+        return self._bfactors[:len(self.models)]
+
+    def _reserve(self, nFrames):
+        """
+        Agrandit (en doublant la capacite) les tableaux pour contenir nFrames conformations.
+        """
+        if nFrames > len(self._coords):
+            size = max(nFrames, 2 * len(self._coords))
+            coords = np.empty((size,) + self._coords.shape[1:], dtype=self._coords.dtype)
+            coords[:len(self.models)] = self.coords
+            bfactors = np.zeros((size, self._bfactors.shape[1]))
+            bfactors[:len(self.models)] = self.bfactors
+            self._coords, self._bfactors = coords, bfactors
+
+    def accepts(self, conf):
+        """
+        :return: True si conf a la topologie de la trajectoire (numeros des atomes et elements compris).
+        """
+        return _sameAtoms(self.topology, conf)
+
+    def compact(self):
+        """
+        Libere la memoire reservee au-dela des conformations presentes.
+        """
+        if len(self._coords) > max(len(self), 1):
+            self._coords = self.coords.copy()
+            self._bfactors = self.bfactors.copy()
+
+    def append(self, model, conf):
+        """
+        Ajoute une conformation (un modele deja present est remplace, comme dans un dictionnaire).
+        :param model: Numero du modele.
+        :param conf: Structure de la conformation, de meme topologie que la trajectoire.
+        :raise ValueError: Si la topologie de conf est differente.
+        """
+        if not self.accepts(conf):
+            raise ValueError("Model %s does not have the same atoms as the trajectory" % model)
+        rank = self._rank.get(model)
+        if rank is None:
+            rank = len(self.models)
+            self._reserve(rank + 1)
+            self._rank[model] = rank
+            self.models.append(model)
+        self._coords[rank] = conf.coords
+        self._bfactors[rank] = conf.resBfactors
+
+    def frame(self, rank):
+        """
+        :return: La Structure de la conformation de rang 'rank' (coordonnees et B-factors non copies).
+        """
+        conf = self.topology.withCoords(self._coords[rank])
+        conf.resBfactors = self._bfactors[rank]
+        return conf
+
+    def frames(self, ranks=None):
+        """
+        :param ranks: Rangs des conformations (par defaut toutes).
+        :return: Generateur de couples (modele, Structure).
+        """
+        for i in range(len(self)) if ranks is None else ranks:
+            yield self.models[i], self.frame(i)
+
+    def atoms(self, chains=None, name=None):
+        """
+        Selection d'atomes, calculee une seule fois pour la topologie (voir Structure.selection).
+        :param chains: Domaines selectionnes (par defaut tous).
+        :param name: Nom des atomes selectionnes (par exemple 'CA', sans les ions HETATM), par defaut tous.
+        :return: Le tableau des indices des atomes.
+        """
+        top = self.topology
+        chains = tuple(top.chainOffsets) if chains is None else tuple(chains)
+
+        def build():
+            keep = np.isin(top.chainIds, chains)
+            if name is not None:
+                keep &= (top.atomNames == name) & ~top.hetero
+            indices = np.flatnonzero(keep)
+            indices.flags.writeable = False
+            return indices
+        return top.selection(('atoms', chains, name), build)
+
+    def residues(self, chains=None):
+        """
+        :param chains: Domaines selectionnes (par defaut tous).
+        :return: Le tableau des indices des residus de ces domaines, calcule une seule fois pour la topologie.
+        """
+        top = self.topology
+        chains = tuple(top.chainOffsets) if chains is None else tuple(chains)
+
+        def build():
+            indices = np.flatnonzero(np.isin(top.resChain, chains))
+            indices.flags.writeable = False
+            return indices
+        return top.selection(('residues', chains), build)
+
+    def points(self, atoms, ranks=slice(None)):
+        """
+        :param atoms: Indices des atomes (voir atoms).
+        :param ranks: Rangs des conformations (slice ou tableau d'indices).
+        :return: Le tableau (n_frames, n_selected, 3) de leurs coordonnees.
+        """
+        return self.coords[ranks][:, atoms]
+
+    def centers(self, ranks=slice(None), massWeighted=None):
+        """
+        :param ranks: Rangs des conformations (slice ou tableau d'indices).
+        :param massWeighted: Ponderation par la masse des atomes (par defaut celle de la topologie).
+        :return: Le tableau (n_frames, n_residues, 3) des centres de masse des residus, en une seule operation.
+        """
+        if massWeighted is None:
+            massWeighted = self.topology.massWeighted
+        weights = self.topology.masses() if massWeighted else None
+        return centersOfMass(self.coords[ranks], self.topology.resOffsets, weights)
+
+    def __getitem__(self, model):
+        return self.frame(self._rank[model])
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, model):
+        return model in self._rank
+
+
+def _sameAtoms(topology, conf):
+    """
+    :return: True si les 2 structures ont la meme topologie, numeros (serial) et elements des atomes compris.
+    """
+    return (topology.sameTopology(conf)
+            and (topology.serials is conf.serials or np.array_equal(topology.serials, conf.serials))
+            and (topology.elements is conf.elements or np.array_equal(topology.elements, conf.elements)))
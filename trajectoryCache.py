@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Binary cache of a parsed trajectory, so that repeated analyses skip the PDB text parsing.
+The cache is a directory next to the PDB file holding a topology header (topology.npz), a raw
+memory-mappable coordinate block (coords.npy, shape (n_frames, n_atoms, 3)) and the precomputed
+centers of mass of the residues (centers.npy, shape (n_frames, n_residues, 3)).
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from Structure import Structure, centersOfMass
+from selectionPDB import DEFAULT_SELECTION
+
+CACHE_SUFFIX = ".cache"
+
+
+class CachedTrajectory(object):
+    """
+    Trajectoire lue depuis le cache: topologie commune et coordonnees projetees en memoire (np.memmap).
+    """
+
+    def __init__(self, cacheDir, list_dom):
+        """
+        :param cacheDir: Repertoire du cache.
+        :param list_dom: Liste des domaines a garder (doit etre incluse dans les domaines du cache).
+        """
+        with np.load(os.path.join(cacheDir, "topology.npz")) as top:
+            self.models = top['models']
+            self.domains = top['domains']
+            self.massWeighted = bool(top['massWeighted'])
+            chainIds, resIds, atomNames, resNames, serials, elements, resChain = (
+                top['chainIds'], top['resIds'], top['atomNames'], top['resNames'], top['serials'], top['elements'],
+                top['resChain'])
+            altLocs = top['altLocs'] if 'altLocs' in top else np.full(len(chainIds), "", dtype='<U1')   # caches anterieurs
+            hetero = top['hetero'] if 'hetero' in top else np.zeros(len(chainIds), dtype=bool)
+        self.coords = np.load(os.path.join(cacheDir, "coords.npy"), mmap_mode='r')
+        self.centers = np.load(os.path.join(cacheDir, "centers.npy"), mmap_mode='r')
+
+        keep = np.isin(chainIds, list(list_dom))
+        self.atoms = slice(None) if keep.all() else np.flatnonzero(keep)
+        keepRes = np.isin(resChain, list(list_dom))
+        self.residues = slice(None) if keepRes.all() else np.flatnonzero(keepRes)
+        first = self.coords[0][self.atoms] if len(self.coords) else np.zeros((0, 3))
+        self.topology = Structure(first, chainIds[keep], resIds[keep], atomNames[keep], resNames[keep],
+                                  serials[keep], self.coords.dtype, elements[keep], altLocs=altLocs[keep],
+                                  hetero=hetero[keep])
+
+    def __len__(self):
+        return len(self.models)
+
+    def select(self, start=0, stop=None, step=1):
+        """
+        :return: Les rangs des conformations selectionnees par start:stop:step.
+        """
+        if step < 1:
+            raise ValueError("step must be a positive integer: %s" % step)
+        return range(len(self))[start:stop:step]
+
+    def frames(self, ranks, dtype=np.float64, massWeighted=False):
+        """
+        :param ranks: Rangs des conformations a lire.
+        :param dtype: Type des coordonnees renvoyees.
+        :param massWeighted: Ponderation des centres de masse des residus; la table precalculee du cache
+        n'est utilisee que si elle a ete calculee avec la meme ponderation.
+        :return: Generateur de couples (modele, Structure), les coordonnees etant lues dans le fichier projete.
+        """
+        for i in ranks:
+            coords = self.coords[i][self.atoms]
+            if coords.dtype != dtype:
+                coords = coords.astype(dtype)
+            centers = self.centers[i][self.residues] if massWeighted == self.massWeighted else None
+            conf = self.topology.withCoords(coords, centers)
+            conf.massWeighted = massWeighted
+            yield str(self.models[i]), conf
+
+
+def cachePath(pdbFile):
+    """
+    :return: Le repertoire du cache associe a un fichier pdb.
+    """
+    return pdbFile + CACHE_SUFFIX
+
+
+def loadCache(pdbFile, list_dom, selection=None):
+    """
+    Ouvre le cache d'un fichier pdb s'il est utilisable: plus recent que le fichier pdb, contenant tous les domaines
+    demandes et ecrit avec la meme selection des atomes.
+    :param pdbFile: Fichier pdb.
+    :param list_dom: Liste des domaines a traiter.
+    :param selection: Regles de selection des atomes (selectionPDB.AtomSelection, par defaut DEFAULT_SELECTION).
+    :return: Un CachedTrajectory, ou None si le cache est absent ou perime.
+    """
+    cacheDir = cachePath(pdbFile)
+    coordsFile = os.path.join(cacheDir, "coords.npy")
+    topologyFile = os.path.join(cacheDir, "topology.npz")
+    try:
+        if os.path.getmtime(coordsFile) < os.path.getmtime(pdbFile):
+            return None
+        with np.load(topologyFile) as top:
+            if not set(list_dom) <= set(top['domains'].tolist()):
+                return None
+            written = str(top['selection']) if 'selection' in top else DEFAULT_SELECTION.key()   # caches anterieurs
+            if written != (selection or DEFAULT_SELECTION).key():
+                return None
+    except (OSError, KeyError, ValueError):
+        return None
+    return CachedTrajectory(cacheDir, list_dom)
+
+
+def writeCache(pdbFile, frames, nbFrames, list_dom, dtype=np.float64, massWeighted=False, batchSize=256,
+               selection=None):
+    """
+    Ecrit le cache binaire d'une trajectoire. Toutes les conformations doivent avoir la meme topologie.
+    :param pdbFile: Fichier pdb source (le cache est ecrit a cote).
+    :param frames: Iterable de couples (modele, Structure), dans l'ordre du fichier.
+    :param nbFrames: Nombre de conformations.
+    :param list_dom: Liste des domaines parses.
+    :param dtype: Type des coordonnees stockees.
+    :param massWeighted: Ponderation des centres de masse des residus precalcules (centers.npy).
+    :param batchSize: Nombre de conformations dont les centres de masse sont calcules en une seule operation.
+    :param selection: Regles de selection des atomes avec lesquelles les conformations ont ete parsees.
+    :return: Le repertoire du cache.
+    """
+    cacheDir = cachePath(pdbFile)
+    tmpDir = tempfile.mkdtemp(prefix=os.path.basename(cacheDir) + ".", dir=os.path.dirname(os.path.abspath(cacheDir)))
+    try:
+        topology = None
+        coords = None
+        models = []
+        for rank, (model, conf) in enumerate(frames):
+            if topology is None:
+                topology = conf
+                coords = np.lib.format.open_memmap(os.path.join(tmpDir, "coords.npy"), mode='w+', dtype=dtype,
+                                                   shape=(nbFrames, conf.nAtoms, 3))
+            elif not topology.sameTopology(conf):
+                raise ValueError("Model %s does not have the same atoms as model %s: the trajectory cannot be cached"
+                                 % (model, models[0]))
+            coords[rank] = conf.coords
+            models.append(model)
+
+        if len(models) != nbFrames:
+            raise ValueError("Expected %d models, read %d" % (nbFrames, len(models)))
+        if topology is None:
+            raise ValueError("No model to cache in %s" % pdbFile)
+        coords.flush()
+
+        # centres de masse des residus de toutes les conformations, par lots de batchSize conformations
+        centers = np.lib.format.open_memmap(os.path.join(tmpDir, "centers.npy"), mode='w+', dtype=np.float64,
+                                            shape=(nbFrames, topology.nResidues, 3))
+        weights = topology.masses() if massWeighted else None
+        for i in range(0, nbFrames, batchSize):
+            centers[i:i + batchSize] = centersOfMass(coords[i:i + batchSize], topology.resOffsets, weights)
+        centers.flush()
+        del coords, centers
+
+        np.savez(os.path.join(tmpDir, "topology.npz"), models=np.asarray(models, dtype=str),
+                 domains=np.asarray(list(list_dom), dtype=str), chainIds=topology.chainIds, resIds=topology.resIds,
+                 atomNames=topology.atomNames, resNames=topology.resNames, serials=topology.serials,
+                 elements=topology.elements, resChain=topology.resChain, massWeighted=massWeighted,
+                 altLocs=topology.altLocs, hetero=topology.hetero, selection=(selection or DEFAULT_SELECTION).key())
+
+        if os.path.isdir(cacheDir):
+            shutil.rmtree(cacheDir)
+        os.rename(tmpDir, cacheDir)
+    except BaseException:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+
+    return cacheDir
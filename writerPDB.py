@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding : utf8 -*-
+
+"""
+Authors: Maud De Tollenaere & Severine Liegeois
+Contact: de.tollenaere.maud@gmail.com & sliegeois@yahoo.fr
+Date: 02/05/2017
+Description: Fast PDB writer: the fixed columns of the ATOM records are formatted once per topology
+into a line template, and each conformation is formatted with a single operation on its coordinate
+and B-factor arrays, then written through a large buffer (optionally gzip-compressed).
+"""
+
+import gzip
+
+import numpy as np
+
+BUFFER_SIZE = 1 << 20
+
+# champs variables d'une ligne ATOM: x, y, z (colonnes 31-54), occupation (55-60) et B-factor (61-66)
+_FIELDS = "%8.3f%8.3f%8.3f%6.2f%6.2f"
+
+# enregistrement qui termine le fichier (la lecture en suivi, readerPDB.followBlocks, s'y arrete)
+END_RECORD = "END\n"
+
+
+def openOutput(output, compress=None, bufferSize=BUFFER_SIZE):
+    """
+    Ouvre un fichier pdb de sortie en ecriture, avec un tampon de bufferSize octets.
+    :param output: Nom du fichier.
+    :param compress: True pour compresser (gzip), False sinon; par defaut selon l'extension .gz.
+    :return: Le fichier ouvert (mode texte).
+    """
+    if compress is None:
+        compress = output.endswith(".gz")
+    if compress:
+        return gzip.open(output, "wt", compresslevel=6)
+    return open(output, "w", buffering=bufferSize)
+
+
+def atomField(name, element):
+    """
+    :return: Le nom de l'atome dans les colonnes 13-16: les noms de moins de 4 caracteres des elements
+    d'une seule lettre commencent en colonne 14 (' CA ').
+    """
+    if len(name) >= 4 or len(element) == 2:
+        return name[:4].ljust(4)
+    return " " + name.ljust(3)
+
+
+class FrameFormatter(object):
+    """
+    Mise en forme des conformations d'une Structure en blocs MODEL ... ENDMDL.
+    Le gabarit des lignes ATOM est calcule pour la premiere conformation et reutilise tant que la topologie ne change pas.
+    """
+
+    def __init__(self, domains):
+        """
+        :param domains: Liste des domaines a ecrire, dans l'ordre.
+        """
+        self.domains = list(domains)
+        self._topology = None
+
+    def _prepare(self, conf):
+        """
+        Calcule le gabarit des lignes ATOM ou HETATM (colonnes fixes) des atomes des domaines ecrits.
+        """
+        allAtoms = np.arange(conf.nAtoms)
+        self._atoms = np.concatenate([allAtoms[conf.chainAtoms(dom)] for dom in self.domains] + [allAtoms[:0]])
+        self._atomRes = conf.atomRes[self._atoms]
+
+        lines = []
+        for i in self._atoms.tolist():
+            element = conf.elements[i]
+            prefix = "%-6s%5s %s%1s%3s  %4s    " % ("HETATM" if conf.hetero[i] else "ATOM", conf.serials[i][-5:],
+                                                  atomField(conf.atomNames[i], element), conf.altLocs[i],
+                                                  conf.resNames[i], conf.resIds[i])
+            suffix = "      %-4s%2s\n" % (conf.chainIds[i], element)
+            lines.append(prefix.replace("%", "%%") + _FIELDS + suffix.replace("%", "%%"))
+        self._template = "".join(lines)
+        self._topology = conf
+
+    def format(self, model, conf):
+        """
+        :param model: Numero du modele.
+        :param conf: Structure de la conformation (les B-factors sont ceux de ses residus).
+        :return: Le bloc MODEL ... ENDMDL de la conformation.
+        """
+        if self._topology is None or (conf is not self._topology and not conf.sameTopology(self._topology)):
+            self._prepare(conf)
+        values = np.empty((len(self._atoms), 5))
+        values[:, 0:3] = conf.coords[self._atoms]
+        values[:, 3] = 1.00
+        values[:, 4] = conf.resBfactors[self._atomRes]
+        return "MODEL     %4s\n" % model + self._template % tuple(values.ravel().tolist()) + "ENDMDL\n"
+
+
+class PDBWriter(object):
+    """
+    Ecriture d'une dynamique (eventuellement d'une selection de ses conformations) dans un fichier pdb.
+    """
+
+    def __init__(self, output, domains, models=None, compress=None, bufferSize=BUFFER_SIZE):
+        """
+        :param output: Fichier pdb de sortie (compresse si son extension est .gz, voir openOutput).
+        :param domains: Liste des domaines a ecrire, dans l'ordre.
+        :param models: Numeros des modeles a ecrire (par defaut tous).
+        :param compress, bufferSize: Voir openOutput.
+        """
+        self.formatter = FrameFormatter(domains)
+        self.models = None if models is None else set(str(model) for model in models)
+        self.fout = openOutput(output, compress, bufferSize)
+
+    def write(self, model, conf):
+        """
+        Ecrit une conformation si elle fait partie des modeles selectionnes.
+        :return: True si la conformation a ete ecrite.
+        """
+        if self.models is not None and str(model) not in self.models:
+            return False
+        self.fout.write(self.formatter.format(model, conf))
+        return True
+
+    def close(self):
+        """
+        Termine le fichier par l'enregistrement END et le ferme.
+        """
+        try:
+            self.fout.write(END_RECORD)
+        finally:
+            self.fout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()